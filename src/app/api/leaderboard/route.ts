@@ -6,102 +6,141 @@ import path from 'path';
 const DONATION_GOAL_STARS = 50000;
 const STARS_PER_DOLLAR = 50;
 
-interface Donor {
+interface LeaderboardEntry {
   id: number;
   name: string;
-  username: string | null;
-  total_stars: number;
-  total_usd: number;
-  donation_count: number;
-  first_donation: string;
-  last_donation: string;
-  photo_url?: string;
+  username: string;
+  amount: number;
+  rank: number;
+  photoUrl?: string | null;
 }
 
-interface DonationsData {
-  donors: Record<string, Donor>;
+interface LeaderboardStats {
   total_stars: number;
   total_usd: number;
-  transactions: unknown[];
-  last_milestone?: number;
+  total_donors: number;
+}
+
+type Period = 'week' | 'month';
+
+// Current bucket of a time window; starts_at / ends_at are epoch seconds
+interface PeriodSnapshot {
+  bucket: string;
+  starts_at: number;
+  ends_at: number;
+  stats: LeaderboardStats;
+  leaderboard: LeaderboardEntry[];
+}
+
+// Published by the bot (donations.DonationLedger) after every donation:
+// totals and the top donors only
+interface LeaderboardSnapshot {
+  log_seq: number;
+  generated_at: string;
+  stats: LeaderboardStats;
+  leaderboard: LeaderboardEntry[];
+  periods?: Partial<Record<Period, PeriodSnapshot>>;
+}
+
+// Every donor's entry by user id, rewritten by the bot at most once a second
+interface RankFile {
+  log_seq: number;
+  generated_at: string;
+  ranks: Record<string, LeaderboardEntry>;
+  periods?: Partial<Record<Period, { bucket: string; ranks: Record<string, LeaderboardEntry> }>>;
 }
 
-async function loadDonationsData(): Promise<DonationsData | null> {
+const EMPTY_STATS: LeaderboardStats = { total_stars: 0, total_usd: 0, total_donors: 0 };
+
+const DATA_DIR = path.join(process.cwd(), 'telegram-bot', 'data');
+const SNAPSHOT_PATH = path.join(DATA_DIR, 'leaderboard.json');
+const RANKS_PATH = path.join(DATA_DIR, 'ranks.json');
+
+// Parsed files, each reused until its mtime changes
+const cached = new Map<string, { mtimeMs: number; data: unknown }>();
+
+async function loadJson<T>(file: string): Promise<T | null> {
   try {
-    // Try to read from bot's data directory
-    const donationsPath = path.join(process.cwd(), 'telegram-bot', 'data', 'donations.json');
-    const data = await fs.readFile(donationsPath, 'utf-8');
-    return JSON.parse(data);
+    const { mtimeMs } = await fs.stat(file);
+    let entry = cached.get(file);
+    if (entry?.mtimeMs !== mtimeMs) {
+      const data = await fs.readFile(file, 'utf-8');
+      entry = { mtimeMs, data: JSON.parse(data) };
+      cached.set(file, entry);
+    }
+    return entry.data as T;
   } catch (error) {
-    console.log('Could not read donations file:', error);
-    return null;
+    console.log(`Could not read ${path.basename(file)}:`, error);
+    return (cached.get(file)?.data as T | undefined) ?? null;
+  }
+}
+
+// A donor's entry: from the top list when they are in it (always current),
+// otherwise from ranks.json, which can trail a donation by about a second
+async function findDonor(
+  userId: number,
+  period: Period | 'all',
+  view: { bucket?: string; leaderboard: LeaderboardEntry[] }
+): Promise<LeaderboardEntry | null> {
+  const top = view.leaderboard.find((entry) => entry.id === userId);
+  if (top) {
+    return top;
+  }
+  const rankFile = await loadJson<RankFile>(RANKS_PATH);
+  if (period === 'all') {
+    return rankFile?.ranks[String(userId)] ?? null;
   }
+  const window = rankFile?.periods?.[period];
+  return window && window.bucket === view.bucket ? window.ranks[String(userId)] ?? null : null;
 }
 
 export async function GET(request: NextRequest) {
   try {
     const { searchParams } = new URL(request.url);
     const userId = searchParams.get('userId');
+    const period = searchParams.get('period') ?? 'all';
+    if (period !== 'all' && period !== 'week' && period !== 'month') {
+      return NextResponse.json(
+        { error: 'period must be week, month or all' },
+        { status: 400 }
+      );
+    }
     
-    const data = await loadDonationsData();
+    const snapshot = await loadJson<LeaderboardSnapshot>(SNAPSHOT_PATH);
+
+    // The whole snapshot, or one time window of it. A window whose bucket has
+    // ended had no donations since, so it is empty rather than stale.
+    let view: { bucket?: string; stats: LeaderboardStats; leaderboard: LeaderboardEntry[] } | null = snapshot;
+    if (snapshot && period !== 'all') {
+      const window = snapshot.periods?.[period];
+      view = window && Date.now() / 1000 < window.ends_at ? window : null;
+    }
     
-    // If no data file exists yet, return empty state
-    if (!data) {
+    // If no snapshot exists yet (or the window is empty), return empty state
+    if (!view) {
       return NextResponse.json({
         leaderboard: [],
         stats: {
-          total_stars: 0,
-          total_usd: 0,
-          total_donors: 0,
+          ...EMPTY_STATS,
           goal_stars: DONATION_GOAL_STARS,
           goal_usd: DONATION_GOAL_STARS / STARS_PER_DOLLAR,
         },
+        period,
         currentUser: null,
       });
     }
-    
-    // Convert donors object to array and sort by total_stars
-    const donorsArray = Object.values(data.donors);
-    const sortedDonors = donorsArray.sort((a, b) => b.total_stars - a.total_stars);
-    
-    // Map to leaderboard format with ranks
-    const leaderboard = sortedDonors.slice(0, 100).map((donor, index) => ({
-      id: donor.id,
-      name: donor.name,
-      username: donor.username || '',
-      amount: donor.total_usd,
-      rank: index + 1,
-      photoUrl: donor.photo_url,
-    }));
 
     // Find current user if userId provided
-    let currentUser = null;
-    if (userId) {
-      const userIdNum = parseInt(userId);
-      const userIndex = sortedDonors.findIndex(d => d.id === userIdNum);
-      
-      if (userIndex !== -1) {
-        const donor = sortedDonors[userIndex];
-        currentUser = {
-          id: donor.id,
-          name: donor.name,
-          username: donor.username || '',
-          amount: donor.total_usd,
-          rank: userIndex + 1,
-          photoUrl: donor.photo_url,
-        };
-      }
-    }
+    const currentUser = userId ? await findDonor(parseInt(userId), period, view) : null;
 
     return NextResponse.json({
-      leaderboard,
+      leaderboard: view.leaderboard,
       stats: {
-        total_stars: data.total_stars,
-        total_usd: data.total_usd,
-        total_donors: donorsArray.length,
+        ...view.stats,
         goal_stars: DONATION_GOAL_STARS,
         goal_usd: DONATION_GOAL_STARS / STARS_PER_DOLLAR,
       },
+      period,
       currentUser,
     });
   } catch (error) {
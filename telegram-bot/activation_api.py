@@ -0,0 +1,93 @@
+"""
+Activation API for the Mac app
+POST /v1/activate with {"key", "machine_id", "app_version"?, "os_version"?}
+verifies the beta key signature, applies the per-key machine limit and
+answers with a JSON verdict. A successful verdict carries a signed
+receipt (see crypto.create_activation_receipt) that the app checks offline
+until it expires, so it only calls back once per ACTIVATION_RECEIPT_HOURS.
+
+Runs on the bot's HTTP server: verification happens on the event loop,
+and the storage write goes to the loop's shared worker pool, so a request
+never gets a thread of its own.
+"""
+import asyncio
+import hashlib
+import time
+from typing import Optional
+
+from config import ED25519_PUBLIC_KEY_HEX, ED25519_PRIVATE_KEY_HEX, ACTIVATION_RECEIPT_HOURS
+from crypto import verify_beta_key, create_activation_receipt
+from http_server import HTTPServer, Request, Response
+import activation_tracker
+
+ACTIVATE_PATH = "/v1/activate"
+MAX_FIELD_LENGTH = 128  # machine_id / version strings longer than this are refused
+
+
+def key_id_for(key: str, payload_key_id: str) -> str:
+    """Activation-tracking id; keys issued before key ids existed use a hash of the key"""
+    return payload_key_id or hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _field(body: dict, name: str, required: bool = False) -> Optional[str]:
+    value = body.get(name, "")
+    if not isinstance(value, str) or len(value) > MAX_FIELD_LENGTH or (required and not value):
+        return None
+    return value
+
+
+async def activate(request: Request) -> Response:
+    try:
+        body = request.json()
+    except ValueError:
+        return Response.json({"ok": False, "status": "bad_request"}, 400)
+    if not isinstance(body, dict) or not isinstance(body.get("key"), str):
+        return Response.json({"ok": False, "status": "bad_request"}, 400)
+
+    machine_id = _field(body, "machine_id", required=True)
+    app_version = _field(body, "app_version")
+    os_version = _field(body, "os_version")
+    if machine_id is None or app_version is None or os_version is None:
+        return Response.json({"ok": False, "status": "bad_request"}, 400)
+
+    key = body["key"].strip()
+    payload = verify_beta_key(key, ED25519_PUBLIC_KEY_HEX)
+    if payload is None:
+        return Response.json({"ok": False, "status": "invalid_key"})
+    if payload.expire_ts <= time.time():
+        return Response.json({"ok": False, "status": "expired", "expires_at": payload.expire_ts})
+
+    key_id = key_id_for(key, payload.key_id)
+    loop = asyncio.get_running_loop()
+    success, message = await loop.run_in_executor(
+        None,
+        activation_tracker.record_activation,
+        key_id, payload.user_id, machine_id, app_version, os_version
+    )
+
+    verdict = {
+        "ok": success,
+        "key_id": key_id,
+        "expires_at": payload.expire_ts,
+    }
+    if message.startswith("limit_reached:"):
+        verdict["status"] = "limit_reached"
+        verdict["max_activations"] = int(message.split(":")[1])
+    elif message == "already_activated":
+        verdict["status"] = "already_activated"
+    else:
+        count, max_activations = message.split(":")[1].split("/")
+        verdict["status"] = "activated"
+        verdict["activations"] = int(count)
+        verdict["max_activations"] = int(max_activations)
+
+    if success and ED25519_PRIVATE_KEY_HEX:
+        # Never outlive the key itself
+        valid_until = min(int(time.time()) + ACTIVATION_RECEIPT_HOURS * 3600, payload.expire_ts)
+        verdict["receipt"] = create_activation_receipt(key_id, machine_id, valid_until, ED25519_PRIVATE_KEY_HEX)
+        verdict["receipt_valid_until"] = valid_until
+    return Response.json(verdict)
+
+
+def register_routes(server: HTTPServer):
+    server.route("POST", ACTIVATE_PATH, activate)
@@ -0,0 +1,708 @@
+"""
+Storage backends for activation tracking.
+activation_tracker.py holds the public API; the classes here only store rows.
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from storage import write_json_atomic
+
+
+class Activation(NamedTuple):
+    """Single activation record; stores hand these out as-is"""
+    machine_id: str
+    activated_at: str
+    app_version: str = ""
+    os_version: str = ""
+    last_seen: str = ""
+
+
+class KeyRecord:
+    """
+    All activations for a single key, keyed by machine_id.
+    The dict doubles as the key's set of machines, so membership is O(1).
+    Stores replace `activations` with a new dict instead of mutating it, and
+    callers get their own record, so what a caller holds never changes.
+    """
+    __slots__ = ("key_id", "user_id", "max_activations", "activations")
+
+    def __init__(self, key_id: str, user_id: int, max_activations: int, activations: Dict[str, Activation]):
+        self.key_id = key_id
+        self.user_id = user_id
+        self.max_activations = max_activations
+        self.activations = activations
+
+    def __repr__(self) -> str:
+        return f"KeyRecord({self.key_id!r}, user_id={self.user_id}, machines={list(self.activations)})"
+
+
+# Evicted (key_id, machine_id) pairs
+ReleasedSlots = List[Tuple[str, str]]
+
+
+def _row(raw) -> Activation:
+    """Journal/snapshot row as an Activation; rows written before last_seen existed use activated_at"""
+    if len(raw) == 4:
+        return Activation(*raw, raw[1])
+    return Activation._make(raw)
+
+
+class SQLiteActivationStore:
+    """
+    Activations in SQLite (WAL mode).
+    One row per key and one per (key_id, machine_id), so every change touches
+    a single indexed row instead of rewriting the whole data set.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS activation_keys (
+            key_id          TEXT PRIMARY KEY,
+            user_id         INTEGER NOT NULL,
+            max_activations INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS activations (
+            key_id       TEXT NOT NULL REFERENCES activation_keys(key_id) ON DELETE CASCADE,
+            machine_id   TEXT NOT NULL,
+            activated_at TEXT NOT NULL,
+            app_version  TEXT NOT NULL DEFAULT '',
+            os_version   TEXT NOT NULL DEFAULT '',
+            last_seen    TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (key_id, machine_id)
+        ) WITHOUT ROWID;
+        -- Running totals, updated in the same transaction as every change
+        CREATE TABLE IF NOT EXISTS activation_stats (
+            id                INTEGER PRIMARY KEY CHECK (id = 1),
+            total_keys        INTEGER NOT NULL,
+            total_activations INTEGER NOT NULL,
+            keys_at_limit     INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(activations)")]
+        if "last_seen" not in columns:
+            # Database created before last_seen was tracked
+            self._conn.execute("ALTER TABLE activations ADD COLUMN last_seen TEXT NOT NULL DEFAULT ''")
+            self._conn.execute("UPDATE activations SET last_seen = activated_at")
+        # Oldest-first order for stale slot eviction
+        self._conn.execute("CREATE INDEX IF NOT EXISTS activations_by_last_seen ON activations(last_seen)")
+        # machine_id -> keys, for spotting one machine activating many keys
+        self._conn.execute("CREATE INDEX IF NOT EXISTS activations_by_machine ON activations(machine_id, key_id)")
+        if self._conn.execute("SELECT 1 FROM activation_stats").fetchone() is None:
+            # Database created before the totals table existed
+            self.recount_stats()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM activation_keys LIMIT 1").fetchone() is None
+
+    def _add_to_stats(self, keys: int, activations: int, at_limit: int):
+        self._conn.execute(
+            "UPDATE activation_stats SET total_keys = total_keys + ?, "
+            "total_activations = total_activations + ?, keys_at_limit = keys_at_limit + ?",
+            (keys, activations, at_limit)
+        )
+
+    def get_key(self, key_id: str) -> Optional[KeyRecord]:
+        """The key's record, or None for an unknown key"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, max_activations FROM activation_keys WHERE key_id = ?",
+                (key_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            activations = self._conn.execute(
+                "SELECT machine_id, activated_at, app_version, os_version, last_seen "
+                "FROM activations WHERE key_id = ? ORDER BY activated_at",
+                (key_id,)
+            ).fetchall()
+        return KeyRecord(key_id, row[0], row[1], {a[0]: Activation._make(a) for a in activations})
+
+    def check_and_add(
+        self,
+        key_id: str,
+        user_id: int,
+        max_activations: int,
+        activation: Activation
+    ) -> Tuple[str, int, int]:
+        """
+        Check the limit and store the activation in one write transaction.
+        Returns (outcome, activation_count, max_activations) where outcome is
+        "first_activation", "new_machine", "already_activated" or "limit_reached".
+        """
+        machine_id = activation.machine_id
+        with self._lock, self._conn:
+            # IMMEDIATE takes the write lock up front, so no other connection
+            # can slip an activation in between the check and the insert
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT k.max_activations, "
+                "       (SELECT COUNT(*) FROM activations a WHERE a.key_id = k.key_id), "
+                "       EXISTS(SELECT 1 FROM activations a WHERE a.key_id = k.key_id AND a.machine_id = ?) "
+                "FROM activation_keys k WHERE k.key_id = ?",
+                (machine_id, key_id)
+            ).fetchone()
+
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO activation_keys (key_id, user_id, max_activations) VALUES (?, ?, ?)",
+                    (key_id, user_id, max_activations)
+                )
+                outcome, count = "first_activation", 0
+            else:
+                max_activations, count, exists = row
+                if exists:
+                    self._touch(key_id, machine_id, activation.last_seen)
+                    return "already_activated", count, max_activations
+                if count >= max_activations:
+                    return "limit_reached", count, max_activations
+                outcome = "new_machine"
+
+            self._conn.execute(
+                "INSERT INTO activations (key_id, machine_id, activated_at, app_version, os_version, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key_id, *activation)
+            )
+            self._add_to_stats(
+                1 if outcome == "first_activation" else 0,
+                1,
+                1 if count + 1 == max_activations else 0
+            )
+            return outcome, count + 1, max_activations
+
+    def keys_for_machine(self, machine_id: str) -> List[str]:
+        """Every key activated on this machine"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key_id FROM activations WHERE machine_id = ? ORDER BY key_id",
+                (machine_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def all_keys(self) -> List[KeyRecord]:
+        """Every key with its activations (for exports; reads the whole table)"""
+        with self._lock:
+            keys = self._conn.execute(
+                "SELECT key_id, user_id, max_activations FROM activation_keys ORDER BY key_id"
+            ).fetchall()
+            activations = self._conn.execute(
+                "SELECT key_id, machine_id, activated_at, app_version, os_version, last_seen "
+                "FROM activations ORDER BY key_id, activated_at"
+            ).fetchall()
+        records = {key_id: KeyRecord(key_id, user_id, max_activations, {}) for key_id, user_id, max_activations in keys}
+        for row in activations:
+            records[row[0]].activations[row[1]] = Activation._make(row[1:])
+        return list(records.values())
+
+    def _key_count(self, key_id: str) -> Optional[Tuple[int, int]]:
+        """(activation_count, max_activations) for a key, or None"""
+        return self._conn.execute(
+            "SELECT (SELECT COUNT(*) FROM activations a WHERE a.key_id = k.key_id), k.max_activations "
+            "FROM activation_keys k WHERE k.key_id = ?",
+            (key_id,)
+        ).fetchone()
+
+    def _touch(self, key_id: str, machine_id: str, seen: str) -> bool:
+        cursor = self._conn.execute(
+            "UPDATE activations SET last_seen = ? WHERE key_id = ? AND machine_id = ? AND last_seen < ?",
+            (seen, key_id, machine_id, seen)
+        )
+        return cursor.rowcount > 0
+
+    def touch(self, key_id: str, machine_id: str, seen: str) -> bool:
+        """Move a machine's last_seen forward; False if it isn't activated"""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            return self._touch(key_id, machine_id, seen)
+
+    def _remove(self, key_id: str, machine_id: str) -> bool:
+        before = self._key_count(key_id)
+        cursor = self._conn.execute(
+            "DELETE FROM activations WHERE key_id = ? AND machine_id = ?",
+            (key_id, machine_id)
+        )
+        if cursor.rowcount == 0:
+            return False
+        count, max_activations = before
+        self._add_to_stats(0, -1, -1 if count == max_activations else 0)
+        return True
+
+    def remove_activation(self, key_id: str, machine_id: str) -> bool:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            return self._remove(key_id, machine_id)
+
+    def release_stale(self, cutoff: str, limit: int = 1000) -> ReleasedSlots:
+        """
+        Remove activations last seen before `cutoff` (ISO timestamp).
+        Walks the last_seen index from the oldest entry and stops at the first
+        fresh one, so each eviction is one index lookup plus one delete.
+        """
+        with self._lock:
+            # One index probe without a write lock; the common case is nothing stale
+            if self._conn.execute(
+                "SELECT 1 FROM activations WHERE last_seen < ? LIMIT 1", (cutoff,)
+            ).fetchone() is None:
+                return []
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                stale = self._conn.execute(
+                    "SELECT key_id, machine_id FROM activations "
+                    "WHERE last_seen < ? ORDER BY last_seen LIMIT ?",
+                    (cutoff, limit)
+                ).fetchall()
+                for key_id, machine_id in stale:
+                    self._remove(key_id, machine_id)
+        return [tuple(row) for row in stale]
+
+    def delete_key(self, key_id: str) -> bool:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            before = self._key_count(key_id)
+            if before is None:
+                return False
+            self._conn.execute("DELETE FROM activation_keys WHERE key_id = ?", (key_id,))
+            count, max_activations = before
+            self._add_to_stats(-1, -count, -1 if count >= max_activations else 0)
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        """Running totals, read from a single row"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total_keys, total_activations, keys_at_limit FROM activation_stats"
+            ).fetchone()
+        return {
+            "total_keys": row[0],
+            "total_activations": row[1],
+            "keys_at_limit": row[2],
+        }
+
+    def recount_stats(self) -> Dict[str, int]:
+        """Recompute the totals from every row and store them"""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            total_keys = self._conn.execute("SELECT COUNT(*) FROM activation_keys").fetchone()[0]
+            total_activations = self._conn.execute("SELECT COUNT(*) FROM activations").fetchone()[0]
+            keys_at_limit = self._conn.execute(
+                "SELECT COUNT(*) FROM activation_keys k "
+                "WHERE (SELECT COUNT(*) FROM activations a WHERE a.key_id = k.key_id) >= k.max_activations"
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO activation_stats (id, total_keys, total_activations, keys_at_limit) "
+                "VALUES (1, ?, ?, ?)",
+                (total_keys, total_activations, keys_at_limit)
+            )
+        return {
+            "total_keys": total_keys,
+            "total_activations": total_activations,
+            "keys_at_limit": keys_at_limit,
+        }
+
+    def import_json(self, json_path: Path, default_max: int) -> int:
+        """
+        One-time import of the legacy activations.json.
+        Returns the number of keys imported; existing rows are left as they are.
+        """
+        with open(json_path, "r") as f:
+            data = json.load(f)
+
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for key_id, record in data.items():
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO activation_keys (key_id, user_id, max_activations) VALUES (?, ?, ?)",
+                    (key_id, record.get("user_id", 0), record.get("max_activations", default_max))
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO activations "
+                    "(key_id, machine_id, activated_at, app_version, os_version, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            key_id,
+                            a["machine_id"],
+                            a.get("activated_at", ""),
+                            a.get("app_version", ""),
+                            a.get("os_version", ""),
+                            a.get("last_seen") or a.get("activated_at", ""),
+                        )
+                        for a in record.get("activations", [])
+                    ]
+                )
+        self.recount_stats()
+        return len(data)
+
+
+class JournalActivationStore:
+    """
+    Activations kept in memory and persisted as an append-only journal.
+
+    Every change is one JSON line appended (and fsynced) to `{base}.journal`,
+    so a write costs the same no matter how many keys exist. At startup the
+    snapshot `{base}.snapshot.json` is loaded and the journal replayed on top.
+    Once the journal grows past `compact_every` entries a background thread
+    folds it into a new snapshot.
+
+    A min-heap on last_seen finds stale machines without scanning every key.
+    Touches push a new heap entry instead of updating the old one; outdated
+    entries are skipped when popped and dropped on the next rebuild.
+    """
+
+    def __init__(self, base_path: Path, compact_every: int = 1000):
+        base_path.parent.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = base_path.with_suffix(".snapshot.json")
+        self.journal_path = base_path.with_suffix(".journal")
+        self.rotated_path = base_path.with_suffix(".journal.1")
+        self.compact_every = compact_every
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()  # One compaction at a time
+        self._keys: Dict[str, KeyRecord] = {}
+        self._totals = {"total_keys": 0, "total_activations": 0, "keys_at_limit": 0}
+        self._by_last_seen: List[Tuple[str, str, str]] = []  # (last_seen, key_id, machine_id)
+        self._keys_by_machine: Dict[str, Set[str]] = {}
+        self._seq = 0                 # Sequence number of the last applied entry
+        self._since_compaction = 0
+        self._compacting = False
+
+        self._load()
+        self._journal = open(self.journal_path, "a")
+        if self.rotated_path.exists():
+            # Finish the compaction a crash interrupted before rotating again
+            self.compact()
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+
+    # --- replay ---
+
+    def _load(self):
+        snapshot_seq = 0
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot["seq"]
+            self._seq = snapshot_seq
+            for key_id, record in snapshot["keys"].items():
+                self._keys[key_id] = KeyRecord(
+                    key_id,
+                    record["user_id"],
+                    record["max_activations"],
+                    {row[0]: _row(row) for row in record["activations"]}
+                )
+        self.recount_stats()
+        self._rebuild_index()
+
+        # A compaction interrupted after rotating leaves entries in journal.1
+        for path in (self.rotated_path, self.journal_path):
+            if not path.exists():
+                continue
+            good_bytes = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Torn last line from a crash mid-append
+                    good_bytes += len(line)
+                    if entry["seq"] <= snapshot_seq:
+                        continue  # Already folded into the snapshot
+                    self._apply(entry)
+                    self._seq = entry["seq"]
+                    self._since_compaction += 1
+            # Cut the torn line off, or the next append would be glued onto it
+            if good_bytes < path.stat().st_size:
+                os.truncate(path, good_bytes)
+
+    def _apply(self, entry: dict):
+        op = entry["op"]
+        key_id = entry["key"]
+        totals = self._totals
+        if op == "add":
+            record = self._keys.get(key_id)
+            if record is None:
+                record = self._keys[key_id] = KeyRecord(key_id, entry["user"], entry["max"], {})
+                totals["total_keys"] += 1
+            row = _row(entry["row"])
+            if row.machine_id not in record.activations:
+                record.activations = {**record.activations, row.machine_id: row}
+                heapq.heappush(self._by_last_seen, (row.last_seen, key_id, row.machine_id))
+                self._keys_by_machine.setdefault(row.machine_id, set()).add(key_id)
+                totals["total_activations"] += 1
+                if len(record.activations) == record.max_activations:
+                    totals["keys_at_limit"] += 1
+        elif op == "touch":
+            record = self._keys.get(key_id)
+            row = record.activations.get(entry["machine"]) if record else None
+            if row and row.last_seen < entry["seen"]:
+                record.activations = {**record.activations, row.machine_id: row._replace(last_seen=entry["seen"])}
+                heapq.heappush(self._by_last_seen, (entry["seen"], key_id, row.machine_id))
+                self._maybe_compact_heap()
+        elif op == "remove":
+            record = self._keys.get(key_id)
+            if record and entry["machine"] in record.activations:
+                if len(record.activations) == record.max_activations:
+                    totals["keys_at_limit"] -= 1
+                activations = dict(record.activations)
+                del activations[entry["machine"]]
+                record.activations = activations
+                self._unlink_machine(entry["machine"], key_id)
+                totals["total_activations"] -= 1
+        elif op == "delete":
+            record = self._keys.pop(key_id, None)
+            if record:
+                for machine_id in record.activations:
+                    self._unlink_machine(machine_id, key_id)
+                count = len(record.activations)
+                totals["total_keys"] -= 1
+                totals["total_activations"] -= count
+                if count >= record.max_activations:
+                    totals["keys_at_limit"] -= 1
+
+    def _append(self, entry: dict):
+        """Write one entry durably, then apply it in memory"""
+        self._seq += 1
+        entry["seq"] = self._seq
+        self._journal.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._apply(entry)
+
+        self._since_compaction += 1
+        if self._since_compaction >= self.compact_every and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def _unlink_machine(self, machine_id: str, key_id: str):
+        keys = self._keys_by_machine.get(machine_id)
+        if keys is not None:
+            keys.discard(key_id)
+            if not keys:
+                del self._keys_by_machine[machine_id]
+
+    def _maybe_compact_heap(self):
+        """
+        Drop outdated last_seen entries once they outnumber live ones. Touches
+        add entries whether or not release_stale ever pops them (TTL off), so
+        this keeps the heap bounded at O(1) amortized per touch.
+        """
+        if len(self._by_last_seen) > 2 * self._totals["total_activations"] + 1024:
+            self._by_last_seen = [
+                (row.last_seen, key_id, machine_id)
+                for key_id, record in self._keys.items()
+                for machine_id, row in record.activations.items()
+            ]
+            heapq.heapify(self._by_last_seen)
+
+    def _rebuild_index(self):
+        self._by_last_seen = []
+        self._keys_by_machine = {}
+        for key_id, record in self._keys.items():
+            for machine_id, row in record.activations.items():
+                self._by_last_seen.append((row.last_seen, key_id, machine_id))
+                self._keys_by_machine.setdefault(machine_id, set()).add(key_id)
+        heapq.heapify(self._by_last_seen)
+
+    # --- compaction ---
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot"""
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            self._journal.close()
+            if self.rotated_path.exists():
+                # Leftover from an interrupted compaction: its entries are already
+                # in memory, so fold them in with the current journal
+                with open(self.rotated_path, "a") as rotated, open(self.journal_path, "r") as current:
+                    rotated.write(current.read())
+                self.journal_path.unlink()
+            else:
+                os.replace(self.journal_path, self.rotated_path)
+            # Swap in an empty journal; entries written from now on go there
+            self._journal = open(self.journal_path, "a")
+            seq = self._seq
+            keys = {
+                key_id: {
+                    "user_id": record.user_id,
+                    "max_activations": record.max_activations,
+                    "activations": list(record.activations.values()),
+                }
+                for key_id, record in self._keys.items()
+            }
+            self._since_compaction = 0
+
+        # The slow part runs without the lock; writers keep appending meanwhile
+        try:
+            write_json_atomic(self.snapshot_path, {"seq": seq, "keys": keys})
+            self.rotated_path.unlink(missing_ok=True)
+        finally:
+            self._compacting = False
+
+    # --- store interface ---
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._keys
+
+    def get_key(self, key_id: str) -> Optional[KeyRecord]:
+        """
+        A copy of the key's record. The activations dict is shared, which is
+        safe because changes swap in a new dict instead of mutating it.
+        """
+        with self._lock:
+            record = self._keys.get(key_id)
+            if record is None:
+                return None
+            return KeyRecord(record.key_id, record.user_id, record.max_activations, record.activations)
+
+    def check_and_add(
+        self,
+        key_id: str,
+        user_id: int,
+        max_activations: int,
+        activation: Activation
+    ) -> Tuple[str, int, int]:
+        with self._lock:
+            record = self._keys.get(key_id)
+            if record is None:
+                outcome, count = "first_activation", 0
+            else:
+                max_activations = record.max_activations
+                count = len(record.activations)
+                if activation.machine_id in record.activations:
+                    self.touch(key_id, activation.machine_id, activation.last_seen)
+                    return "already_activated", count, max_activations
+                if count >= max_activations:
+                    return "limit_reached", count, max_activations
+                outcome = "new_machine"
+
+            self._append({
+                "op": "add",
+                "key": key_id,
+                "user": user_id,
+                "max": max_activations,
+                "row": list(activation),
+            })
+            return outcome, count + 1, max_activations
+
+    def touch(self, key_id: str, machine_id: str, seen: str) -> bool:
+        """Move a machine's last_seen forward; False if it isn't activated"""
+        with self._lock:
+            record = self._keys.get(key_id)
+            row = record.activations.get(machine_id) if record else None
+            if row is None:
+                return False
+            if row.last_seen < seen:
+                self._append({"op": "touch", "key": key_id, "machine": machine_id, "seen": seen})
+            return True
+
+    def remove_activation(self, key_id: str, machine_id: str) -> bool:
+        with self._lock:
+            record = self._keys.get(key_id)
+            if not record or machine_id not in record.activations:
+                return False
+            self._append({"op": "remove", "key": key_id, "machine": machine_id})
+            return True
+
+    def release_stale(self, cutoff: str, limit: int = 1000) -> ReleasedSlots:
+        """Remove activations last seen before `cutoff` (ISO timestamp), oldest first"""
+        released = []
+        with self._lock:
+            heap = self._by_last_seen
+            while heap and heap[0][0] < cutoff and len(released) < limit:
+                seen, key_id, machine_id = heapq.heappop(heap)
+                record = self._keys.get(key_id)
+                row = record.activations.get(machine_id) if record else None
+                if row is None or row.last_seen != seen:
+                    continue  # Removed or touched since this entry was pushed
+                self._append({"op": "remove", "key": key_id, "machine": machine_id})
+                released.append((key_id, machine_id))
+        return released
+
+    def keys_for_machine(self, machine_id: str) -> List[str]:
+        """Every key activated on this machine"""
+        with self._lock:
+            return sorted(self._keys_by_machine.get(machine_id, ()))
+
+    def all_keys(self) -> List[KeyRecord]:
+        """Every key with its activations, as copies (see get_key)"""
+        with self._lock:
+            return [
+                KeyRecord(r.key_id, r.user_id, r.max_activations, r.activations)
+                for _, r in sorted(self._keys.items())
+            ]
+
+    def delete_key(self, key_id: str) -> bool:
+        with self._lock:
+            if key_id not in self._keys:
+                return False
+            self._append({"op": "delete", "key": key_id})
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        """Running totals kept up to date by every change"""
+        with self._lock:
+            return dict(self._totals)
+
+    def recount_stats(self) -> Dict[str, int]:
+        """Recompute the totals from every record"""
+        with self._lock:
+            records = self._keys.values()
+            self._totals = {
+                "total_keys": len(records),
+                "total_activations": sum(len(r.activations) for r in records),
+                "keys_at_limit": sum(1 for r in records if len(r.activations) >= r.max_activations),
+            }
+            return dict(self._totals)
+
+    def import_json(self, json_path: Path, default_max: int) -> int:
+        """One-time import of the legacy activations.json, written straight into a snapshot"""
+        with open(json_path, "r") as f:
+            data = json.load(f)
+
+        with self._lock:
+            for key_id, record in data.items():
+                target = self._keys.get(key_id)
+                if target is None:
+                    target = self._keys[key_id] = KeyRecord(
+                        key_id,
+                        record.get("user_id", 0),
+                        record.get("max_activations", default_max),
+                        {}
+                    )
+                activations = dict(target.activations)
+                for a in record.get("activations", []):
+                    activations.setdefault(a["machine_id"], Activation(
+                        a["machine_id"],
+                        a.get("activated_at", ""),
+                        a.get("app_version", ""),
+                        a.get("os_version", ""),
+                        a.get("last_seen") or a.get("activated_at", ""),
+                    ))
+                target.activations = activations
+            self.recount_stats()
+            self._rebuild_index()
+            self.compact()
+        return len(data)
@@ -1,73 +1,65 @@
 """
 Activation tracking for beta keys.
 Limits each key to MAX_ACTIVATIONS_PER_KEY machines.
+Machines idle for longer than ACTIVATION_TTL_DAYS free their slot when the
+bot's periodic sweep calls release_stale_activations().
 """
-import json
-from pathlib import Path
-from datetime import datetime
-from typing import Dict, List, Optional
-from dataclasses import dataclass, asdict
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Union
 
-from config import DATA_DIR, MAX_ACTIVATIONS_PER_KEY
+from config import (
+    DATA_DIR, MAX_ACTIVATIONS_PER_KEY, ACTIVATION_BACKEND, ACTIVATION_JOURNAL_COMPACT_EVERY,
+    ACTIVATION_TTL_DAYS, MACHINE_KEYS_ALERT_THRESHOLD
+)
+from activation_store import Activation, KeyRecord, JournalActivationStore, SQLiteActivationStore
 
 
-ACTIVATIONS_FILE = DATA_DIR / "activations.json"
+ACTIVATIONS_DB = DATA_DIR / "activations.db"
+ACTIVATIONS_JOURNAL = DATA_DIR / "activations"  # .journal + .snapshot.json
+ACTIVATIONS_FILE = DATA_DIR / "activations.json"  # Legacy format, imported once
 
 
-@dataclass
-class Activation:
-    """Single activation record"""
-    machine_id: str
-    activated_at: str
-    app_version: str = ""
-    os_version: str = ""
+# Records come straight from the store (see activation_store.KeyRecord)
+KeyActivations = KeyRecord
+
 
+_store: Optional[Union[SQLiteActivationStore, JournalActivationStore]] = None
+_store_lock = threading.Lock()  # Guards the one-time open (and import) of the store
 
-@dataclass
-class KeyActivations:
-    """All activations for a single key"""
-    key_id: str
-    user_id: int
-    activations: List[Activation]
-    max_activations: int = MAX_ACTIVATIONS_PER_KEY
+# Activations of the same key are serialized; different keys rarely share a lock
+_KEY_LOCKS = [threading.Lock() for _ in range(64)]
 
 
-def _ensure_data_dir():
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+# Called with (machine_id, key_ids) when a machine reaches MACHINE_KEYS_ALERT_THRESHOLD keys
+_machine_alert_handlers: List[Callable[[str, List[str]], None]] = []
 
 
-def _load_activations() -> Dict[str, dict]:
-    """Load all activation data"""
-    _ensure_data_dir()
-    if ACTIVATIONS_FILE.exists():
-        with open(ACTIVATIONS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+def _key_lock(key_id: str) -> threading.Lock:
+    return _KEY_LOCKS[hash(key_id) % len(_KEY_LOCKS)]
 
 
-def _save_activations(data: Dict[str, dict]):
-    """Save activation data"""
-    _ensure_data_dir()
-    with open(ACTIVATIONS_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def _get_store() -> Union[SQLiteActivationStore, JournalActivationStore]:
+    """Open the activation store, importing activations.json on first run"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if ACTIVATION_BACKEND == "journal":
+                    store = JournalActivationStore(ACTIVATIONS_JOURNAL, ACTIVATION_JOURNAL_COMPACT_EVERY)
+                else:
+                    store = SQLiteActivationStore(ACTIVATIONS_DB)
+                if ACTIVATIONS_FILE.exists() and store.is_empty():
+                    imported = store.import_json(ACTIVATIONS_FILE, MAX_ACTIVATIONS_PER_KEY)
+                    ACTIVATIONS_FILE.rename(ACTIVATIONS_FILE.with_suffix(".json.imported"))
+                    print(f"✅ Imported {imported} keys from {ACTIVATIONS_FILE.name} ({ACTIVATION_BACKEND} store)")
+                _store = store
+    return _store
 
 
 def get_key_activations(key_id: str) -> Optional[KeyActivations]:
     """Get activation info for a key"""
-    data = _load_activations()
-    if key_id not in data:
-        return None
-    
-    record = data[key_id]
-    activations = [
-        Activation(**a) for a in record.get("activations", [])
-    ]
-    return KeyActivations(
-        key_id=key_id,
-        user_id=record.get("user_id", 0),
-        activations=activations,
-        max_activations=record.get("max_activations", MAX_ACTIVATIONS_PER_KEY)
-    )
+    return _get_store().get_key(key_id)
 
 
 def can_activate(key_id: str, machine_id: str) -> tuple[bool, str]:
@@ -82,9 +74,8 @@ def can_activate(key_id: str, machine_id: str) -> tuple[bool, str]:
         return True, "first_activation"
     
     # Check if already activated on this machine
-    for activation in record.activations:
-        if activation.machine_id == machine_id:
-            return True, "already_activated"
+    if machine_id in record.activations:
+        return True, "already_activated"
     
     # Check activation limit
     if len(record.activations) >= record.max_activations:
@@ -102,75 +93,107 @@ def record_activation(
 ) -> tuple[bool, str]:
     """
     Record a new activation.
+    The limit check and the insert are one atomic step, so concurrent
+    activations of the same key can never exceed its limit.
     Returns (success, message)
     """
-    can, reason = can_activate(key_id, machine_id)
-    
-    if not can:
-        return False, reason
-    
-    if reason == "already_activated":
-        return True, "already_activated"
-    
-    data = _load_activations()
-    
-    if key_id not in data:
-        data[key_id] = {
-            "key_id": key_id,
-            "user_id": user_id,
-            "activations": [],
-            "max_activations": MAX_ACTIVATIONS_PER_KEY
-        }
-    
+    now = datetime.now().isoformat()
     activation = Activation(
         machine_id=machine_id,
-        activated_at=datetime.now().isoformat(),
+        activated_at=now,
         app_version=app_version,
-        os_version=os_version
+        os_version=os_version,
+        last_seen=now
     )
     
-    data[key_id]["activations"].append(asdict(activation))
-    _save_activations(data)
+    # A repeat activation refreshes last_seen (the app's sign of life)
+    with _key_lock(key_id):
+        outcome, count, max_activations = _get_store().check_and_add(
+            key_id,
+            user_id,
+            MAX_ACTIVATIONS_PER_KEY,
+            activation
+        )
+    
+    if outcome == "limit_reached":
+        return False, f"limit_reached:{max_activations}"
+    
+    if outcome == "already_activated":
+        return True, "already_activated"
     
-    count = len(data[key_id]["activations"])
+    _check_machine(machine_id)
     return True, f"activated:{count}/{MAX_ACTIVATIONS_PER_KEY}"
 
 
+def _check_machine(machine_id: str):
+    """Alert once, when a machine's activation reaches the alert threshold"""
+    key_ids = get_machine_keys(machine_id)
+    # Only the activation that crosses the threshold alerts, not every one after it
+    if len(key_ids) != MACHINE_KEYS_ALERT_THRESHOLD:
+        return
+    
+    print(f"🚨 Machine {machine_id} has activated {len(key_ids)} keys: {', '.join(key_ids)}")
+    for handler in _machine_alert_handlers:
+        try:
+            handler(machine_id, key_ids)
+        except Exception as e:
+            print(f"⚠️ Machine alert handler failed: {e}")
+
+
+def on_machine_alert(handler: Callable[[str, List[str]], None]):
+    """Register a callback for machines reaching MACHINE_KEYS_ALERT_THRESHOLD"""
+    _machine_alert_handlers.append(handler)
+
+
+def get_machine_keys(machine_id: str) -> List[str]:
+    """Keys activated on a machine, from the store's machine_id index"""
+    return _get_store().keys_for_machine(machine_id)
+
+
+def get_all_key_activations() -> List[KeyActivations]:
+    """Every key with its activations, e.g. to export them"""
+    return _get_store().all_keys()
+
+
 def deactivate_machine(key_id: str, machine_id: str) -> bool:
     """Remove a machine from activations (allows re-activation elsewhere)"""
-    data = _load_activations()
-    
-    if key_id not in data:
-        return False
-    
-    original_count = len(data[key_id]["activations"])
-    data[key_id]["activations"] = [
-        a for a in data[key_id]["activations"]
-        if a["machine_id"] != machine_id
-    ]
-    
-    if len(data[key_id]["activations"]) < original_count:
-        _save_activations(data)
-        return True
-    
-    return False
+    return _get_store().remove_activation(key_id, machine_id)
 
 
-def get_activation_stats() -> dict:
-    """Get overall activation statistics"""
-    data = _load_activations()
-    
-    total_keys = len(data)
-    total_activations = sum(
-        len(record.get("activations", []))
-        for record in data.values()
-    )
+def release_stale_activations() -> int:
+    """
+    Free the slots of machines not seen for ACTIVATION_TTL_DAYS.
+    The store walks its last_seen index oldest-first, so this costs
+    O(log n) per released machine and one index probe when nothing is stale.
+    Called by the bot's periodic sweep, never from the activation path.
+    """
+    if ACTIVATION_TTL_DAYS <= 0:
+        return 0
     
-    return {
-        "total_keys": total_keys,
-        "total_activations": total_activations,
-        "keys_at_limit": sum(
-            1 for record in data.values()
-            if len(record.get("activations", [])) >= record.get("max_activations", MAX_ACTIVATIONS_PER_KEY)
-        )
-    }
+    cutoff = (datetime.now() - timedelta(days=ACTIVATION_TTL_DAYS)).isoformat()
+    released = _get_store().release_stale(cutoff)
+    for key_id, machine_id in released:
+        print(f"♻️ Released stale activation {machine_id} of key {key_id}")
+    return len(released)
+
+
+def delete_key(key_id: str) -> bool:
+    """Forget a key and all of its activations"""
+    return _get_store().delete_key(key_id)
+
+
+def get_activation_stats(recount: bool = False) -> dict:
+    """
+    Get overall activation statistics.
+    The totals are kept up to date on every change; recount=True rebuilds
+    them from all records instead and reports any drift.
+    """
+    store = _get_store()
+    if not recount:
+        return store.stats()
+    
+    cached = store.stats()
+    fresh = store.recount_stats()
+    if cached != fresh:
+        print(f"⚠️ Activation stats drifted: {cached} -> {fresh}")
+    return fresh
@@ -0,0 +1,304 @@
+"""
+Broadcast engine for Relay Bot
+Sends a message to many chats concurrently while staying inside Telegram's
+global and per-chat flood limits.
+
+Each job is stored in BROADCASTS_DIR as two files:
+  {job_id}.json  - texts and recipients, written once when the job starts
+  {job_id}.log   - one line per finished recipient ("<chat_id> ok|failed")
+On restart, unfinished jobs are resumed and recipients already in the log
+are skipped, so nobody gets the same message twice.
+"""
+import asyncio
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from config import (
+    BROADCAST_MESSAGES_PER_SECOND, BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_CONCURRENCY, BROADCASTS_DIR
+)
+from storage import write_json_atomic
+
+MAX_ATTEMPTS = 3         # Network errors before a recipient is marked failed
+PROGRESS_INTERVAL = 5.0  # Seconds between progress edits in the admin chat
+
+
+class RateLimiter:
+    """Spaces out acquisitions to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        """Hold back every sender, e.g. after Telegram answered RetryAfter"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+@dataclass
+class BroadcastJob:
+    """One broadcast: texts per language and who still has to get them"""
+    job_id: str
+    texts: Dict[str, str]                 # lang -> text, "default" is the fallback
+    recipients: List[Tuple[int, str]]     # (chat_id, lang)
+    parse_mode: Optional[str] = "Markdown"
+    admin_chat_id: Optional[int] = None
+    progress_message_id: Optional[int] = None
+    sent: int = 0
+    failed: int = 0
+    done: Set[int] = field(default_factory=set)
+
+    @property
+    def job_file(self) -> Path:
+        return BROADCASTS_DIR / f"{self.job_id}.json"
+
+    @property
+    def log_file(self) -> Path:
+        return BROADCASTS_DIR / f"{self.job_id}.log"
+
+    def text_for(self, lang: str) -> str:
+        return self.texts.get(lang) or self.texts["default"]
+
+    def pending(self) -> List[Tuple[int, str]]:
+        return [(chat_id, lang) for chat_id, lang in self.recipients if chat_id not in self.done]
+
+    def save(self):
+        write_json_atomic(self.job_file, {
+            "job_id": self.job_id,
+            "texts": self.texts,
+            "recipients": self.recipients,
+            "parse_mode": self.parse_mode,
+            "admin_chat_id": self.admin_chat_id,
+            "progress_message_id": self.progress_message_id,
+        })
+
+    @classmethod
+    def load(cls, job_file: Path) -> "BroadcastJob":
+        with open(job_file, "r") as f:
+            raw = json.load(f)
+        job = cls(
+            job_id=raw["job_id"],
+            texts=raw["texts"],
+            recipients=[(int(chat_id), lang) for chat_id, lang in raw["recipients"]],
+            parse_mode=raw.get("parse_mode"),
+            admin_chat_id=raw.get("admin_chat_id"),
+            progress_message_id=raw.get("progress_message_id"),
+        )
+        if job.log_file.exists():
+            with open(job.log_file, "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 2:
+                        continue  # Torn last line after a crash
+                    job.done.add(int(parts[0]))
+                    if parts[1] == "ok":
+                        job.sent += 1
+                    else:
+                        job.failed += 1
+        return job
+
+
+class Broadcaster:
+    """Runs broadcast jobs in the background"""
+
+    def __init__(
+        self,
+        rate: float = BROADCAST_MESSAGES_PER_SECOND,
+        per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+        concurrency: int = BROADCAST_CONCURRENCY
+    ):
+        self.limiter = RateLimiter(rate)
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = concurrency
+        self._chat_ready: Dict[int, float] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def start(
+        self,
+        bot: Bot,
+        texts: Dict[str, str],
+        recipients: List[Tuple[int, str]],
+        admin_chat_id: Optional[int] = None,
+        parse_mode: Optional[str] = "Markdown",
+        job_id: Optional[str] = None
+    ) -> Optional[BroadcastJob]:
+        """
+        Save a new job and start sending it in the background.
+        Starting a job_id that is already saved does nothing and returns None.
+        """
+        if job_id and (job_id in self._tasks or (BROADCASTS_DIR / f"{job_id}.json").exists()):
+            return None
+
+        job = BroadcastJob(
+            job_id=job_id or uuid.uuid4().hex[:12],
+            texts=texts,
+            recipients=recipients,
+            parse_mode=parse_mode,
+            admin_chat_id=admin_chat_id,
+        )
+        if admin_chat_id is not None:
+            msg = await bot.send_message(chat_id=admin_chat_id, text=self._progress_text(job))
+            job.progress_message_id = msg.message_id
+        job.save()
+        self._spawn(bot, job)
+        return job
+
+    async def resume(self, bot: Bot) -> int:
+        """Restart every job left unfinished by a previous process"""
+        if not BROADCASTS_DIR.exists():
+            return 0
+
+        resumed = 0
+        for job_file in sorted(BROADCASTS_DIR.glob("*.json")):
+            try:
+                job = BroadcastJob.load(job_file)
+            except (json.JSONDecodeError, KeyError, ValueError) as e:
+                print(f"⚠️ Skipping broken broadcast job {job_file.name}: {e}")
+                continue
+            if job.job_id in self._tasks:
+                continue
+            print(f"📢 Resuming broadcast {job.job_id}: {len(job.pending())} recipients left")
+            self._spawn(bot, job)
+            resumed += 1
+        return resumed
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def _spawn(self, bot: Bot, job: BroadcastJob):
+        task = asyncio.create_task(self._run(bot, job))
+        self._tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.job_id, None))
+
+    async def _run(self, bot: Bot, job: BroadcastJob):
+        queue: asyncio.Queue = asyncio.Queue()
+        for recipient in job.pending():
+            queue.put_nowait(recipient)
+
+        with open(job.log_file, "a") as log:
+            workers = [
+                asyncio.create_task(self._worker(bot, job, queue, log))
+                for _ in range(min(self.concurrency, max(queue.qsize(), 1)))
+            ]
+            progress = asyncio.create_task(self._report_progress(bot, job))
+            try:
+                await queue.join()
+            finally:
+                for task in workers + [progress]:
+                    task.cancel()
+                await asyncio.gather(*workers, progress, return_exceptions=True)
+
+        await self._edit_progress(bot, job, finished=True)
+        job.job_file.unlink(missing_ok=True)
+        job.log_file.unlink(missing_ok=True)
+        print(f"📢 Broadcast {job.job_id} finished: {job.sent} sent, {job.failed} failed")
+
+    async def _worker(self, bot: Bot, job: BroadcastJob, queue: asyncio.Queue, log):
+        while True:
+            chat_id, lang = await queue.get()
+            try:
+                # One bad chat must not kill the worker: with every worker gone
+                # the queue is never drained and the job never finishes
+                try:
+                    delivered = await self._deliver(bot, job, chat_id, lang)
+                except Exception as e:
+                    print(f"Broadcast {job.job_id}: {chat_id} failed ({e!r})")
+                    delivered = False
+                if delivered:
+                    job.sent += 1
+                else:
+                    job.failed += 1
+                job.done.add(chat_id)
+                try:
+                    log.write(f"{chat_id} {'ok' if delivered else 'failed'}\n")
+                    log.flush()
+                except Exception as e:
+                    # Only costs a possible resend of this chat after a restart
+                    print(f"⚠️ Broadcast {job.job_id}: could not log {chat_id} ({e!r})")
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, bot: Bot, job: BroadcastJob, chat_id: int, lang: str) -> bool:
+        attempts = 0
+        while True:
+            await self.limiter.acquire()
+            await self._wait_for_chat(chat_id)
+            try:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=job.text_for(lang),
+                    parse_mode=job.parse_mode
+                )
+                return True
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so everyone waits
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                self.limiter.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                # Bot blocked, chat gone, etc. - retrying won't help
+                print(f"Broadcast {job.job_id}: {chat_id} skipped ({e})")
+                return False
+            except TelegramError as e:
+                attempts += 1
+                if attempts >= MAX_ATTEMPTS:
+                    print(f"Broadcast {job.job_id}: {chat_id} failed ({e})")
+                    return False
+                await asyncio.sleep(2 ** attempts)
+
+    async def _wait_for_chat(self, chat_id: int):
+        now = time.monotonic()
+        ready = self._chat_ready.get(chat_id, 0.0)
+        self._chat_ready[chat_id] = max(now, ready) + self.per_chat_interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+        if len(self._chat_ready) > 10000:
+            # Forget chats whose cool-down is long over
+            self._chat_ready = {c: t for c, t in self._chat_ready.items() if t > now}
+
+    async def _report_progress(self, bot: Bot, job: BroadcastJob):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            await self._edit_progress(bot, job)
+
+    async def _edit_progress(self, bot: Bot, job: BroadcastJob, finished: bool = False):
+        if job.admin_chat_id is None or job.progress_message_id is None:
+            return
+        try:
+            await bot.edit_message_text(
+                chat_id=job.admin_chat_id,
+                message_id=job.progress_message_id,
+                text=self._progress_text(job, finished)
+            )
+        except TelegramError:
+            pass  # "message is not modified" and friends
+
+    @staticmethod
+    def _progress_text(job: BroadcastJob, finished: bool = False) -> str:
+        total = len(job.recipients)
+        header = "✅ Broadcast finished" if finished else "📢 Broadcasting…"
+        return (
+            f"{header}\n\n"
+            f"Progress: {job.sent + job.failed}/{total}\n"
+            f"Sent: {job.sent}\n"
+            f"Failed: {job.failed}"
+        )
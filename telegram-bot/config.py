@@ -14,6 +14,19 @@ BETA_COHORT = "beta-jan-2026"
 MAX_BETA_USERS = 100
 MAX_ACTIVATIONS_PER_KEY = 2  # Each key can be activated on 2 machines
 
+# Activation storage: "sqlite" (data/activations.db) or "journal"
+# (append-only data/activations.journal folded into a JSON snapshot)
+ACTIVATION_BACKEND = os.environ.get("RELAY_ACTIVATION_BACKEND", "sqlite")
+ACTIVATION_JOURNAL_COMPACT_EVERY = 1000  # Journal entries before a background compaction
+ACTIVATION_RECEIPT_HOURS = 72  # How long the app may trust a signed receipt without calling back
+# Machines not seen for this many days give their slot back (0 = never)
+ACTIVATION_TTL_DAYS = int(os.environ.get("RELAY_ACTIVATION_TTL_DAYS", 90))
+ACTIVATION_RELEASE_INTERVAL = int(os.environ.get("RELAY_ACTIVATION_RELEASE_INTERVAL", 3600))  # Seconds between stale sweeps
+MACHINE_KEYS_ALERT_THRESHOLD = 3  # Admins are alerted when one machine has activated this many keys
+
+# Where issued beta slots live: "json" (data/beta_users.json) or "supabase" (bot_beta_users)
+BETA_USERS_BACKEND = os.environ.get("RELAY_BETA_USERS_BACKEND", "json")
+
 # Paths
 DATA_DIR = Path(__file__).parent / "data"
 DATA_FILE = DATA_DIR / "beta_users.json"
@@ -35,9 +48,26 @@ TMA_WEB_URL = os.environ.get("RELAY_TMA_WEB_URL", "https://relay-payment-miniapp
 # Donation settings
 DONATION_GOAL_STARS = 50000  # Goal: 50,000 Stars (~$1000)
 STARS_PER_DOLLAR = 50  # 50 Stars ≈ $1
+DONATION_LOG_SEGMENT_BYTES = 1024 * 1024  # Transaction log segment size before rotation
+DONATION_RANKS_PUBLISH_INTERVAL = 1.0  # Seconds between rewrites of ranks.json (every donor's rank)
 
 # Preset donation amounts in USD
 DONATION_PRESETS_USD = [4.99, 9.99, 19.99, 49.99]
 
 # Milestone thresholds (in Stars) for notifications
 DONATION_MILESTONES = [5000, 10000, 25000, 50000]  # ~$100, $200, $500, $1000
+
+# Broadcast delivery limits (Telegram allows ~30 msg/s overall and ~1 msg/s per chat)
+BROADCAST_MESSAGES_PER_SECOND = 25
+BROADCAST_PER_CHAT_INTERVAL = 1.0  # seconds between messages to the same chat
+BROADCAST_CONCURRENCY = 8
+BROADCASTS_DIR = DATA_DIR / "broadcasts"
+
+# HTTP server (health checks + webhook) — hosting platforms pass the port in $PORT
+PORT = int(os.environ.get("PORT", 8080))
+
+# Webhook mode: set RELAY_WEBHOOK_URL to the public https:// base URL of this service.
+# Leave empty to use long polling.
+WEBHOOK_URL = os.environ.get("RELAY_WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = os.environ.get("RELAY_WEBHOOK_SECRET", "")
@@ -30,6 +30,14 @@ class BetaKeyPayload:
     key_id: str           # Unique key identifier for tracking activations
 
 
+@dataclass
+class ActivationReceipt:
+    """Proof that a key was activated on a machine, checked offline by the app"""
+    key_id: str           # Key the activation belongs to
+    machine_id: str       # Machine the receipt is bound to
+    valid_until: int      # Unix timestamp after which the app must re-activate
+
+
 def generate_key_id(user_id: int) -> str:
     """Generate unique key ID from user_id and timestamp"""
     data = f"{user_id}-{int(time.time())}-relay"
@@ -166,6 +174,77 @@ def verify_beta_key(key: str, public_key_hex: str) -> Optional[BetaKeyPayload]:
         return None
 
 
+def create_activation_receipt(
+    key_id: str,
+    machine_id: str,
+    valid_until: int,
+    private_key_hex: str
+) -> str:
+    """
+    Sign an activation receipt.
+    
+    Format: RELAY-RCPT-{base64_payload}.{base64_signature}
+    
+    Same scheme as beta keys. The receipt is bound to one machine, so copying
+    it elsewhere doesn't bypass the activation limit.
+    """
+    if not NACL_AVAILABLE:
+        raise RuntimeError("PyNaCl required: pip install pynacl")
+    
+    if not private_key_hex:
+        raise ValueError("Private key not configured")
+    
+    payload_dict = {
+        "k": key_id,
+        "m": machine_id,
+        "v": valid_until
+    }
+    
+    payload_bytes = json.dumps(payload_dict, separators=(',', ':')).encode('utf-8')
+    payload_b64 = base64.b64encode(payload_bytes).decode('ascii')
+    
+    signing_key = SigningKey(private_key_hex, encoder=HexEncoder)
+    signature_b64 = base64.b64encode(signing_key.sign(payload_bytes).signature).decode('ascii')
+    
+    return f"RELAY-RCPT-{payload_b64}.{signature_b64}"
+
+
+def verify_activation_receipt(
+    receipt: str,
+    public_key_hex: str,
+    machine_id: str
+) -> Optional[ActivationReceipt]:
+    """
+    Verify an activation receipt for this machine.
+    Returns None if the signature is invalid, it belongs to another machine or it has expired.
+    """
+    if not NACL_AVAILABLE:
+        return None
+    
+    if not receipt.startswith("RELAY-RCPT-"):
+        return None
+    
+    try:
+        payload_b64, signature_b64 = receipt[len("RELAY-RCPT-"):].split(".")
+        payload_bytes = base64.b64decode(payload_b64)
+        
+        verify_key = VerifyKey(public_key_hex, encoder=HexEncoder)
+        verify_key.verify(payload_bytes, base64.b64decode(signature_b64))
+        
+        payload_dict = json.loads(payload_bytes.decode('utf-8'))
+        result = ActivationReceipt(
+            key_id=payload_dict["k"],
+            machine_id=payload_dict["m"],
+            valid_until=payload_dict["v"]
+        )
+    except Exception:
+        return None
+    
+    if result.machine_id != machine_id or result.valid_until <= time.time():
+        return None
+    return result
+
+
 if __name__ == "__main__":
     # Generate new keypair
     print("🔐 Generating Ed25519 keypair for beta key signing...\n")
@@ -3,47 +3,583 @@ Donations management for Relay Bot
 Handles Telegram Stars payments and leaderboard
 """
 
+import atexit
 import json
-from datetime import datetime
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
-from config import DATA_DIR
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import DATA_DIR, DONATION_LOG_SEGMENT_BYTES, DONATION_RANKS_PUBLISH_INTERVAL
+from leaderboard_cache import LeaderboardCache
+from storage import write_json_atomic
+from transaction_log import TransactionLog
 
 DONATIONS_FILE = DATA_DIR / "donations.json"
+LEADERBOARD_SIZE = 100  # Donors listed in leaderboard.json for the web app
+PERIODS = ("week", "month")  # Time-windowed leaderboards besides all-time
 
 
-def ensure_donations_file():
-    """Ensure donations file exists"""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    if not DONATIONS_FILE.exists():
-        save_donations_data({
-            "donors": {},
-            "total_stars": 0,
-            "total_usd": 0,
-            "transactions": []
-        })
+class DonorRanks:
+    """
+    Donors in leaderboard order: most stars first, ties in the order donors
+    first appeared (what a stable sort of the donors dict gives).
+    Kept sorted with bisect, so a rank is a binary search, not a full sort.
+    """
+    
+    def __init__(self, donors: dict):
+        # user_id_str -> (-total_stars, first_seen, user_id_str)
+        self._keys: Dict[str, Tuple[int, int, str]] = {
+            uid: (-donor["total_stars"], seq, uid)
+            for seq, (uid, donor) in enumerate(donors.items())
+        }
+        self._order: List[Tuple[int, int, str]] = sorted(self._keys.values())
+        self._next_seq = len(self._keys)
+    
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def update(self, user_id_str: str, total_stars: int):
+        """Move a donor to their new total (new donors go last among equals)"""
+        old = self._keys.get(user_id_str)
+        if old is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        else:
+            seq = old[1]
+            del self._order[bisect_left(self._order, old)]
+        key = (-total_stars, seq, user_id_str)
+        self._keys[user_id_str] = key
+        insort(self._order, key)
+    
+    def rank(self, user_id_str: str) -> Optional[int]:
+        key = self._keys.get(user_id_str)
+        if key is None:
+            return None
+        return bisect_left(self._order, key) + 1
+    
+    def top(self, limit: int) -> List[str]:
+        """User ids of the first `limit` donors"""
+        return [key[2] for key in self._order[:limit]]
 
 
-def load_donations_data() -> dict:
-    """Load donations data from file"""
-    ensure_donations_file()
-    try:
-        with open(DONATIONS_FILE, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
+def _empty_data() -> dict:
+    return {
+        "donors": {},
+        "total_stars": 0,
+        "total_usd": 0,
+        "periods": {},  # period -> totals of its current bucket, see _apply_periods
+        "log_seq": 0  # Last transaction log entry folded into these totals
+    }
+
+
+def period_bounds(period: str, when: datetime) -> Tuple[str, datetime, datetime]:
+    """
+    Bucket key ("2025-W07" / "2025-02") and [start, end) of the period containing `when`.
+    Periods are UTC weeks and months, like period_bucket() in
+    sql/period_leaderboards.sql, so both backends roll over at the same moment.
+    A naive `when` (log timestamps) is taken as local time.
+    """
+    when = when.astimezone(timezone.utc)
+    day = datetime(when.year, when.month, when.day, tzinfo=timezone.utc)
+    if period == "week":
+        year, week, weekday = when.isocalendar()
+        start = day - timedelta(days=weekday - 1)
+        return f"{year}-W{week:02d}", start, start + timedelta(days=7)
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return f"{when.year}-{when.month:02d}", start, end
+
+
+def _apply_periods(periods: dict, tx: dict):
+    """
+    Fold one transaction into the current week and month buckets, in place.
+    Each period keeps only its latest bucket: a transaction from a newer
+    bucket starts it afresh, so a window is read without touching history.
+    """
+    user_id_str = str(tx["user_id"])
+    when = datetime.fromisoformat(tx["timestamp"])
+    for period in PERIODS:
+        bucket_key, start, end = period_bounds(period, when)
+        bucket = periods.get(period)
+        if bucket is None or bucket["bucket"] < bucket_key:
+            bucket = periods[period] = {
+                "bucket": bucket_key,
+                "starts_at": start.isoformat(),
+                "ends_at": end.isoformat(),
+                "total_stars": 0,
+                "total_usd": 0,
+                "donors": {}
+            }
+        elif bucket["bucket"] > bucket_key:
+            continue  # Belongs to a bucket that has already rolled over
+        entry = bucket["donors"].setdefault(user_id_str, {"total_stars": 0, "total_usd": 0, "donation_count": 0})
+        entry["total_stars"] += tx["stars"]
+        entry["total_usd"] += tx["usd"]
+        entry["donation_count"] += 1
+        bucket["total_stars"] += tx["stars"]
+        bucket["total_usd"] += tx["usd"]
+
+
+def _apply(data: dict, tx: dict) -> dict:
+    """
+    Fold one logged transaction into the aggregates, in place (callers hold
+    the ledger lock). Only the donor's own entry is rebuilt. Returns it.
+    """
+    user_id_str = str(tx["user_id"])
+    existing = data["donors"].get(user_id_str)
+    if existing:
+        donor = {
+            **existing,
+            "total_stars": existing["total_stars"] + tx["stars"],
+            "total_usd": existing["total_usd"] + tx["usd"],
+            "donation_count": existing["donation_count"] + 1,
+            "last_donation": tx["timestamp"],
+        }
+        if tx.get("photo_url"):
+            donor["photo_url"] = tx["photo_url"]
+    else:
+        donor = {
+            "id": tx["user_id"],
+            "name": tx.get("name"),
+            "username": tx.get("username"),
+            "total_stars": tx["stars"],
+            "total_usd": tx["usd"],
+            "donation_count": 1,
+            "first_donation": tx["timestamp"],
+            "last_donation": tx["timestamp"],
+            "photo_url": tx.get("photo_url")
+        }
+
+    data["donors"][user_id_str] = donor
+    data["total_stars"] += tx["stars"]
+    data["total_usd"] += tx["usd"]
+    _apply_periods(data["periods"], tx)
+    data["log_seq"] = tx["seq"]
+    return donor
+
+
+def _web_entry(donor: dict, amount: float, rank: int) -> dict:
+    """A leaderboard entry as the web app's /api/leaderboard returns it"""
+    return {
+        "id": donor["id"],
+        "name": donor["name"],
+        "username": donor.get("username") or "",
+        "amount": amount,
+        "rank": rank,
+        "photoUrl": donor.get("photo_url"),
+    }
+
+
+class DonationLedger:
+    """
+    donations.json held in memory, next to the full transaction history.
+    Each donation is first appended to the transaction log (`<path stem>/`,
+    see transaction_log.py) — that append is the commit point. The aggregates
+    in donations.json are then rewritten with one atomic write; if that write
+    fails or the process dies first, the log entries past the file's
+    `log_seq` are replayed on the next load. Reads are served from memory.
+
+    After every change a `leaderboard.json` snapshot (totals and the top
+    LEADERBOARD_SIZE donors) is published next to donations.json, so the web
+    app's /api/leaderboard route only reads it and never sorts donors itself.
+    Its size does not grow with the number of donors. Every donor's rank goes
+    to `ranks.json` instead, rewritten by a background thread at most once
+    per `ranks_interval` seconds however many donations arrive.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        segment_bytes: int = DONATION_LOG_SEGMENT_BYTES,
+        ranks_interval: float = DONATION_RANKS_PUBLISH_INTERVAL
+    ):
+        self.path = path
+        self.log_dir = path.with_suffix("")
+        self.segment_bytes = segment_bytes
+        self._lock = threading.RLock()
+        self._data: Optional[dict] = None
+        self._ranks: Optional[DonorRanks] = None
+        # period -> (bucket key, ranks of that bucket's donors by stars given in it)
+        self._period_ranks: Dict[str, Tuple[str, DonorRanks]] = {}
+        self._log: Optional[TransactionLog] = None
+        self._charges: Dict[str, int] = {}  # charge_id -> user_id, from the log
+        self.leaderboard_path = path.with_name("leaderboard.json")
+        self._top = LeaderboardCache(self._leaderboard_rows, LEADERBOARD_SIZE)
+
+        self.ranks_path = path.with_name("ranks.json")
+        self.ranks_interval = ranks_interval
+        self._ranks_lock = threading.Lock()  # One ranks.json write at a time
+        self._ranks_due = threading.Event()
+        self._closing = threading.Event()
+        self._ranks_thread: Optional[threading.Thread] = None
+
+    def _state(self) -> dict:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._load()
+        return self._data
+
+    def _load(self):
+        data = _empty_data()
+        dirty = False
+        try:
+            with open(self.path, "r") as f:
+                data.update(json.load(f))
+        except FileNotFoundError:
+            dirty = True
+        except json.JSONDecodeError as e:
+            print(f"⚠️ {self.path.name} is unreadable ({e}), starting empty")
+
+        if self._log is not None:
+            self._log.close()
+        self._log = TransactionLog(self.log_dir, self.segment_bytes)
+
+        # Files from before the log kept the last transactions inline; they
+        # are already in the totals, so they move to the log as history only
+        legacy = data.pop("transactions", None)
+        data.pop("charges", None)
+        if legacy is not None:
+            dirty = True
+            logged = self._log.charges()  # Non-empty only if a migration was cut short
+            for tx in legacy:
+                if tx.get("charge_id") not in logged:
+                    self._log.append(tx)
+            data["log_seq"] = self._log.last_seq
+
+        if not data["periods"] and data["log_seq"]:
+            # Files from before windowed leaderboards: rebuild the current
+            # buckets from the part of the log they cover (the index lets the
+            # read start at the right segment instead of the beginning)
+            dirty = True
+            since = min(period_bounds(period, datetime.now())[1] for period in PERIODS)
+            since = since.astimezone().replace(tzinfo=None).isoformat()  # Log timestamps are local
+            for tx in self._log.read(since_seq=self._log.seq_before(since)):
+                if tx["seq"] > data["log_seq"]:
+                    break
+                if tx["timestamp"] >= since:
+                    _apply_periods(data["periods"], tx)
+
+        # Donations logged after the last aggregate write
+        for tx in self._log.read(since_seq=data["log_seq"]):
+            _apply(data, tx)
+            dirty = True
+
+        self._charges = self._log.charges()
+        self._ranks = DonorRanks(data["donors"])
+        self._index_periods(data)
+        self._data = data
+        self._top.invalidate()
+        if dirty:
+            write_json_atomic(self.path, data)
+        if dirty or not self.leaderboard_path.exists() or not self.ranks_path.exists():
+            self._publish()
+
+    def _publish(self):
+        """
+        Write leaderboard.json from the current state (entries in the web app's
+        shape) and have the background writer refresh ranks.json
+        """
+        data = self._data
+        snapshot = {
+            "log_seq": data["log_seq"],
+            "generated_at": datetime.now().isoformat(),
+            "stats": {
+                "total_stars": data["total_stars"],
+                "total_usd": data["total_usd"],
+                "total_donors": len(data["donors"]),
+            },
+            "leaderboard": [
+                _web_entry(data["donors"][uid], data["donors"][uid]["total_usd"], rank)
+                for rank, uid in enumerate(self._ranks.top(LEADERBOARD_SIZE), 1)
+            ],
+            "periods": {},
+        }
+        for period in PERIODS:
+            bucket = self._current_bucket(period)
+            if bucket is None:
+                continue  # Only what period_leaderboard() would serve
+            snapshot["periods"][period] = {
+                "bucket": bucket["bucket"],
+                # Epoch seconds, so the web app can tell a bucket that has rolled over
+                "starts_at": int(datetime.fromisoformat(bucket["starts_at"]).timestamp()),
+                "ends_at": int(datetime.fromisoformat(bucket["ends_at"]).timestamp()),
+                "stats": {
+                    "total_stars": bucket["total_stars"],
+                    "total_usd": bucket["total_usd"],
+                    "total_donors": len(bucket["donors"]),
+                },
+                "leaderboard": [
+                    _web_entry(row, row["total_usd"], row["rank"])
+                    for row in self._period_rows(period, bucket, LEADERBOARD_SIZE)
+                ],
+            }
+        try:
+            write_json_atomic(self.leaderboard_path, snapshot)
+        except OSError as e:
+            # The next donation publishes again; a stale snapshot is still valid
+            print(f"⚠️ Could not publish {self.leaderboard_path.name}: {e}")
+
+        self._ranks_due.set()
+        if self._ranks_thread is None:
+            self._ranks_thread = threading.Thread(target=self._rank_writer, daemon=True)
+            self._ranks_thread.start()
+
+    def _rank_writer(self):
+        while not self._closing.is_set():
+            self._ranks_due.wait()
+            if self._closing.is_set():
+                return
+            self._ranks_due.clear()
+            self.publish_ranks()
+            # Donations in the meantime only set _ranks_due, so they share the next write
+            self._closing.wait(self.ranks_interval)
+
+    def publish_ranks(self):
+        """Write ranks.json: every donor's entry with their rank, overall and per current period"""
+        with self._ranks_lock:
+            # Under the ledger lock only references and numbers are copied;
+            # donor dicts are replaced on change, never mutated
+            with self._lock:
+                data = self._state()
+                log_seq = data["log_seq"]
+                donors = data["donors"]
+                ordered = [donors[uid] for uid in self._ranks.top(len(self._ranks))]
+                buckets = {}
+                for period in PERIODS:
+                    bucket = self._current_bucket(period)
+                    if bucket is not None:
+                        index = self._period_ranks[period][1]
+                        buckets[period] = (bucket["bucket"], [
+                            (donors[uid], dict(bucket["donors"][uid])) for uid in index.top(len(index))
+                        ])
+
+            ranks = {
+                "log_seq": log_seq,
+                "generated_at": datetime.now().isoformat(),
+                "ranks": {
+                    str(donor["id"]): _web_entry(donor, donor["total_usd"], rank)
+                    for rank, donor in enumerate(ordered, 1)
+                },
+                "periods": {},
+            }
+            for period, (bucket_key, rows) in buckets.items():
+                ranks["periods"][period] = {
+                    "bucket": bucket_key,
+                    "ranks": {
+                        str(donor["id"]): _web_entry(donor, totals["total_usd"], rank)
+                        for rank, (donor, totals) in enumerate(rows, 1)
+                    },
+                }
+            try:
+                write_json_atomic(self.ranks_path, ranks)
+            except OSError as e:
+                print(f"⚠️ Could not publish {self.ranks_path.name}: {e}")
+
+    def close(self):
+        """Stop the rank writer (leaving ranks.json current) and close the log"""
+        self._closing.set()
+        self._ranks_due.set()
+        if self._ranks_thread is not None:
+            self._ranks_thread.join()
+            self._ranks_thread = None
+            self.publish_ranks()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+
+    def reload(self):
+        """Drop the in-memory state and read the file again"""
+        with self._lock:
+            self._load()
+
+    def data(self) -> dict:
+        """The live state; change it only through save()"""
+        return self._state()
+
+    def save(self, data: Optional[dict] = None):
+        """Replace the whole state (and write it through)"""
+        with self._lock:
+            data = data if data is not None else self._state()
+            write_json_atomic(self.path, data)
+            self._data = data
+            self._ranks = DonorRanks(data["donors"])
+            self._index_periods(data)
+            self._top.invalidate()
+            self._publish()
+
+    def record(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: str,
+        last_name: Optional[str],
+        stars_amount: int,
+        charge_id: str,
+        photo_url: Optional[str] = None
+    ) -> dict:
+        """
+        Apply one donation. A charge_id seen before is a redelivered payment:
+        nothing changes and the donor's current standing is returned with
+        "duplicate": True.
+        """
+        user_id_str = str(user_id)
+
+        # Stars to USD conversion (approximate)
+        usd_amount = stars_amount / 50  # 50 stars ≈ $1
+
+        with self._lock:
+            data = self._state()
+
+            if charge_id in self._charges:
+                paid_by = str(self._charges[charge_id])
+                return {
+                    "donor": data["donors"].get(paid_by),
+                    "rank": self._ranks.rank(paid_by),
+                    "total_donors": len(data["donors"]),
+                    "duplicate": True
+                }
+
+            # The log keeps the donor's details so a replay can rebuild the totals
+            transaction = {
+                "user_id": user_id,
+                "username": username,
+                "name": f"{first_name} {last_name}".strip() if last_name else first_name,
+                "photo_url": photo_url,
+                "stars": stars_amount,
+                "usd": usd_amount,
+                "charge_id": charge_id,
+                "timestamp": datetime.now().isoformat()
+            }
+            transaction["seq"] = self._log.append(transaction)
+
+            # The log append above is the commit point, so memory follows it
+            # even if the aggregate write below fails
+            donor = _apply(data, transaction)
+            self._charges[charge_id] = user_id
+            self._ranks.update(user_id_str, donor["total_stars"])
+            self._index_periods(data, user_id_str)
+            self._top.record({**donor, "rank": self._ranks.rank(user_id_str)})
+            try:
+                write_json_atomic(self.path, data)
+            except OSError as e:
+                # Already durable in the log; the next load replays it
+                print(f"⚠️ Could not write {self.path.name} ({e}), donation kept in the log")
+            self._publish()
+
+            return {
+                "donor": donor,
+                "rank": self._ranks.rank(user_id_str),
+                "total_donors": len(data["donors"]),
+                "duplicate": False
+            }
+
+    def rank(self, user_id: int) -> int:
+        with self._lock:
+            self._state()
+            rank = self._ranks.rank(str(user_id))
+            return rank if rank is not None else len(self._ranks) + 1
+
+    def leaderboard(self, limit: int) -> list:
+        return self._top.get(limit)
+
+    def period_leaderboard(self, period: str, limit: int) -> list:
+        """Top donors of the current week or month, ranked by stars given in it"""
+        with self._lock:
+            bucket = self._current_bucket(period)
+            return self._period_rows(period, bucket, limit) if bucket else []
+
+    def _current_bucket(self, period: str) -> Optional[dict]:
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        bucket = self._state()["periods"].get(period)
+        # No donation since the period rolled over leaves last period's bucket
+        if bucket is None or bucket["bucket"] != period_bounds(period, datetime.now(timezone.utc))[0]:
+            return None
+        return bucket
+
+    def _index_periods(self, data: dict, user_id_str: Optional[str] = None):
+        """
+        Keep a DonorRanks per period bucket (ties in first-donation-in-bucket
+        order). A new bucket is indexed from scratch, otherwise only the donor
+        who just gave is moved; without `user_id_str` every bucket is rebuilt.
+        """
+        for period, bucket in data["periods"].items():
+            indexed = self._period_ranks.get(period)
+            if user_id_str is None or indexed is None or indexed[0] != bucket["bucket"]:
+                self._period_ranks[period] = (bucket["bucket"], DonorRanks(bucket["donors"]))
+            elif user_id_str in bucket["donors"]:
+                indexed[1].update(user_id_str, bucket["donors"][user_id_str]["total_stars"])
+        for period in set(self._period_ranks) - set(data["periods"]):
+            del self._period_ranks[period]
+
+    def _period_rows(self, period: str, bucket: dict, limit: int) -> list:
+        donors = self._data["donors"]
+        return [
+            {**donors[uid], **bucket["donors"][uid], "rank": rank}
+            for rank, uid in enumerate(self._period_ranks[period][1].top(limit), 1)
+        ]
+
+    def leaderboard_cache_stats(self) -> dict:
+        return self._top.metrics()
+
+    def _leaderboard_rows(self, limit: int) -> list:
+        with self._lock:
+            donors = self._state()["donors"]
+            return [
+                {**donors[uid], "rank": i + 1}
+                for i, uid in enumerate(self._ranks.top(limit))
+            ]
+
+    def donor_ids(self) -> List[int]:
+        with self._lock:
+            return [int(uid) for uid in self._state()["donors"]]
+
+    def stats(self) -> dict:
+        data = self._state()
         return {
-            "donors": {},
-            "total_stars": 0,
-            "total_usd": 0,
-            "transactions": []
+            "total_stars": data["total_stars"],
+            "total_usd": data["total_usd"],
+            "total_donors": len(data["donors"]),
+            "total_transactions": self._log.last_seq
         }
 
+    def donor_info(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            donor = self._state()["donors"].get(str(user_id))
+            if donor is None:
+                return None
+            return {**donor, "rank": self.rank(user_id)}
+
+    def transactions(self, since_seq: int = 0) -> Iterator[dict]:
+        """Full donation history from the log, oldest first"""
+        self._state()
+        return self._log.read(since_seq)
+
+    def last_milestone(self) -> int:
+        return self._state().get("last_milestone", 0)
+
+    def set_last_milestone(self, milestone: int):
+        with self._lock:
+            data = self._state()
+            new_data = {**data, "last_milestone": milestone}
+            write_json_atomic(self.path, new_data)
+            self._data = new_data
+
+
+_ledger = DonationLedger(DONATIONS_FILE)
+atexit.register(_ledger.close)
+
+
+def load_donations_data() -> dict:
+    """Get the in-memory donations state (read from disk on first call)"""
+    return _ledger.data()
+
 
 def save_donations_data(data: dict):
-    """Save donations data to file"""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(DONATIONS_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    """Replace the donations state and write it to file"""
+    _ledger.save(data)
 
 
 def record_donation(
@@ -56,136 +592,57 @@ def record_donation(
     photo_url: Optional[str] = None
 ) -> dict:
     """
-    Record a successful donation
+    Record a successful donation (a repeated charge_id is a no-op)
     Returns donor info with updated rank
     """
-    data = load_donations_data()
-    user_id_str = str(user_id)
-    
-    # Stars to USD conversion (approximate)
-    usd_amount = stars_amount / 50  # 50 stars ≈ $1
-    
-    # Update or create donor record
-    if user_id_str in data["donors"]:
-        donor = data["donors"][user_id_str]
-        donor["total_stars"] += stars_amount
-        donor["total_usd"] += usd_amount
-        donor["donation_count"] += 1
-        donor["last_donation"] = datetime.now().isoformat()
-        if photo_url:
-            donor["photo_url"] = photo_url
-    else:
-        name = f"{first_name} {last_name}".strip() if last_name else first_name
-        data["donors"][user_id_str] = {
-            "id": user_id,
-            "name": name,
-            "username": username,
-            "total_stars": stars_amount,
-            "total_usd": usd_amount,
-            "donation_count": 1,
-            "first_donation": datetime.now().isoformat(),
-            "last_donation": datetime.now().isoformat(),
-            "photo_url": photo_url
-        }
-    
-    # Update totals
-    data["total_stars"] += stars_amount
-    data["total_usd"] += usd_amount
-    
-    # Record transaction
-    data["transactions"].append({
-        "user_id": user_id,
-        "stars": stars_amount,
-        "usd": usd_amount,
-        "charge_id": charge_id,
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    # Keep only last 1000 transactions
-    if len(data["transactions"]) > 1000:
-        data["transactions"] = data["transactions"][-1000:]
-    
-    save_donations_data(data)
-    
-    # Calculate rank
-    rank = get_donor_rank(user_id)
-    
-    return {
-        "donor": data["donors"][user_id_str],
-        "rank": rank,
-        "total_donors": len(data["donors"])
-    }
+    return _ledger.record(user_id, username, first_name, last_name, stars_amount, charge_id, photo_url)
 
 
 def get_donor_rank(user_id: int) -> int:
     """Get donor's rank in leaderboard"""
-    data = load_donations_data()
-    
-    # Sort donors by total stars
-    sorted_donors = sorted(
-        data["donors"].items(),
-        key=lambda x: x[1]["total_stars"],
-        reverse=True
-    )
-    
-    # Find user's position
-    for i, (uid, _) in enumerate(sorted_donors):
-        if uid == str(user_id):
-            return i + 1
-    
-    return len(sorted_donors) + 1
+    return _ledger.rank(user_id)
 
 
 def get_leaderboard(limit: int = 100) -> list:
     """Get top donors for leaderboard"""
-    data = load_donations_data()
-    
-    # Sort by total stars
-    sorted_donors = sorted(
-        data["donors"].values(),
-        key=lambda x: x["total_stars"],
-        reverse=True
-    )[:limit]
-    
-    # Add rank
-    return [
-        {**donor, "rank": i + 1}
-        for i, donor in enumerate(sorted_donors)
-    ]
+    return _ledger.leaderboard(limit)
+
+
+def get_period_leaderboard(period: str, limit: int = 100) -> list:
+    """Get top donors of the current "week" or "month" """
+    return _ledger.period_leaderboard(period, limit)
+
+
+def get_leaderboard_cache_stats() -> dict:
+    """Hit/miss counters of the top-K leaderboard cache"""
+    return _ledger.leaderboard_cache_stats()
+
+
+def iter_donor_ids() -> Iterator[int]:
+    """Yield the Telegram ID of every donor"""
+    yield from _ledger.donor_ids()
 
 
 def get_donation_stats() -> dict:
     """Get overall donation statistics"""
-    data = load_donations_data()
-    return {
-        "total_stars": data["total_stars"],
-        "total_usd": data["total_usd"],
-        "total_donors": len(data["donors"]),
-        "total_transactions": len(data["transactions"])
-    }
+    return _ledger.stats()
 
 
 def get_donor_info(user_id: int) -> Optional[dict]:
     """Get specific donor's info"""
-    data = load_donations_data()
-    user_id_str = str(user_id)
-    
-    if user_id_str in data["donors"]:
-        donor = data["donors"][user_id_str]
-        donor["rank"] = get_donor_rank(user_id)
-        return donor
-    
-    return None
+    return _ledger.donor_info(user_id)
+
+
+def iter_transactions(since_seq: int = 0) -> Iterator[dict]:
+    """Yield every logged donation after `since_seq`, oldest first"""
+    yield from _ledger.transactions(since_seq)
 
 
 def get_last_milestone() -> int:
     """Get the last reached milestone"""
-    data = load_donations_data()
-    return data.get("last_milestone", 0)
+    return _ledger.last_milestone()
 
 
 def set_last_milestone(milestone: int):
     """Set the last reached milestone"""
-    data = load_donations_data()
-    data["last_milestone"] = milestone
-    save_donations_data(data)
+    _ledger.set_last_milestone(milestone)
@@ -0,0 +1,93 @@
+"""
+Heartbeat coalescing for activation last_seen updates
+The app reports in far more often than last_seen needs to change. Heartbeats
+are buffered in memory, keeping only the latest per (beta_key, machine_id),
+and written out as one batch every `flush_interval` seconds, or sooner once
+`max_buffer` distinct machines are waiting.
+"""
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Receives [(beta_key, machine_id, last_seen_iso)] and writes them in one call
+BatchWriter = Callable[[List[Tuple[str, str, str]]], None]
+
+
+class HeartbeatCoalescer:
+    """Buffers heartbeats and flushes them from a background thread"""
+
+    def __init__(self, write_batch: BatchWriter, flush_interval: float = 30.0, max_buffer: int = 5000):
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One batch in flight at a time
+        # (beta_key, machine_id) -> (last_seen_iso, heartbeats folded into it)
+        self._pending: Dict[Tuple[str, str], Tuple[str, int]] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.received = 0      # Heartbeats accepted
+        self.coalesced = 0     # Heartbeats covered by written rows
+        self.written = 0       # Rows sent to the database
+        self.flushes = 0       # Successful batch writes
+        self.failures = 0      # Batch writes that raised
+
+    def record(self, beta_key: str, machine_id: str):
+        """Buffer one heartbeat; a newer one for the same machine replaces it"""
+        with self._lock:
+            pair = (beta_key, machine_id)
+            _, hits = self._pending.get(pair, ("", 0))
+            self._pending[pair] = (datetime.now().isoformat(), hits + 1)
+            self.received += 1
+            full = len(self._pending) >= self.max_buffer
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            try:
+                self.write_batch([(key, machine, seen) for (key, machine), (seen, _) in batch.items()])
+            except Exception as e:
+                # Put the batch back for the next flush, merged with anything newer
+                with self._lock:
+                    for pair, (seen, hits) in batch.items():
+                        newer, newer_hits = self._pending.get(pair, (seen, 0))
+                        self._pending[pair] = (max(seen, newer), hits + newer_hits)
+                    self.failures += 1
+                print(f"⚠️ Heartbeat flush of {len(batch)} rows failed: {e}")
+                return 0
+
+            with self._lock:
+                self.written += len(batch)
+                self.coalesced += sum(hits for _, hits in batch.values())
+                self.flushes += 1
+            return len(batch)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "heartbeats_received": self.received,
+                "rows_written": self.written,
+                "flushes": self.flushes,
+                "failed_flushes": self.failures,
+                "pending": len(self._pending),
+                # Heartbeats per database row; 1.0 means nothing was coalesced
+                "coalescing_ratio": round(self.coalesced / self.written, 2) if self.written else 0.0,
+            }
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,160 @@
+"""
+Beta key issuance for Relay Bot
+Reserves a beta slot and issues a signed key as one atomic step,
+so concurrent /key requests can't over-issue or lose writes.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from config import (
+    BETA_DAYS, BETA_COHORT, MAX_BETA_USERS, ED25519_PRIVATE_KEY_HEX, BETA_USERS_BACKEND
+)
+from crypto import create_signed_beta_key, generate_discount_code, NACL_AVAILABLE
+import user_store
+
+EXPIRES_FORMAT = "%d.%m.%Y"
+
+
+@dataclass
+class IssueResult:
+    """Outcome of a key request"""
+    status: str           # "issued", "existing" or "no_slots"
+    key: str = ""
+    discount: str = ""
+    expires: str = ""     # DD.MM.YYYY, as shown to the user
+    number: int = 0       # Beta tester number (only for newly issued keys)
+
+
+def generate_beta_key(user_id: int, username: Optional[str]) -> str:
+    """Generate cryptographically signed beta key"""
+    if not NACL_AVAILABLE or not ED25519_PRIVATE_KEY_HEX:
+        raise RuntimeError("Crypto not configured")
+
+    return create_signed_beta_key(
+        user_id=user_id,
+        username=username,
+        beta_days=BETA_DAYS,
+        cohort=BETA_COHORT,
+        private_key_hex=ED25519_PRIVATE_KEY_HEX
+    )
+
+
+class JsonSlotBackend:
+    """Slots stored in beta_users.json through the in-memory user state"""
+
+    def reserve(self, user_id: int, username: Optional[str], first_name: str) -> IssueResult:
+        # Check, sign and commit under one lock. Signing happens before anything
+        # is changed, so a crypto error leaves the slot count untouched.
+        with user_store.transaction() as tx:
+            data = tx.data
+            existing = data["users"].get(str(user_id))
+            if existing:
+                return IssueResult(
+                    status="existing",
+                    key=existing["key"],
+                    discount=existing["discount"],
+                    expires=existing["expires"]
+                )
+
+            if data["keys_issued"] >= MAX_BETA_USERS:
+                return IssueResult(status="no_slots")
+
+            beta_key = generate_beta_key(user_id, username)
+            discount_code = generate_discount_code(user_id)
+            expires = (datetime.now() + timedelta(days=BETA_DAYS)).strftime(EXPIRES_FORMAT)
+
+            data["users"][str(user_id)] = {
+                "username": username,
+                "first_name": first_name,
+                "key": beta_key,
+                "discount": discount_code,
+                "expires": expires,
+                "issued_at": datetime.now().isoformat()
+            }
+            data["keys_issued"] += 1
+            tx.changed = True
+
+            return IssueResult(
+                status="issued",
+                key=beta_key,
+                discount=discount_code,
+                expires=expires,
+                number=data["keys_issued"]
+            )
+
+    def issued_count(self) -> int:
+        return user_store.get_keys_issued()
+
+
+class SupabaseSlotBackend:
+    """Slots stored in bot_beta_users, reserved by the reserve_beta_slot RPC"""
+
+    def reserve(self, user_id: int, username: Optional[str], first_name: str) -> IssueResult:
+        import supabase_client
+
+        existing = supabase_client.get_beta_user(user_id)
+        if existing:
+            return self._existing(user_id, existing["beta_key"], existing["expires_at"])
+
+        # Cheap pre-check so a full beta answers "no_slots" without needing
+        # signing to work; the RPC below still decides under its lock.
+        if supabase_client.count_beta_users() >= MAX_BETA_USERS:
+            return IssueResult(status="no_slots")
+
+        # The key is signed up front; if the slot is lost to a concurrent request
+        # it is simply discarded.
+        beta_key = generate_beta_key(user_id, username)
+        expires_at = datetime.now() + timedelta(days=BETA_DAYS)
+
+        row = supabase_client.reserve_beta_slot(
+            user_id=user_id,
+            username=username,
+            first_name=first_name,
+            beta_key=beta_key,
+            expires_at=expires_at,
+            max_users=MAX_BETA_USERS,
+            cohort=BETA_COHORT
+        )
+
+        if row["status"] == "no_slots":
+            return IssueResult(status="no_slots")
+        if row["status"] == "existing":
+            return self._existing(user_id, row["beta_key"], row["expires_at"])
+
+        return IssueResult(
+            status="issued",
+            key=beta_key,
+            discount=generate_discount_code(user_id),
+            expires=expires_at.strftime(EXPIRES_FORMAT),
+            number=row["slot_number"]
+        )
+
+    def issued_count(self) -> int:
+        import supabase_client
+        return supabase_client.count_beta_users()
+
+    @staticmethod
+    def _existing(user_id: int, beta_key: str, expires_at: str) -> IssueResult:
+        return IssueResult(
+            status="existing",
+            key=beta_key,
+            discount=generate_discount_code(user_id),
+            expires=datetime.fromisoformat(expires_at).strftime(EXPIRES_FORMAT)
+        )
+
+
+_backend = SupabaseSlotBackend() if BETA_USERS_BACKEND == "supabase" else JsonSlotBackend()
+
+
+def issue_beta_key(user_id: int, username: Optional[str], first_name: str) -> IssueResult:
+    """
+    Issue a beta key, or return the user's existing one.
+    Raises RuntimeError if signing is not configured.
+    """
+    return _backend.reserve(user_id, username, first_name)
+
+
+def get_keys_issued() -> int:
+    """Number of beta slots taken so far"""
+    return _backend.issued_count()
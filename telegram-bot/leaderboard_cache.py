@@ -0,0 +1,105 @@
+"""
+Top-K leaderboard cache shared by both donation backends
+The top `size` donors are fetched once and then kept current by folding each
+recorded donation in with heapq.nlargest over those K rows plus the changed
+donor, instead of re-sorting or re-fetching every donor. Totals only grow, so
+anyone outside the cache stays at or below its last row. A new total that
+ties a cached row is placed by the rank the backend reported for it (its
+tie rule); without one the cache is dropped and the next read refetches.
+Rows older than `ttl` seconds are refetched, for backends that other
+processes also write to.
+"""
+import heapq
+import threading
+import time
+from operator import itemgetter
+from typing import Callable, List, Optional
+
+# Returns the first `limit` donors in rank order, each with "id" and "total_stars"
+FetchTop = Callable[[int], List[dict]]
+
+
+class LeaderboardCache:
+    """Cached top-K rows with hit/miss counters"""
+
+    def __init__(self, fetch: FetchTop, size: int = 100, ttl: Optional[float] = None):
+        self.fetch = fetch
+        self.size = size
+        self.ttl = ttl  # None: only this process changes the data, rows never expire
+
+        self._lock = threading.Lock()
+        self._rows: Optional[List[dict]] = None
+        self._complete = False  # Fewer than `size` donors exist, so the rows are all of them
+        self._generation = 0    # Bumped by every change, so a fetch that raced one is not kept
+        self._fetched_at = 0.0  # time.monotonic() of the fetch the rows came from
+
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0        # Donations folded in place
+        self.invalidations = 0  # Donations or reloads that dropped the cache
+        self.expirations = 0    # Reads that found the rows older than ttl
+
+    def get(self, limit: int) -> List[dict]:
+        """First `limit` donors, served from the cache when it covers them"""
+        with self._lock:
+            if self._rows is not None and self.ttl is not None and time.monotonic() - self._fetched_at >= self.ttl:
+                self._rows = None
+                self.expirations += 1
+            if self._rows is not None and (limit <= self.size or self._complete):
+                self.hits += 1
+                return [dict(row) for row in self._rows[:limit]]
+            self.misses += 1
+            generation = self._generation
+
+        fetched_at = time.monotonic()
+        rows = self.fetch(max(limit, self.size))
+        with self._lock:
+            if generation == self._generation:
+                self._rows = [dict(row) for row in rows[:self.size]]
+                self._complete = len(rows) < max(limit, self.size)
+                self._fetched_at = fetched_at
+        return rows[:limit]
+
+    def record(self, donor: dict):
+        """Fold in a donor's new totals; `donor` is a leaderboard row (None fields keep the cached value)"""
+        with self._lock:
+            self._generation += 1
+            if self._rows is None:
+                return
+            cached = next((row for row in self._rows if row["id"] == donor["id"]), {})
+            donor = {**donor, **{k: v for k, v in cached.items() if donor.get(k) is None}}
+            others = [row for row in self._rows if row["id"] != donor["id"]]
+            if any(row["total_stars"] == donor["total_stars"] for row in others):
+                if not donor.get("rank"):
+                    self._rows = None
+                    self.invalidations += 1
+                    return
+                top = others[:donor["rank"] - 1] + [donor] + others[donor["rank"] - 1:]
+                top = top[:self.size]
+            else:
+                # nlargest is stable, so rows that did not change keep their order
+                top = heapq.nlargest(self.size, others + [donor], key=itemgetter("total_stars"))
+            for rank, row in enumerate(top, 1):
+                row["rank"] = rank
+            self._complete = self._complete and len(top) < self.size
+            self._rows = top
+            self.updates += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            if self._rows is not None:
+                self._rows = None
+                self.invalidations += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "updates": self.updates,
+                "invalidations": self.invalidations,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 2) if lookups else 0.0,
+            }
@@ -13,12 +13,16 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from supabase import create_client
+from activation_store import Activation
+from activation_tracker import get_all_key_activations
+from transaction_log import TransactionLog
 
 # Configuration
 DATA_DIR = Path(__file__).parent / "data"
 DONATIONS_FILE = DATA_DIR / "donations.json"
+DONATIONS_LOG_DIR = DATA_DIR / "donations"
 BETA_USERS_FILE = DATA_DIR / "beta_users.json"
-ACTIVATIONS_FILE = DATA_DIR / "activations.json"
+ACTIVATIONS_IMPORTED_FILE = DATA_DIR / "activations.json.imported"
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SECRET_KEY")
@@ -79,8 +83,10 @@ def migrate_donations():
         except Exception as e:
             print(f"  ✗ Failed to migrate donor {user_id}: {e}")
     
-    # Migrate transactions
-    transactions = data.get("transactions", [])
+    # Migrate transactions (older files kept the last ones inline)
+    transactions = data.get("transactions")
+    if transactions is None:
+        transactions = list(TransactionLog(DONATIONS_LOG_DIR).read())
     print(f"Found {len(transactions)} transactions to migrate")
     
     for tx in transactions:
@@ -162,33 +168,61 @@ def migrate_beta_users():
     print("Beta users migration complete!")
 
 
+def load_activations() -> list:
+    """
+    (user_id, key_id, Activation) for every stored activation.
+    The bot's activation store is the source of truth (it imports a legacy
+    activations.json when first opened); activations.json.imported is only
+    read when the store has nothing.
+    """
+    rows = [
+        (record.user_id, record.key_id, activation)
+        for record in get_all_key_activations()
+        for activation in record.activations.values()
+    ]
+    if rows or not ACTIVATIONS_IMPORTED_FILE.exists():
+        return rows
+    
+    print(f"Activation store is empty, reading {ACTIVATIONS_IMPORTED_FILE.name}")
+    with open(ACTIVATIONS_IMPORTED_FILE, "r") as f:
+        data = json.load(f)
+    return [
+        (record.get("user_id", 0), key_id, Activation(
+            a["machine_id"],
+            a.get("activated_at", ""),
+            a.get("app_version", ""),
+            a.get("os_version", ""),
+            a.get("last_seen") or a.get("activated_at", ""),
+        ))
+        for key_id, record in data.items()
+        for a in record.get("activations", [])
+    ]
+
+
 def migrate_activations():
-    """Migrate activations data from JSON to Supabase"""
-    if not ACTIVATIONS_FILE.exists():
-        print("No activations.json found, skipping activations migration")
+    """Migrate activations from the bot's activation store to Supabase"""
+    activations = load_activations()
+    if not activations:
+        print("No activations found, skipping activations migration")
         return
     
     print("Migrating activations...")
     
-    with open(ACTIVATIONS_FILE, "r") as f:
-        data = json.load(f)
-    
     supabase = get_supabase()
     
-    activations = data.get("activations", [])
     print(f"Found {len(activations)} activations to migrate")
     
-    for activation in activations:
+    for user_id, key_id, activation in activations:
         try:
             supabase.table('bot_activations').upsert({
-                'user_id': activation['user_id'],
-                'beta_key': activation['beta_key'],
-                'machine_id': activation['machine_id'],
-                'activated_at': activation.get('activated_at', datetime.now().isoformat()),
-                'last_seen': activation.get('last_seen'),
-                'is_active': activation.get('is_active', True),
+                'user_id': user_id,
+                'beta_key': key_id,
+                'machine_id': activation.machine_id,
+                'activated_at': activation.activated_at or datetime.now().isoformat(),
+                'last_seen': activation.last_seen or None,
+                'is_active': True,
             }).execute()
-            print(f"  ✓ Migrated activation for machine {activation['machine_id'][:8]}...")
+            print(f"  ✓ Migrated activation for machine {activation.machine_id[:8]}...")
         except Exception as e:
             print(f"  ✗ Failed to migrate activation: {e}")
     
@@ -0,0 +1,74 @@
+-- Weekly and monthly leaderboards for the Supabase backend (supabase_client.py).
+-- record_donation_once adds each new donation to the donor's row for the
+-- current ISO week ('2025-W07') and month ('2025-02'), one upsert per period,
+-- so a window is read from its own rows instead of scanning tma_transactions.
+-- Weeks and months are UTC, matching period_bounds() in donations.py.
+
+create table if not exists tma_period_donors (
+    period text not null,          -- 'week' | 'month'
+    bucket text not null,
+    user_id bigint not null,
+    total_stars bigint not null default 0,
+    total_usd numeric not null default 0,
+    donation_count integer not null default 0,
+    first_donation timestamptz not null default now(),
+    primary key (period, bucket, user_id)
+);
+
+create index if not exists tma_period_donors_ranking
+    on tma_period_donors (period, bucket, total_stars desc, first_donation);
+
+create or replace function period_bucket(p_period text, p_at timestamptz default now())
+returns text
+language plpgsql
+stable
+as $$
+begin
+    if p_period = 'week' then
+        return to_char(p_at at time zone 'utc', 'IYYY-"W"IW');
+    end if;
+    return to_char(p_at at time zone 'utc', 'YYYY-MM');
+end;
+$$;
+
+create or replace function add_period_donation(p_user_id bigint, p_stars_amount integer)
+returns void
+language plpgsql
+as $$
+declare
+    v_period text;
+begin
+    foreach v_period in array array['week', 'month'] loop
+        insert into tma_period_donors as d (period, bucket, user_id, total_stars, total_usd, donation_count)
+        values (v_period, period_bucket(v_period), p_user_id, p_stars_amount, p_stars_amount / 50.0, 1)
+        on conflict (period, bucket, user_id) do update
+            set total_stars = d.total_stars + excluded.total_stars,
+                total_usd = d.total_usd + excluded.total_usd,
+                donation_count = d.donation_count + 1;
+    end loop;
+end;
+$$;
+
+create or replace function get_period_leaderboard(p_period text, p_limit integer default 100)
+returns table (
+    rank bigint, user_id bigint, name text, username text, photo_url text,
+    total_stars bigint, total_usd numeric, donation_count integer
+)
+language sql
+stable
+as $$
+    select
+        row_number() over (order by d.total_stars desc, d.first_donation),
+        d.user_id,
+        trim(coalesce(u.first_name, '') || ' ' || coalesce(u.last_name, '')),
+        u.username,
+        u.photo_url,
+        d.total_stars,
+        d.total_usd,
+        d.donation_count
+    from tma_period_donors d
+    left join telegram_users u on u.id = d.user_id
+    where d.period = p_period and d.bucket = period_bucket(p_period)
+    order by d.total_stars desc, d.first_donation
+    limit p_limit;
+$$;
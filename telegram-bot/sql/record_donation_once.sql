@@ -0,0 +1,48 @@
+-- Idempotent donation recording for the Supabase backend (supabase_client.py).
+-- Telegram may deliver successful_payment more than once. The charge id is
+-- looked up through a unique index before record_donation runs, under a
+-- per-charge advisory lock, so a redelivered payment is never counted twice
+-- and simply returns the donor's current standing.
+
+create unique index if not exists tma_transactions_charge_id_key
+    on tma_transactions (charge_id);
+
+create or replace function record_donation_once(
+    p_user_id bigint,
+    p_username text,
+    p_first_name text,
+    p_last_name text,
+    p_photo_url text,
+    p_stars_amount integer,
+    p_charge_id text
+)
+returns table (total_stars bigint, total_usd numeric, donation_count integer, rank bigint, duplicate boolean)
+language plpgsql
+as $$
+begin
+    perform pg_advisory_xact_lock(hashtext('tma_transactions:' || p_charge_id));
+
+    if exists (select 1 from tma_transactions t where t.charge_id = p_charge_id) then
+        return query
+        select l.total_stars::bigint, l.total_usd::numeric, l.donation_count::integer, l.rank::bigint, true
+        from tma_leaderboard l
+        where l.user_id = (select t.user_id from tma_transactions t where t.charge_id = p_charge_id);
+        return;
+    end if;
+
+    -- Weekly / monthly buckets, see period_leaderboards.sql
+    perform add_period_donation(p_user_id, p_stars_amount);
+
+    return query
+    select r.total_stars::bigint, r.total_usd::numeric, r.donation_count::integer, r.rank::bigint, false
+    from record_donation(
+        p_user_id => p_user_id,
+        p_username => p_username,
+        p_first_name => p_first_name,
+        p_last_name => p_last_name,
+        p_photo_url => p_photo_url,
+        p_stars_amount => p_stars_amount,
+        p_charge_id => p_charge_id
+    ) r;
+end;
+$$;
@@ -0,0 +1,33 @@
+-- Stale machine release for the Supabase backend (supabase_client.py).
+-- The partial index keeps active activations ordered by last_seen, so the
+-- function walks only the expired head of the index instead of scanning
+-- bot_activations, and frees those machine slots.
+
+create index if not exists bot_activations_active_last_seen
+    on bot_activations (last_seen)
+    where is_active;
+
+create or replace function release_stale_activations(
+    p_cutoff timestamptz,
+    p_limit integer default 1000
+)
+returns table (beta_key text, machine_id text)
+language plpgsql
+as $$
+begin
+    return query
+    update bot_activations a
+    set is_active = false
+    from (
+        select s.beta_key, s.machine_id
+        from bot_activations s
+        where s.is_active and s.last_seen < p_cutoff
+        order by s.last_seen
+        limit p_limit
+        for update skip locked
+    ) stale
+    where a.beta_key = stale.beta_key
+      and a.machine_id = stale.machine_id
+    returning a.beta_key, a.machine_id;
+end;
+$$;
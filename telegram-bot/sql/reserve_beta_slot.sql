@@ -0,0 +1,49 @@
+-- Atomic beta slot reservation for the Supabase backend (key_issuance.py).
+-- The count check and the insert run under one transaction-scoped advisory
+-- lock, so concurrent /key requests can never push bot_beta_users past
+-- p_max_users, and a repeated request from the same user returns its
+-- existing key instead of taking a second slot.
+
+create or replace function reserve_beta_slot(
+    p_user_id bigint,
+    p_username text,
+    p_first_name text,
+    p_beta_key text,
+    p_cohort text,
+    p_expires_at timestamptz,
+    p_max_users integer
+)
+returns table (status text, beta_key text, expires_at timestamptz, slot_number integer)
+language plpgsql
+as $$
+declare
+    v_existing bot_beta_users%rowtype;
+    v_count integer;
+begin
+    perform pg_advisory_xact_lock(hashtext('bot_beta_users:reserve'));
+
+    select * into v_existing from bot_beta_users b where b.user_id = p_user_id;
+    if found then
+        return query select 'existing'::text, v_existing.beta_key, v_existing.expires_at, 0;
+        return;
+    end if;
+
+    select count(*) into v_count from bot_beta_users;
+    if v_count >= p_max_users then
+        return query select 'no_slots'::text, null::text, null::timestamptz, v_count;
+        return;
+    end if;
+
+    insert into telegram_users (id, username, first_name, updated_at)
+    values (p_user_id, p_username, p_first_name, now())
+    on conflict (id) do update
+        set username = excluded.username,
+            first_name = excluded.first_name,
+            updated_at = now();
+
+    insert into bot_beta_users (user_id, beta_key, cohort, expires_at, is_active)
+    values (p_user_id, p_beta_key, p_cohort, p_expires_at, true);
+
+    return query select 'issued'::text, p_beta_key, p_expires_at, v_count + 1;
+end;
+$$;
@@ -0,0 +1,24 @@
+-- Batched last_seen updates for activation heartbeats (supabase_client.py).
+-- Receives the coalesced buffer as a JSON array of
+-- {"beta_key", "machine_id", "last_seen"} and applies it in one statement.
+-- Only existing activations are touched, and a late batch never moves
+-- last_seen backwards.
+
+create or replace function touch_activations(p_heartbeats jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+    v_updated integer;
+begin
+    update bot_activations a
+    set last_seen = h.last_seen
+    from jsonb_to_recordset(p_heartbeats) as h(beta_key text, machine_id text, last_seen timestamptz)
+    where a.beta_key = h.beta_key
+      and a.machine_id = h.machine_id
+      and (a.last_seen is null or a.last_seen < h.last_seen);
+
+    get diagnostics v_updated = row_count;
+    return v_updated;
+end;
+$$;
@@ -3,15 +3,27 @@ Supabase client for Relay Bot
 Handles database operations for donations and beta users
 """
 
+import atexit
 import os
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
 from supabase import create_client, Client
 
+from heartbeats import HeartbeatCoalescer
+from leaderboard_cache import LeaderboardCache
+
 # Supabase configuration
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://dlavobqpdoclrrpipoaj.supabase.co")
 SUPABASE_KEY = os.environ.get("SUPABASE_SECRET_KEY", "")
 
+# Activation heartbeats are written in batches (see heartbeats.py)
+HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get("RELAY_HEARTBEAT_FLUSH_INTERVAL", 30))
+HEARTBEAT_BUFFER_SIZE = int(os.environ.get("RELAY_HEARTBEAT_BUFFER_SIZE", 5000))
+
+# The web app, migrations and SQL fixes write donations too; the cached top
+# donors are refetched once they are this many seconds old
+LEADERBOARD_CACHE_TTL = float(os.environ.get("RELAY_LEADERBOARD_CACHE_TTL", 60))
+
 _supabase_client: Optional[Client] = None
 
 
@@ -40,11 +52,13 @@ def record_donation(
 ) -> dict:
     """
     Record a successful donation using Supabase RPC function
+    (record_donation_once, see sql/record_donation_once.sql: a repeated
+    charge_id is a no-op that returns the donor's current standing)
     Returns donor info with updated rank
     """
     supabase = get_supabase()
     
-    result = supabase.rpc('record_donation', {
+    result = supabase.rpc('record_donation_once', {
         'p_user_id': user_id,
         'p_username': username,
         'p_first_name': first_name,
@@ -56,6 +70,17 @@ def record_donation(
     
     if result.data:
         row = result.data[0]
+        if not row['duplicate']:
+            name = f"{first_name} {last_name}".strip() if last_name else first_name
+            _leaderboard.record({
+                "rank": row['rank'],
+                "id": user_id,
+                "name": name,
+                "username": username,
+                "photo_url": photo_url,
+                "total_stars": row['total_stars'],
+                "total_usd": float(row['total_usd']),
+            })
         return {
             "donor": {
                 "total_stars": row['total_stars'],
@@ -63,13 +88,13 @@ def record_donation(
                 "donation_count": row['donation_count'],
             },
             "rank": row['rank'],
+            "duplicate": row['duplicate'],
         }
     
     raise Exception("Failed to record donation")
 
 
-def get_leaderboard(limit: int = 100) -> list:
-    """Get top donors for leaderboard"""
+def _fetch_leaderboard(limit: int) -> list:
     supabase = get_supabase()
     
     result = supabase.rpc('get_leaderboard', {
@@ -91,6 +116,64 @@ def get_leaderboard(limit: int = 100) -> list:
     ]
 
 
+_leaderboard = LeaderboardCache(_fetch_leaderboard, size=100, ttl=LEADERBOARD_CACHE_TTL)
+
+
+def get_leaderboard(limit: int = 100) -> list:
+    """Get top donors for leaderboard (served from the top-K cache)"""
+    return _leaderboard.get(limit)
+
+
+def get_period_leaderboard(period: str, limit: int = 100) -> list:
+    """Get top donors of the current "week" or "month" (see sql/period_leaderboards.sql)"""
+    supabase = get_supabase()
+    
+    result = supabase.rpc('get_period_leaderboard', {
+        'p_period': period,
+        'p_limit': limit
+    }).execute()
+    
+    return [
+        {
+            "rank": row['rank'],
+            "id": row['user_id'],
+            "name": row['name'],
+            "username": row['username'],
+            "photo_url": row['photo_url'],
+            "total_stars": row['total_stars'],
+            "total_usd": float(row['total_usd']),
+            "donation_count": row['donation_count'],
+        }
+        for row in (result.data or [])
+    ]
+
+
+def get_leaderboard_cache_stats() -> dict:
+    """Hit/miss counters of the top-K leaderboard cache"""
+    return _leaderboard.metrics()
+
+
+def iter_donor_ids(page_size: int = 1000) -> Iterator[int]:
+    """Yield the Telegram ID of every donor, fetching one page at a time"""
+    supabase = get_supabase()
+    
+    offset = 0
+    while True:
+        result = (
+            supabase.table('tma_donors')
+            .select('user_id')
+            .order('user_id')
+            .range(offset, offset + page_size - 1)
+            .execute()
+        )
+        rows = result.data or []
+        for row in rows:
+            yield row['user_id']
+        if len(rows) < page_size:
+            return
+        offset += page_size
+
+
 def get_donation_stats() -> dict:
     """Get overall donation statistics"""
     supabase = get_supabase()
@@ -212,6 +295,47 @@ def create_beta_user(
     return result.data[0] if result.data else {}
 
 
+def reserve_beta_slot(
+    user_id: int,
+    username: Optional[str],
+    first_name: str,
+    beta_key: str,
+    expires_at: datetime,
+    max_users: int,
+    cohort: str = "beta-jan-2026"
+) -> dict:
+    """
+    Atomically reserve a beta slot using Supabase RPC function
+    (see sql/reserve_beta_slot.sql).
+    Returns {"status": "issued" | "existing" | "no_slots", "beta_key", "expires_at", "slot_number"}
+    """
+    supabase = get_supabase()
+    
+    result = supabase.rpc('reserve_beta_slot', {
+        'p_user_id': user_id,
+        'p_username': username,
+        'p_first_name': first_name,
+        'p_beta_key': beta_key,
+        'p_cohort': cohort,
+        'p_expires_at': expires_at.isoformat(),
+        'p_max_users': max_users,
+    }).execute()
+    
+    if result.data:
+        return result.data[0]
+    
+    raise Exception("Failed to reserve beta slot")
+
+
+def count_beta_users() -> int:
+    """Count all issued beta slots (active or not)"""
+    supabase = get_supabase()
+    
+    result = supabase.table('bot_beta_users').select('user_id', count='exact').execute()
+    
+    return result.count or 0
+
+
 def get_beta_user(user_id: int) -> Optional[dict]:
     """Get beta user by Telegram user ID"""
     supabase = get_supabase()
@@ -259,6 +383,22 @@ def get_activations_for_key(beta_key: str) -> list:
     return result.data or []
 
 
+def release_stale_activations(ttl_days: int, limit: int = 1000) -> list:
+    """
+    Free machine slots not seen for ttl_days (see sql/release_stale_activations.sql).
+    Returns [{"beta_key", "machine_id"}] for every released activation.
+    """
+    supabase = get_supabase()
+    
+    cutoff = datetime.now() - timedelta(days=ttl_days)
+    result = supabase.rpc('release_stale_activations', {
+        'p_cutoff': cutoff.isoformat(),
+        'p_limit': limit,
+    }).execute()
+    
+    return result.data or []
+
+
 def count_active_beta_users() -> int:
     """Count total active beta users"""
     supabase = get_supabase()
@@ -277,10 +417,35 @@ def deactivate_beta_user(user_id: int):
     }).eq('user_id', user_id).execute()
 
 
-def update_activation_last_seen(beta_key: str, machine_id: str):
-    """Update last seen timestamp for an activation"""
+def _write_heartbeats(batch: list):
+    """Apply buffered last_seen values in one round trip (see sql/touch_activations.sql)"""
     supabase = get_supabase()
     
-    supabase.table('bot_activations').update({
-        'last_seen': datetime.now().isoformat()
-    }).eq('beta_key', beta_key).eq('machine_id', machine_id).execute()
+    supabase.rpc('touch_activations', {
+        'p_heartbeats': [
+            {'beta_key': beta_key, 'machine_id': machine_id, 'last_seen': last_seen}
+            for beta_key, machine_id, last_seen in batch
+        ],
+    }).execute()
+
+
+_heartbeats = HeartbeatCoalescer(_write_heartbeats, HEARTBEAT_FLUSH_INTERVAL, HEARTBEAT_BUFFER_SIZE)
+atexit.register(_heartbeats.flush)
+
+
+def update_activation_last_seen(beta_key: str, machine_id: str):
+    """
+    Update last seen timestamp for an activation.
+    Buffered: the write happens with the next batch flush.
+    """
+    _heartbeats.record(beta_key, machine_id)
+
+
+def flush_activation_heartbeats() -> int:
+    """Write buffered heartbeats now (e.g. before shutdown)"""
+    return _heartbeats.flush()
+
+
+def get_heartbeat_metrics() -> dict:
+    """Heartbeats received vs rows written, and the resulting coalescing ratio"""
+    return _heartbeats.metrics()
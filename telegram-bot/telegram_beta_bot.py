@@ -16,53 +16,43 @@ Telegram бот для выдачи бета-ключей Relay
   python telegram_beta_bot.py
 """
 
+import asyncio
+import hashlib
 import json
-import threading
-import os
-from datetime import datetime, timedelta
+import signal
 from pathlib import Path
-from http.server import HTTPServer, BaseHTTPRequestHandler
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, LabeledPrice
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, PreCheckoutQueryHandler, ContextTypes, filters
-
-
-# === KEEP-ALIVE SERVER ===
-class HealthHandler(BaseHTTPRequestHandler):
-    """Simple health check endpoint to prevent sleep"""
-    def do_GET(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(b'OK')
-    
-    def log_message(self, format, *args):
-        pass  # Suppress logs
-
-
-def start_health_server():
-    """Start health check server in background thread"""
-    port = int(os.environ.get('PORT', 8080))
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    print(f"   Health server: http://0.0.0.0:{port}")
+from telegram.error import TelegramError
 
 from config import (
-    BOT_TOKEN, ADMIN_IDS, BETA_DAYS, BETA_COHORT,
-    MAX_BETA_USERS, DATA_DIR, DATA_FILE, ED25519_PRIVATE_KEY_HEX,
+    BOT_TOKEN, ADMIN_IDS, BETA_DAYS,
+    MAX_BETA_USERS, ED25519_PRIVATE_KEY_HEX,
     MAX_ACTIVATIONS_PER_KEY, TMA_URL, TMA_WEB_URL, DONATION_GOAL_STARS, STARS_PER_DOLLAR,
-    DONATION_PRESETS_USD, DONATION_MILESTONES
+    DONATION_PRESETS_USD, DONATION_MILESTONES,
+    PORT, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    ACTIVATION_TTL_DAYS, ACTIVATION_RELEASE_INTERVAL
+)
+from crypto import NACL_AVAILABLE
+from activation_tracker import (
+    get_activation_stats, get_machine_keys, get_key_activations, on_machine_alert, release_stale_activations
 )
-from crypto import create_signed_beta_key, generate_discount_code, NACL_AVAILABLE
-from activation_tracker import get_activation_stats
+from user_store import load_data, get_user_lang, set_user_lang
+from key_issuance import issue_beta_key, get_keys_issued
+from broadcaster import Broadcaster
+from http_server import HTTPServer, Request, Response
+from update_poller import poll_updates
+import activation_api
 
 # Use Supabase for donations if available, fallback to JSON
 USE_SUPABASE = True
 try:
     from supabase_client import (
         record_donation, get_donation_stats, get_leaderboard,
-        get_last_milestone, set_last_milestone
+        get_last_milestone, set_last_milestone, iter_donor_ids,
+        get_leaderboard_cache_stats, get_period_leaderboard,
+        get_heartbeat_metrics
     )
     print("✅ Using Supabase for donations")
 except ImportError as e:
@@ -70,9 +60,12 @@ except ImportError as e:
     USE_SUPABASE = False
     from donations import (
         record_donation, get_donation_stats, get_leaderboard,
-        get_last_milestone, set_last_milestone
+        get_last_milestone, set_last_milestone, iter_donor_ids,
+        get_leaderboard_cache_stats, get_period_leaderboard
     )
 
+broadcaster = Broadcaster()
+
 # Cached file_id for gif (set after first upload)
 GIF_FILE_ID = None
 GIF_PATH = Path(__file__).parent / "relaywebdemo.mp4"  # Use mp4, much smaller than gif
@@ -175,6 +168,11 @@ TEXTS = {
                          "⭐ {current} / {goal} Stars (~${current_usd} / ${goal_usd})\n\n"
                          "👥 Total donors: {donors}\n\n"
                          "Every star counts! Use /donate to support.",
+        "top_week": "🏆 Top donors this week",
+        "top_month": "🏆 Top donors this month",
+        "top_all": "🏆 Top donors of all time",
+        "top_empty": "No donations yet. Be the first: /donate",
+        "top_usage": "Usage: /top [week|month|all]",
     },
     "ru": {
         "welcome": "Привет! 👋\n\n"
@@ -272,52 +270,146 @@ TEXTS = {
                          "⭐ {current} / {goal} Stars (~${current_usd} / ${goal_usd})\n\n"
                          "👥 Всего донатеров: {donors}\n\n"
                          "Каждая звезда на счету! Используй /donate для поддержки.",
+        "top_week": "🏆 Топ донатеров недели",
+        "top_month": "🏆 Топ донатеров месяца",
+        "top_all": "🏆 Топ донатеров за всё время",
+        "top_empty": "Донатов пока нет. Стань первым: /donate",
+        "top_usage": "Использование: /top [week|month|all]",
     }
 }
 
-# === ХРАНИЛИЩЕ ===
-def ensure_data_dir():
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def load_data():
-    ensure_data_dir()
-    if DATA_FILE.exists():
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    return {"users": {}, "keys_issued": 0, "user_langs": {}}
+# English strings fill the gaps up front, so a lookup is a single dict access
+CATALOGS = {lang: {**TEXTS["en"], **texts} for lang, texts in TEXTS.items()}
 
-def save_data(data):
-    ensure_data_dir()
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
 
-def get_user_lang(user_id: int) -> str:
-    data = load_data()
-    return data.get("user_langs", {}).get(str(user_id), None)
+class Translator:
+    """Strings for one user with the language resolved once per update"""
+    __slots__ = ("lang", "_catalog")
+    
+    def __init__(self, lang: str):
+        self.lang = lang if lang in CATALOGS else "en"
+        self._catalog = CATALOGS[self.lang]
+    
+    def __call__(self, key: str) -> str:
+        return self._catalog.get(key, key)
 
-def set_user_lang(user_id: int, lang: str):
-    data = load_data()
-    if "user_langs" not in data:
-        data["user_langs"] = {}
-    data["user_langs"][str(user_id)] = lang
-    save_data(data)
-
-def t(user_id: int, key: str) -> str:
-    lang = get_user_lang(user_id) or "en"
-    return TEXTS[lang].get(key, TEXTS["en"].get(key, key))
-
-# === ГЕНЕРАЦИЯ КЛЮЧЕЙ ===
-def generate_beta_key(user_id: int, username: str) -> str:
-    """Generate cryptographically signed beta key"""
-    if not NACL_AVAILABLE or not ED25519_PRIVATE_KEY_HEX:
-        raise RuntimeError("Crypto not configured")
-    
-    return create_signed_beta_key(
-        user_id=user_id,
-        username=username,
-        beta_days=BETA_DAYS,
-        cohort=BETA_COHORT,
-        private_key_hex=ED25519_PRIVATE_KEY_HEX
+
+_TRANSLATORS = {lang: Translator(lang) for lang in CATALOGS}
+
+
+def get_translator(user_id: int) -> Translator:
+    return _TRANSLATORS.get(get_user_lang(user_id) or "en", _TRANSLATORS["en"])
+
+# === КЛАВИАТУРЫ ===
+COMMUNITY_URL = "https://t.me/+uNNdBeFK2wQzOWNi"
+
+LANG_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🇬🇧 English", callback_data="lang_en"),
+        InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru"),
+    ]
+])
+
+# Markups are immutable, so each one is built once per language and shared.
+# The cache is dropped whenever the config values the markups depend on change.
+_markup_cache: dict = {}
+_markup_cache_config: tuple = ()
+
+
+def _markup_config() -> tuple:
+    return (tuple(DONATION_PRESETS_USD), STARS_PER_DOLLAR, TMA_WEB_URL, COMMUNITY_URL)
+
+
+def clear_markup_cache():
+    """Forget all cached markups (call after editing TEXTS at runtime)"""
+    global _markup_cache_config
+    _markup_cache.clear()
+    _markup_cache_config = _markup_config()
+
+
+def _cached_markup(name: str, tr: Translator, build) -> InlineKeyboardMarkup:
+    if _markup_cache_config != _markup_config():
+        clear_markup_cache()
+    key = (name, tr.lang)
+    markup = _markup_cache.get(key)
+    if markup is None:
+        markup = _markup_cache[key] = build(tr)
+    return markup
+
+
+def _build_main_menu(tr: Translator) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(tr("get_key_btn"), callback_data="get_key")],
+        [InlineKeyboardButton(tr("about_btn"), callback_data="about")],
+        [InlineKeyboardButton(tr("support_btn"), callback_data="support")],
+        [InlineKeyboardButton(tr("community_btn"), url=COMMUNITY_URL)],
+    ])
+
+
+def _build_about(tr: Translator) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(tr("get_key_btn"), callback_data="get_key")],
+        [InlineKeyboardButton(tr("back_btn"), callback_data="back_to_main")],
+    ])
+
+
+def _build_donate_menu(tr: Translator) -> InlineKeyboardMarkup:
+    # Preset amounts first, then custom amount, leaderboard and back
+    keyboard = []
+    for usd in DONATION_PRESETS_USD:
+        stars = int(usd * STARS_PER_DOLLAR)
+        btn_text = tr("donate_btn_preset").format(amount=usd, stars=stars)
+        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"donate_{usd}")])
+    
+    keyboard.append([InlineKeyboardButton(tr("donate_btn_custom"), callback_data="donate_custom")])
+    keyboard.append([InlineKeyboardButton(tr("donate_btn_leaderboard"), web_app=WebAppInfo(url=f"{TMA_WEB_URL}/leaderboard"))])
+    keyboard.append([InlineKeyboardButton(tr("donate_btn_back"), callback_data="back_to_main")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def _build_donate_cancel(tr: Translator) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton(tr("donate_btn_back"), callback_data="donate_cancel")]])
+
+
+def main_menu_markup(tr: Translator) -> InlineKeyboardMarkup:
+    return _cached_markup("main_menu", tr, _build_main_menu)
+
+
+def about_markup(tr: Translator) -> InlineKeyboardMarkup:
+    return _cached_markup("about", tr, _build_about)
+
+
+def donate_menu_markup(tr: Translator) -> InlineKeyboardMarkup:
+    return _cached_markup("donate_menu", tr, _build_donate_menu)
+
+
+def donate_cancel_markup(tr: Translator) -> InlineKeyboardMarkup:
+    return _cached_markup("donate_cancel", tr, _build_donate_cancel)
+
+# === ВЫДАЧА КЛЮЧЕЙ ===
+def key_reply_text(user, tr: Translator) -> str:
+    """Issue (or look up) the user's key and render the reply"""
+    try:
+        result = issue_beta_key(user.id, user.username, user.first_name)
+    except RuntimeError:
+        return tr("crypto_error")
+    
+    if result.status == "no_slots":
+        return tr("no_slots")
+    
+    if result.status == "existing":
+        return tr("already_have").format(
+            key=result.key,
+            expires=result.expires,
+            discount=result.discount
+        )
+    
+    return tr("new_key").format(
+        num=result.number,
+        key=result.key,
+        expires=result.expires,
+        discount=result.discount
     )
 
 # === КОМАНДЫ БОТА ===
@@ -329,17 +421,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_main_menu(update, context)
         return
     
-    keyboard = [
-        [
-            InlineKeyboardButton("🇬🇧 English", callback_data="lang_en"),
-            InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         "🌍 Choose your language / Выбери язык:",
-        reply_markup=reply_markup
+        reply_markup=LANG_MARKUP
     )
 
 async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -351,14 +435,9 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     lang = query.data.replace("lang_", "")
     set_user_lang(user_id, lang)
+    tr = get_translator(user_id)
     
-    keyboard = [
-        [InlineKeyboardButton(t(user_id, "get_key_btn"), callback_data="get_key")],
-        [InlineKeyboardButton(t(user_id, "about_btn"), callback_data="about")],
-        [InlineKeyboardButton(t(user_id, "support_btn"), callback_data="support")],
-        [InlineKeyboardButton(t(user_id, "community_btn"), url="https://t.me/+uNNdBeFK2wQzOWNi")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = main_menu_markup(tr)
     
     # Delete language selection message
     await query.message.delete()
@@ -368,7 +447,7 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
         msg = await context.bot.send_animation(
             chat_id=query.message.chat_id,
             animation=GIF_FILE_ID,
-            caption=t(user_id, "welcome"),
+            caption=tr("welcome"),
             reply_markup=reply_markup
         )
     elif GIF_PATH.exists():
@@ -376,7 +455,7 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
             msg = await context.bot.send_animation(
                 chat_id=query.message.chat_id,
                 animation=gif_file,
-                caption=t(user_id, "welcome"),
+                caption=tr("welcome"),
                 reply_markup=reply_markup
             )
             # Cache file_id for future use
@@ -386,7 +465,7 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Fallback to text if no gif
         await context.bot.send_message(
             chat_id=query.message.chat_id,
-            text=t(user_id, "welcome"),
+            text=tr("welcome"),
             reply_markup=reply_markup
         )
 
@@ -394,34 +473,29 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показ главного меню"""
     global GIF_FILE_ID
     user_id = update.effective_user.id
+    tr = get_translator(user_id)
     
-    keyboard = [
-        [InlineKeyboardButton(t(user_id, "get_key_btn"), callback_data="get_key")],
-        [InlineKeyboardButton(t(user_id, "about_btn"), callback_data="about")],
-        [InlineKeyboardButton(t(user_id, "support_btn"), callback_data="support")],
-        [InlineKeyboardButton(t(user_id, "community_btn"), url="https://t.me/+uNNdBeFK2wQzOWNi")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = main_menu_markup(tr)
     
     # Send gif - use cached file_id or upload from disk
     if GIF_FILE_ID:
         await update.message.reply_animation(
             animation=GIF_FILE_ID,
-            caption=t(user_id, "welcome"),
+            caption=tr("welcome"),
             reply_markup=reply_markup
         )
     elif GIF_PATH.exists():
         with open(GIF_PATH, "rb") as gif_file:
             msg = await update.message.reply_animation(
                 animation=gif_file,
-                caption=t(user_id, "welcome"),
+                caption=tr("welcome"),
                 reply_markup=reply_markup
             )
             if msg.animation:
                 GIF_FILE_ID = msg.animation.file_id
     else:
         await update.message.reply_text(
-            t(user_id, "welcome"),
+            tr("welcome"),
             reply_markup=reply_markup
         )
 
@@ -431,17 +505,14 @@ async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
+    tr = get_translator(user_id)
     
-    keyboard = [
-        [InlineKeyboardButton(t(user_id, "get_key_btn"), callback_data="get_key")],
-        [InlineKeyboardButton(t(user_id, "back_btn"), callback_data="back_to_main")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = about_markup(tr)
     
     # Edit caption of the gif message
     try:
         await query.edit_message_caption(
-            caption=t(user_id, "about"),
+            caption=tr("about"),
             parse_mode="Markdown",
             reply_markup=reply_markup
         )
@@ -449,7 +520,7 @@ async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Fallback: send new message if edit fails
         await context.bot.send_message(
             chat_id=query.message.chat_id,
-            text=t(user_id, "about"),
+            text=tr("about"),
             parse_mode="Markdown",
             reply_markup=reply_markup
         )
@@ -460,24 +531,19 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
+    tr = get_translator(user_id)
     
-    keyboard = [
-        [InlineKeyboardButton(t(user_id, "get_key_btn"), callback_data="get_key")],
-        [InlineKeyboardButton(t(user_id, "about_btn"), callback_data="about")],
-        [InlineKeyboardButton(t(user_id, "support_btn"), callback_data="support")],
-        [InlineKeyboardButton(t(user_id, "community_btn"), url="https://t.me/+uNNdBeFK2wQzOWNi")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = main_menu_markup(tr)
     
     # Edit caption of the gif message
     try:
         await query.edit_message_caption(
-            caption=t(user_id, "welcome"),
+            caption=tr("welcome"),
             reply_markup=reply_markup
         )
     except Exception:
         await query.edit_message_text(
-            t(user_id, "welcome"),
+            tr("welcome"),
             reply_markup=reply_markup
         )
 
@@ -501,27 +567,16 @@ def make_progress_bar(current: int, goal: int, length: int = 10) -> str:
 
 async def show_donate_menu(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE):
     """Show donation menu with preset amounts"""
+    tr = get_translator(user_id)
     stats = get_donation_stats()
     current = stats["total_stars"]
     goal = DONATION_GOAL_STARS
     percent = int(min(current / goal * 100, 100)) if goal > 0 else 0
     progress_bar = make_progress_bar(current, goal)
     
-    # Build keyboard with preset amounts
-    keyboard = []
-    for usd in DONATION_PRESETS_USD:
-        stars = int(usd * STARS_PER_DOLLAR)
-        btn_text = t(user_id, "donate_btn_preset").format(amount=usd, stars=stars)
-        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"donate_{usd}")])
-    
-    # Add custom amount and leaderboard buttons
-    keyboard.append([InlineKeyboardButton(t(user_id, "donate_btn_custom"), callback_data="donate_custom")])
-    keyboard.append([InlineKeyboardButton(t(user_id, "donate_btn_leaderboard"), web_app=WebAppInfo(url=f"{TMA_WEB_URL}/leaderboard"))])
-    keyboard.append([InlineKeyboardButton(t(user_id, "donate_btn_back"), callback_data="back_to_main")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = donate_menu_markup(tr)
     
-    text = t(user_id, "donate_menu").format(
+    text = tr("donate_menu").format(
         progress_bar=progress_bar,
         percent=percent,
         current=current,
@@ -571,16 +626,16 @@ async def donate_custom_callback(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     
     user_id = query.from_user.id
+    tr = get_translator(user_id)
     
     # Set state to wait for custom amount
     context.user_data["awaiting_custom_donation"] = True
     
-    keyboard = [[InlineKeyboardButton(t(user_id, "donate_btn_back"), callback_data="donate_cancel")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = donate_cancel_markup(tr)
     
     await context.bot.send_message(
         chat_id=query.message.chat_id,
-        text=t(user_id, "donate_custom_prompt"),
+        text=tr("donate_custom_prompt"),
         parse_mode="Markdown",
         reply_markup=reply_markup
     )
@@ -603,6 +658,7 @@ async def handle_custom_donation_amount(update: Update, context: ContextTypes.DE
         return
     
     user_id = update.effective_user.id
+    tr = get_translator(user_id)
     text = update.message.text.strip().replace("$", "").replace(",", ".")
     
     try:
@@ -611,7 +667,7 @@ async def handle_custom_donation_amount(update: Update, context: ContextTypes.DE
             raise ValueError("Amount out of range")
     except ValueError:
         await update.message.reply_text(
-            t(user_id, "donate_custom_invalid"),
+            tr("donate_custom_invalid"),
             parse_mode="Markdown"
         )
         return
@@ -624,6 +680,7 @@ async def handle_custom_donation_amount(update: Update, context: ContextTypes.DE
 
 async def create_and_send_invoice(chat_id: int, user_id: int, stars_amount: int, usd_amount: float, context: ContextTypes.DEFAULT_TYPE):
     """Create invoice link and send payment button with Pay in App option"""
+    tr = get_translator(user_id)
     import json
     
     payload = json.dumps({
@@ -636,8 +693,8 @@ async def create_and_send_invoice(chat_id: int, user_id: int, stars_amount: int,
     try:
         # Create invoice link using Bot API
         invoice_link = await context.bot.create_invoice_link(
-            title=t(user_id, "donate_invoice_title"),
-            description=t(user_id, "donate_invoice_desc"),
+            title=tr("donate_invoice_title"),
+            description=tr("donate_invoice_desc"),
             payload=payload,
             currency="XTR",  # Telegram Stars
             prices=[LabeledPrice(label="Donation", amount=stars_amount)],
@@ -684,6 +741,7 @@ async def goal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if not get_user_lang(user_id):
         set_user_lang(user_id, "en")
+    tr = get_translator(user_id)
     
     stats = get_donation_stats()
     current = stats["total_stars"]
@@ -694,7 +752,7 @@ async def goal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     current_usd = current / STARS_PER_DOLLAR
     goal_usd = goal / STARS_PER_DOLLAR
     
-    text = t(user_id, "goal_progress").format(
+    text = tr("goal_progress").format(
         progress_bar=progress_bar,
         percent=percent,
         current=current,
@@ -707,8 +765,33 @@ async def goal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text, parse_mode="Markdown")
 
 
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Command /top [week|month|all] - top donors, this week by default"""
+    user_id = update.effective_user.id
+    
+    if not get_user_lang(user_id):
+        set_user_lang(user_id, "en")
+    tr = get_translator(user_id)
+    
+    period = context.args[0].lower() if context.args else "week"
+    if period not in ("week", "month", "all"):
+        await update.message.reply_text(tr("top_usage"))
+        return
+    
+    top = get_leaderboard(limit=10) if period == "all" else get_period_leaderboard(period, limit=10)
+    if not top:
+        await update.message.reply_text(tr("top_empty"))
+        return
+    
+    lines = [f"{d['rank']}. {d['name']} — ⭐{d['total_stars']}" for d in top]
+    await update.message.reply_text(tr(f"top_{period}") + "\n\n" + "\n".join(lines))
+
+
 async def check_and_notify_milestone(stars_amount: int, context: ContextTypes.DEFAULT_TYPE):
-    """Check if a milestone was reached and notify all donors"""
+    """
+    Check if a milestone was reached and queue notifications for all donors.
+    Delivery runs in the background so the paying user's update isn't held up.
+    """
     stats = get_donation_stats()
     current = stats["total_stars"]
     last_milestone = get_last_milestone()
@@ -720,24 +803,28 @@ async def check_and_notify_milestone(stars_amount: int, context: ContextTypes.DE
             
             percent = int(min(current / DONATION_GOAL_STARS * 100, 100))
             progress_bar = make_progress_bar(current, DONATION_GOAL_STARS)
+            texts = {
+                lang: catalog["milestone_reached"].format(
+                    milestone=milestone,
+                    progress_bar=progress_bar,
+                    percent=percent
+                )
+                for lang, catalog in CATALOGS.items()
+            }
+            texts["default"] = texts["en"]
+            
+            recipients = [
+                (donor_id, get_user_lang(donor_id) or "en")
+                for donor_id in iter_donor_ids()
+            ]
             
-            # Notify all donors
-            leaderboard = get_leaderboard(limit=1000)
-            for donor in leaderboard:
-                try:
-                    donor_id = donor["id"]
-                    text = t(donor_id, "milestone_reached").format(
-                        milestone=milestone,
-                        progress_bar=progress_bar,
-                        percent=percent
-                    )
-                    await context.bot.send_message(
-                        chat_id=donor_id,
-                        text=text,
-                        parse_mode="Markdown"
-                    )
-                except Exception as e:
-                    print(f"Failed to notify donor {donor.get('id')}: {e}")
+            # One job per milestone: a repeated trigger or a restart never re-notifies
+            await broadcaster.start(
+                context.bot,
+                texts=texts,
+                recipients=recipients,
+                job_id=f"milestone-{milestone}"
+            )
             
             break  # Only notify for one milestone at a time
 
@@ -747,62 +834,11 @@ async def get_key_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user = query.from_user
-    user_id = user.id
-    data = load_data()
-    
-    if data["keys_issued"] >= MAX_BETA_USERS:
-        await context.bot.send_message(
-            chat_id=query.message.chat_id,
-            text=t(user_id, "no_slots")
-        )
-        return
-    
-    user_id_str = str(user_id)
-    if user_id_str in data["users"]:
-        existing = data["users"][user_id_str]
-        await context.bot.send_message(
-            chat_id=query.message.chat_id,
-            text=t(user_id, "already_have").format(
-                key=existing['key'],
-                expires=existing['expires'],
-                discount=existing['discount']
-            ),
-            parse_mode="Markdown"
-        )
-        return
-    
-    # Generate signed key
-    try:
-        beta_key = generate_beta_key(user_id, user.username)
-    except RuntimeError:
-        await context.bot.send_message(
-            chat_id=query.message.chat_id,
-            text=t(user_id, "crypto_error")
-        )
-        return
-    
-    discount_code = generate_discount_code(user_id)
-    expires = (datetime.now() + timedelta(days=BETA_DAYS)).strftime("%d.%m.%Y")
-    
-    data["users"][user_id_str] = {
-        "username": user.username,
-        "first_name": user.first_name,
-        "key": beta_key,
-        "discount": discount_code,
-        "expires": expires,
-        "issued_at": datetime.now().isoformat()
-    }
-    data["keys_issued"] += 1
-    save_data(data)
+    tr = get_translator(user.id)
     
     await context.bot.send_message(
         chat_id=query.message.chat_id,
-        text=t(user_id, "new_key").format(
-            num=data['keys_issued'],
-            key=beta_key,
-            expires=expires,
-            discount=discount_code
-        ),
+        text=key_reply_text(user, tr),
         parse_mode="Markdown"
     )
 
@@ -810,71 +846,18 @@ async def key_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /key"""
     user = update.effective_user
     user_id = user.id
-    data = load_data()
     
     if not get_user_lang(user_id):
         set_user_lang(user_id, "en")
+    tr = get_translator(user_id)
     
-    if data["keys_issued"] >= MAX_BETA_USERS:
-        await update.message.reply_text(t(user_id, "no_slots"))
-        return
-    
-    user_id_str = str(user_id)
-    if user_id_str in data["users"]:
-        existing = data["users"][user_id_str]
-        await update.message.reply_text(
-            t(user_id, "already_have").format(
-                key=existing['key'],
-                expires=existing['expires'],
-                discount=existing['discount']
-            ),
-            parse_mode="Markdown"
-        )
-        return
-    
-    try:
-        beta_key = generate_beta_key(user_id, user.username)
-    except RuntimeError:
-        await update.message.reply_text(t(user_id, "crypto_error"))
-        return
-    
-    discount_code = generate_discount_code(user_id)
-    expires = (datetime.now() + timedelta(days=BETA_DAYS)).strftime("%d.%m.%Y")
-    
-    data["users"][user_id_str] = {
-        "username": user.username,
-        "first_name": user.first_name,
-        "key": beta_key,
-        "discount": discount_code,
-        "expires": expires,
-        "issued_at": datetime.now().isoformat()
-    }
-    data["keys_issued"] += 1
-    save_data(data)
-    
-    await update.message.reply_text(
-        t(user_id, "new_key").format(
-            num=data['keys_issued'],
-            key=beta_key,
-            expires=expires,
-            discount=discount_code
-        ),
-        parse_mode="Markdown"
-    )
+    await update.message.reply_text(key_reply_text(user, tr), parse_mode="Markdown")
 
 async def lang_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /lang для смены языка"""
-    keyboard = [
-        [
-            InlineKeyboardButton("🇬🇧 English", callback_data="lang_en"),
-            InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         "🌍 Choose your language / Выбери язык:",
-        reply_markup=reply_markup
+        reply_markup=LANG_MARKUP
     )
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -882,18 +865,28 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
         return
     
-    data = load_data()
-    activation_stats = get_activation_stats()
+    keys_issued = get_keys_issued()
+    # "/stats recount" rebuilds the activation totals from every record
+    activation_stats = get_activation_stats(recount=context.args == ["recount"])
     
-    await update.message.reply_text(
+    text = (
         f"📊 *Beta Test Stats*\n\n"
-        f"Keys issued: {data['keys_issued']}/{MAX_BETA_USERS}\n"
-        f"Slots left: {MAX_BETA_USERS - data['keys_issued']}\n\n"
+        f"Keys issued: {keys_issued}/{MAX_BETA_USERS}\n"
+        f"Slots left: {MAX_BETA_USERS - keys_issued}\n\n"
         f"*Activations:*\n"
         f"Total activations: {activation_stats['total_activations']}\n"
-        f"Keys at limit: {activation_stats['keys_at_limit']}",
-        parse_mode="Markdown"
+        f"Keys at limit: {activation_stats['keys_at_limit']}"
     )
+    if USE_SUPABASE:
+        # Heartbeats are only batched on the Supabase backend
+        heartbeats = get_heartbeat_metrics()
+        text += (
+            f"\n\nHeartbeats: {heartbeats['heartbeats_received']} received / "
+            f"{heartbeats['rows_written']} rows written "
+            f"(x{heartbeats['coalescing_ratio']}, {heartbeats['pending']} pending)"
+        )
+    
+    await update.message.reply_text(text, parse_mode="Markdown")
 
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Рассылка (только для админов)"""
@@ -906,20 +899,61 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     message = " ".join(context.args)
     data = load_data()
-    sent = 0
+    langs = data.get("user_langs", {})
+    recipients = [(int(user_id), langs.get(user_id, "en")) for user_id in data["users"]]
+    
+    # Sending runs in the background; progress is posted to this chat
+    await broadcaster.start(
+        context.bot,
+        texts={"default": f"📢 *News from Relay*\n\n{message}"},
+        recipients=recipients,
+        admin_chat_id=update.effective_chat.id
+    )
+
+
+async def machine_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Какие ключи активированы на машине (только для админов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
     
-    for user_id in data["users"]:
-        try:
-            await context.bot.send_message(
-                chat_id=int(user_id),
-                text=f"📢 *News from Relay*\n\n{message}",
-                parse_mode="Markdown"
-            )
-            sent += 1
-        except Exception:
-            pass
+    if len(context.args) != 1:
+        await update.message.reply_text("Usage: /machine <machine_id>")
+        return
+    
+    machine_id = context.args[0]
+    key_ids = get_machine_keys(machine_id)
+    if not key_ids:
+        await update.message.reply_text(f"No keys activated on {machine_id}")
+        return
     
-    await update.message.reply_text(f"✅ Sent to {sent} users")
+    lines = []
+    for key_id in key_ids:
+        record = get_key_activations(key_id)
+        owner = f"user {record.user_id}" if record else "unknown"
+        lines.append(f"• {key_id} ({owner})")
+    await update.message.reply_text(
+        f"🖥 Machine {machine_id}\n"
+        f"Keys activated: {len(key_ids)}\n\n" + "\n".join(lines)
+    )
+
+
+async def alert_admins(bot, text: str):
+    for admin_id in ADMIN_IDS:
+        try:
+            await bot.send_message(chat_id=admin_id, text=text)
+        except TelegramError as e:
+            print(f"⚠️ Could not alert admin {admin_id}: {e}")
+
+
+# The loop keeps only weak references to tasks; these must not be collected mid-send
+_alert_tasks = set()
+
+
+def schedule_alert(coro):
+    """Run an alert in the background (call on the event loop thread)"""
+    task = asyncio.create_task(coro)
+    _alert_tasks.add(task)
+    task.add_done_callback(_alert_tasks.discard)
 
 
 async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -927,6 +961,7 @@ async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
     try:
         data = json.loads(update.effective_message.web_app_data.data)
         user_id = update.effective_user.id
+        tr = get_translator(user_id)
         action = data.get("action")
         
         if action == "donation_complete":
@@ -936,13 +971,13 @@ async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
             if rank:
                 await context.bot.send_message(
                     chat_id=user_id,
-                    text=t(user_id, "donation_thanks").format(amount=amount, rank=rank),
+                    text=tr("donation_thanks").format(amount=amount, rank=rank),
                     parse_mode="Markdown"
                 )
             else:
                 await context.bot.send_message(
                     chat_id=user_id,
-                    text=t(user_id, "donation_thanks_simple"),
+                    text=tr("donation_thanks_simple"),
                     parse_mode="Markdown"
                 )
     except Exception as e:
@@ -984,6 +1019,7 @@ async def handle_successful_payment(update: Update, context: ContextTypes.DEFAUL
     payment = update.message.successful_payment
     user = update.effective_user
     user_id = user.id
+    tr = get_translator(user_id)
     
     try:
         # Parse payload
@@ -1007,12 +1043,17 @@ async def handle_successful_payment(update: Update, context: ContextTypes.DEFAUL
         
         # Send thank you message
         await update.message.reply_text(
-            t(user_id, "donation_thanks").format(amount=stars_amount, rank=rank),
+            tr("donation_thanks").format(amount=stars_amount, rank=rank),
             parse_mode="Markdown"
         )
         
+        if result.get("duplicate"):
+            # Telegram redelivered a payment we already counted
+            print(f"   Charge {payment.telegram_payment_charge_id} already recorded, skipping")
+            return
+        
         # Log for admin
-        print(f"   Donor rank: #{rank}, Total donors: {result['total_donors']}")
+        print(f"   Donor rank: #{rank}, Total donors: {result.get('total_donors', '?')}")
         
         # Check for milestone notifications
         await check_and_notify_milestone(stars_amount, context)
@@ -1021,7 +1062,7 @@ async def handle_successful_payment(update: Update, context: ContextTypes.DEFAUL
         print(f"❌ Error processing payment: {e}")
         # Still thank the user even if recording fails
         await update.message.reply_text(
-            t(user_id, "donation_thanks_simple"),
+            tr("donation_thanks_simple"),
             parse_mode="Markdown"
         )
 
@@ -1033,6 +1074,7 @@ async def donation_stats_command(update: Update, context: ContextTypes.DEFAULT_T
     
     stats = get_donation_stats()
     leaderboard = get_leaderboard(limit=5)
+    cache = get_leaderboard_cache_stats()
     
     top_donors = "\n".join([
         f"  {d['rank']}. {d['name']} - ⭐{d['total_stars']}"
@@ -1045,11 +1087,140 @@ async def donation_stats_command(update: Update, context: ContextTypes.DEFAULT_T
         f"Total USD: ${stats['total_usd']:.2f}\n"
         f"Total Donors: {stats['total_donors']}\n"
         f"Transactions: {stats['total_transactions']}\n\n"
-        f"*Top 5 Donors:*\n{top_donors}",
+        f"*Top 5 Donors:*\n{top_donors}\n\n"
+        f"Leaderboard cache: {cache['hits']} hits / {cache['misses']} misses",
         parse_mode="Markdown"
     )
 
+# === HTTP (health + webhook) ===
+def webhook_secret() -> str:
+    """Secret Telegram echoes in every webhook call (derived from the token if not set)"""
+    return WEBHOOK_SECRET or hashlib.sha256(f"relay-webhook-{BOT_TOKEN}".encode()).hexdigest()[:32]
+
+
+def build_http_server(app: Application) -> HTTPServer:
+    """Health checks and the activation API always; the Telegram webhook only in webhook mode"""
+    server = HTTPServer("0.0.0.0", PORT)
+    
+    async def health(request: Request) -> Response:
+        return Response.text("OK")
+    
+    async def telegram_webhook(request: Request) -> Response:
+        if request.headers.get("x-telegram-bot-api-secret-token") != webhook_secret():
+            return Response.text("Forbidden", 403)
+        try:
+            update = Update.de_json(request.json(), app.bot)
+        except (ValueError, TypeError):
+            return Response.text("Bad Request", 400)
+        # Answer only after handling: if we die first, Telegram redelivers the update
+        await app.process_update(update)
+        return Response.text("OK")
+    
+    server.route("GET", "/", health)
+    server.route("GET", "/healthz", health)
+    activation_api.register_routes(server)
+    if WEBHOOK_URL:
+        server.route("POST", WEBHOOK_PATH, telegram_webhook)
+    return server
+
+
 # === ЗАПУСК ===
+async def run(app: Application):
+    """Run the bot and the HTTP server in one event loop until SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+    
+    server = build_http_server(app)
+    
+    async with app:
+        await app.start()
+        await server.start()
+        print(f"   HTTP server: http://0.0.0.0:{PORT} (/healthz)")
+        
+        poller = None
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=webhook_secret(),
+                allowed_updates=Update.ALL_TYPES
+            )
+            print(f"   Mode: webhook ({WEBHOOK_URL}{WEBHOOK_PATH})")
+        else:
+            # Pending updates are kept: they are picked up from the saved offset
+            await app.bot.delete_webhook(drop_pending_updates=False)
+            poller = asyncio.create_task(poll_updates(app, stop))
+            poller.add_done_callback(lambda task: on_poller_done(task, stop))
+            print("   Mode: long polling")
+        
+        # Activations are recorded on worker threads; hop back onto the loop to message admins
+        on_machine_alert(lambda machine_id, key_ids: loop.call_soon_threadsafe(
+            schedule_alert,
+            alert_admins(app.bot, f"🚨 Machine {machine_id} has activated {len(key_ids)} keys\n/machine {machine_id}")
+        ))
+        
+        sweeper = None
+        if ACTIVATION_TTL_DAYS > 0:
+            sweeper = asyncio.create_task(release_stale_loop(stop))
+        
+        resumed = await broadcaster.resume(app.bot)
+        if resumed:
+            print(f"   Resumed broadcasts: {resumed}")
+        
+        try:
+            await stop.wait()
+        finally:
+            stop.set()
+            if poller is not None:
+                # Lets the batch in progress finish and save its offset (never raises)
+                await asyncio.wait({poller})
+            if sweeper is not None:
+                await asyncio.wait({sweeper})
+            await server.stop()
+            await app.stop()
+
+
+def release_stale_slots() -> int:
+    """Free machines idle past ACTIVATION_TTL_DAYS in the local store and, if used, Supabase"""
+    released = release_stale_activations()
+    if USE_SUPABASE and ACTIVATION_TTL_DAYS > 0:
+        import supabase_client
+        rows = supabase_client.release_stale_activations(ACTIVATION_TTL_DAYS)
+        for row in rows:
+            print(f"♻️ Released stale activation {row['machine_id']} (Supabase)")
+        released += len(rows)
+    return released
+
+
+async def release_stale_loop(stop: asyncio.Event):
+    """Sweep stale activations every ACTIVATION_RELEASE_INTERVAL seconds until `stop`"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        try:
+            await loop.run_in_executor(None, release_stale_slots)
+        except Exception as e:
+            print(f"⚠️ Stale activation sweep failed: {e!r}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=ACTIVATION_RELEASE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def on_poller_done(task: asyncio.Task, stop: asyncio.Event):
+    """The poller only returns once `stop` is set; if it dies early, shut down instead of idling"""
+    if stop.is_set():
+        return
+    if task.cancelled():
+        print("❌ Update poller was cancelled, stopping")
+    else:
+        print(f"❌ Update poller died: {task.exception()!r}, stopping")
+    stop.set()
+
+
 def main():
     if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
         print("❌ Set TELEGRAM_BOT_TOKEN!")
@@ -1066,18 +1237,14 @@ def main():
         print("   Generate keys: python crypto.py")
         print("   Then: export RELAY_BETA_SIGNING_KEY='your_private_key'")
     
-    import asyncio
-    import httpx
-    
-    # Force delete webhook before starting polling
-    async def reset_webhook():
-        async with httpx.AsyncClient() as client:
-            await client.post(f"https://api.telegram.org/bot{BOT_TOKEN}/deleteWebhook?drop_pending_updates=true")
-            await asyncio.sleep(2)  # Wait for Telegram to release the session
-    
-    asyncio.get_event_loop().run_until_complete(reset_webhook())
-    
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Key issuance reserves slots atomically, so updates can be handled concurrently
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)
+        .updater(None)  # Polling is done by update_poller, which confirms offsets only after handling
+        .build()
+    )
     
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("key", key_command))
@@ -1085,8 +1252,10 @@ def main():
     app.add_handler(CommandHandler("stats", stats))
     app.add_handler(CommandHandler("donations", donation_stats_command))
     app.add_handler(CommandHandler("broadcast", broadcast))
+    app.add_handler(CommandHandler("machine", machine_command))
     app.add_handler(CommandHandler("donate", donate_command))
     app.add_handler(CommandHandler("goal", goal_command))
+    app.add_handler(CommandHandler("top", top_command))
     app.add_handler(CallbackQueryHandler(set_language, pattern="^lang_"))
     app.add_handler(CallbackQueryHandler(get_key_callback, pattern="^get_key$"))
     app.add_handler(CallbackQueryHandler(about, pattern="^about$"))
@@ -1102,9 +1271,6 @@ def main():
     app.add_handler(PreCheckoutQueryHandler(handle_pre_checkout))
     app.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, handle_successful_payment))
     
-    # Start health server for keep-alive
-    start_health_server()
-    
     print("🤖 Bot started!")
     print(f"   Limit: {MAX_BETA_USERS} keys")
     print(f"   Duration: {BETA_DAYS} days")
@@ -1113,7 +1279,10 @@ def main():
     print("   Crypto:", "✅ Enabled" if ED25519_PRIVATE_KEY_HEX else "⚠️ Not configured")
     print("   Stars Payments: ✅ Enabled")
     
-    app.run_polling(drop_pending_updates=True)
+    try:
+        asyncio.run(run(app))
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     main()
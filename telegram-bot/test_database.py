@@ -6,10 +6,34 @@ Tests:
 2. Date format consistency
 3. Key generation and verification
 4. Activation tracking
+5. User state cache
+6. Concurrent key issuance
+7. Broadcast delivery and resume
+8. HTTP server keep-alive
+9. Update offset persistence
+10. Activation import from legacy JSON
+11. Activation limit under concurrency
+12. Activation journal replay and compaction
+13. Incremental activation stats
+14. Activation API and signed receipts
+15. Heartbeat coalescing
+16. Stale activation release
+17. Machine to keys index and alert
+18. Compact activation records
+19. Donor rank index
+20. Donation ledger transactions
+21. Idempotent donations
+22. Donation transaction log
+23. Leaderboard snapshot and rank file
+24. Top-K leaderboard cache
+25. Weekly and monthly leaderboards
+26. Activation store opened once
+27. Leaderboard publish cost
 """
 import json
 import base64
 import sys
+import tempfile
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -18,8 +42,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from config import DATA_DIR, DATA_FILE, BETA_DAYS, MAX_ACTIVATIONS_PER_KEY, ED25519_PUBLIC_KEY_HEX
 from activation_tracker import (
-    can_activate, record_activation, get_activation_stats,
-    _load_activations, ACTIVATIONS_FILE
+    can_activate, record_activation, get_activation_stats, delete_key, deactivate_machine
 )
 
 def test_data_directory():
@@ -217,6 +240,1176 @@ def test_activation_tracking():
     return True
 
 
+def test_user_state_cache():
+    """Test user state is served from memory and written through"""
+    print("\n=== TEST: User State Cache ===")
+    
+    import user_store
+    
+    original_file = user_store.DATA_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        user_store.DATA_FILE = Path(tmp) / "beta_users.json"
+        try:
+            data = user_store.reload_data()
+            if user_store.load_data() is not data:
+                print("❌ load_data() re-read the file instead of using the cache")
+                return False
+            
+            user_store.set_user_lang(42, "ru")
+            with open(user_store.DATA_FILE) as f:
+                on_disk = json.load(f)
+            if on_disk["user_langs"].get("42") != "ru":
+                print("❌ Language change was not written through")
+                return False
+            
+            if user_store.reload_data()["user_langs"].get("42") != "ru":
+                print("❌ Language lost after reload")
+                return False
+            
+            # A read-only transaction leaves the file alone
+            mtime = user_store.DATA_FILE.stat().st_mtime_ns
+            with user_store.transaction() as tx:
+                tx.data["users"].get("42")
+            if user_store.DATA_FILE.stat().st_mtime_ns != mtime:
+                print("❌ Read-only transaction rewrote the file")
+                return False
+            
+            # A transaction that raises drops its partial change
+            try:
+                with user_store.transaction() as tx:
+                    tx.data["keys_issued"] += 1
+                    tx.changed = True
+                    raise RuntimeError("signing failed")
+            except RuntimeError:
+                pass
+            if user_store.get_keys_issued() != 0:
+                print("❌ Failed transaction left a change in memory")
+                return False
+            print("✅ Cached reads, write-through and rollback work")
+        finally:
+            user_store.DATA_FILE = original_file
+            user_store.reload_data()
+    
+    return True
+
+
+def test_concurrent_key_issuance():
+    """Test beta slots are never over-issued under concurrent requests"""
+    print("\n=== TEST: Concurrent Key Issuance ===")
+    
+    import threading
+    import user_store
+    import key_issuance
+    from crypto import generate_keypair, NACL_AVAILABLE
+    
+    if not NACL_AVAILABLE:
+        print("⚠️  PyNaCl not installed, skipping")
+        return True
+    
+    original = (user_store.DATA_FILE, key_issuance.MAX_BETA_USERS, key_issuance.ED25519_PRIVATE_KEY_HEX)
+    with tempfile.TemporaryDirectory() as tmp:
+        user_store.DATA_FILE = Path(tmp) / "beta_users.json"
+        key_issuance.MAX_BETA_USERS = 5
+        key_issuance.ED25519_PRIVATE_KEY_HEX = generate_keypair()[0]
+        try:
+            user_store.reload_data()
+            backend = key_issuance.JsonSlotBackend()
+            results = []
+            
+            def request(user_id):
+                results.append((user_id, backend.reserve(user_id, f"user{user_id}", "Test")))
+            
+            # 10 users, each asking twice at the same time
+            threads = [threading.Thread(target=request, args=(uid,)) for uid in list(range(10)) * 2]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            issued = [r for _, r in results if r.status == "issued"]
+            if len(issued) != 5 or user_store.get_keys_issued() != 5:
+                print(f"❌ Expected 5 keys, issued {len(issued)} (counter {user_store.get_keys_issued()})")
+                return False
+            
+            keys_by_user = {}
+            for user_id, result in results:
+                if result.status == "no_slots":
+                    continue
+                if keys_by_user.setdefault(user_id, result.key) != result.key:
+                    print(f"❌ User {user_id} got two different keys")
+                    return False
+            print("✅ Slots reserved atomically, duplicates get the same key")
+        finally:
+            user_store.DATA_FILE, key_issuance.MAX_BETA_USERS, key_issuance.ED25519_PRIVATE_KEY_HEX = original
+            user_store.reload_data()
+    
+    return True
+
+
+def test_broadcast_delivery():
+    """Test broadcasts honor RetryAfter, skip blocked chats and resume"""
+    print("\n=== TEST: Broadcast Delivery ===")
+    
+    import asyncio
+    import broadcaster
+    from telegram.error import Forbidden, RetryAfter
+    
+    class FakeBot:
+        def __init__(self):
+            self.delivered = []
+            self.retried = False
+        
+        async def send_message(self, chat_id, text, parse_mode=None):
+            if chat_id == 2 and not self.retried:
+                self.retried = True
+                raise RetryAfter(0)
+            if chat_id == 3:
+                raise Forbidden("bot was blocked by the user")
+            if chat_id == 5:
+                raise TypeError("unexpected bug")
+            self.delivered.append((chat_id, text))
+    
+    original_dir = broadcaster.BROADCASTS_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        broadcaster.BROADCASTS_DIR = Path(tmp)
+        try:
+            # Pretend a previous process already delivered to chat 1
+            job = broadcaster.BroadcastJob(
+                job_id="resume-test",
+                texts={"default": "hi", "ru": "привет"},
+                recipients=[(1, "en"), (2, "ru"), (3, "en"), (4, "en"), (5, "en"), (6, "en")],
+            )
+            job.save()
+            job.log_file.write_text("1 ok\n")
+            
+            bot = FakeBot()
+            # A single worker, so one crashing chat would stall everything after it
+            engine = broadcaster.Broadcaster(rate=1000, per_chat_interval=0, concurrency=1)
+            
+            async def run():
+                await engine.resume(bot)
+                while engine.is_running("resume-test"):
+                    await asyncio.sleep(0.01)
+            
+            asyncio.run(asyncio.wait_for(run(), timeout=10))
+            
+            if sorted(bot.delivered) != [(2, "привет"), (4, "hi"), (6, "hi")]:
+                print(f"❌ Unexpected deliveries: {bot.delivered}")
+                return False
+            if job.job_file.exists():
+                print("❌ Finished job was not cleaned up")
+                return False
+            print("✅ RetryAfter retried, blocked and broken chats skipped, delivered chat not resent")
+        finally:
+            broadcaster.BROADCASTS_DIR = original_dir
+    
+    return True
+
+
+def test_http_keep_alive():
+    """Test the asyncio HTTP server answers several requests on one connection"""
+    print("\n=== TEST: HTTP Server ===")
+    
+    import asyncio
+    from http_server import HTTPServer, Response
+    
+    async def run():
+        server = HTTPServer("127.0.0.1", 0)
+        
+        async def health(request):
+            return Response.text("OK")
+        
+        server.route("GET", "/healthz", health)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            statuses = []
+            for path in ("/healthz", "/healthz", "/missing"):
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+                await reader.readexactly(length)
+                statuses.append(int(head.split(b" ")[1]))
+            writer.close()
+            return statuses
+        finally:
+            await server.stop()
+    
+    statuses = asyncio.run(run())
+    if statuses != [200, 200, 404]:
+        print(f"❌ Unexpected statuses over keep-alive: {statuses}")
+        return False
+    
+    print("✅ Keep-alive connection served 3 requests")
+    return True
+
+
+def test_update_offset_persistence():
+    """Test polling confirms updates only after they were processed"""
+    print("\n=== TEST: Update Offset ===")
+    
+    import asyncio
+    import update_poller
+    
+    class FakeUpdate:
+        def __init__(self, update_id):
+            self.update_id = update_id
+    
+    class FakeBot:
+        def __init__(self, stop):
+            self.offsets = []
+            self.stop = stop
+        
+        async def get_updates(self, offset=None, **kwargs):
+            self.offsets.append(offset)
+            if len(self.offsets) == 1:
+                raise RuntimeError("unexpected API error")
+            if len(self.offsets) == 2:
+                return [FakeUpdate(10), FakeUpdate(11)]
+            self.stop.set()
+            await asyncio.sleep(3600)
+    
+    class FakeApp:
+        def __init__(self, stop):
+            self.bot = FakeBot(stop)
+            self.processed = []
+        
+        async def process_update(self, update):
+            self.processed.append(update.update_id)
+            if update.update_id == 11:
+                raise ValueError("handler bug")
+    
+    original_file = update_poller.OFFSET_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        update_poller.OFFSET_FILE = Path(tmp) / "update_offset.json"
+        try:
+            update_poller.save_offset(10)
+            
+            async def run():
+                stop = asyncio.Event()
+                app = FakeApp(stop)
+                await update_poller.poll_updates(app, stop)
+                return app
+            
+            app = asyncio.run(run())
+            
+            if app.bot.offsets[:2] != [10, 10]:
+                print(f"❌ Polling did not resume from saved offset: {app.bot.offsets}")
+                return False
+            if app.processed != [10, 11] or update_poller.load_offset() != 12:
+                print(f"❌ Offset not advanced after processing: {update_poller.load_offset()}")
+                return False
+            print("✅ Resumed from saved offset, survived errors and confirmed after processing")
+        finally:
+            update_poller.OFFSET_FILE = original_file
+    
+    return True
+
+
+def test_activation_json_import():
+    """Test the one-time import of activations.json, and exporting every key back"""
+    print("\n=== TEST: Activation JSON Import ===")
+    
+    from activation_store import JournalActivationStore, SQLiteActivationStore
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = Path(tmp) / "activations.json"
+        legacy.write_text(json.dumps({
+            "abc123": {
+                "key_id": "abc123",
+                "user_id": 7,
+                "activations": [
+                    {"machine_id": "m1", "activated_at": "2026-01-01T10:00:00", "app_version": "1.0", "os_version": "14.0"},
+                    {"machine_id": "m2", "activated_at": "2026-01-02T10:00:00"},
+                ],
+                "max_activations": 2
+            }
+        }))
+        
+        store = SQLiteActivationStore(Path(tmp) / "activations.db")
+        try:
+            store.import_json(legacy, MAX_ACTIVATIONS_PER_KEY)
+            record = store.get_key("abc123")
+            if record.user_id != 7 or list(record.activations) != ["m1", "m2"]:
+                print(f"❌ Imported data mismatch: {record}")
+                return False
+            if store.stats() != {"total_keys": 1, "total_activations": 2, "keys_at_limit": 1}:
+                print(f"❌ Unexpected stats after import: {store.stats()}")
+                return False
+        finally:
+            store.close()
+        
+        # What migrate_to_supabase.py exports, from either backend
+        for store in (
+            SQLiteActivationStore(Path(tmp) / "activations.db"),
+            JournalActivationStore(Path(tmp) / "activations"),
+        ):
+            try:
+                store.import_json(legacy, MAX_ACTIVATIONS_PER_KEY)
+                exported = [
+                    (r.key_id, r.user_id, [(a.machine_id, a.last_seen) for a in r.activations.values()])
+                    for r in store.all_keys()
+                ]
+                if exported != [("abc123", 7, [("m1", "2026-01-01T10:00:00"), ("m2", "2026-01-02T10:00:00")])]:
+                    print(f"❌ {type(store).__name__} exported {exported}")
+                    return False
+            finally:
+                store.close()
+    
+    print("✅ Legacy activations imported and exported")
+    return True
+
+
+def test_concurrent_activations():
+    """Test the activation limit holds when machines activate at the same time"""
+    print("\n=== TEST: Concurrent Activations ===")
+    
+    import threading
+    import activation_tracker
+    from activation_store import SQLiteActivationStore
+    
+    original_store = activation_tracker._store
+    with tempfile.TemporaryDirectory() as tmp:
+        activation_tracker._store = SQLiteActivationStore(Path(tmp) / "activations.db")
+        try:
+            results = []
+            
+            def activate(machine_id):
+                results.append(record_activation("race_key", 1, machine_id))
+            
+            threads = [threading.Thread(target=activate, args=(f"machine_{i}",)) for i in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            succeeded = [msg for ok, msg in results if ok]
+            if len(succeeded) != MAX_ACTIVATIONS_PER_KEY:
+                print(f"❌ {len(succeeded)} activations succeeded, limit is {MAX_ACTIVATIONS_PER_KEY}")
+                return False
+            
+            stats = get_activation_stats()
+            if stats["total_activations"] != MAX_ACTIVATIONS_PER_KEY:
+                print(f"❌ Stored activations: {stats['total_activations']}")
+                return False
+        finally:
+            activation_tracker._store.close()
+            activation_tracker._store = original_store
+    
+    print(f"✅ Exactly {MAX_ACTIVATIONS_PER_KEY} of 10 concurrent activations accepted")
+    return True
+
+
+def test_activation_journal():
+    """Test the journal store rebuilds the same state before and after compaction"""
+    print("\n=== TEST: Activation Journal ===")
+    
+    from activation_store import Activation, JournalActivationStore
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp) / "activations"
+        store = JournalActivationStore(base, compact_every=1000)
+        store.check_and_add("key_a", 1, 3, Activation("m1", "2025-01-01T00:00:00", "1.0", "14.0", "2025-01-01T00:00:00"))
+        store.check_and_add("key_a", 1, 3, Activation("m2", "2025-01-01T00:00:00", "1.0", "14.0", "2025-01-01T00:00:00"))
+        store.check_and_add("key_b", 2, 3, Activation("m1", "2025-01-01T00:00:00", "1.0", "14.0", "2025-01-01T00:00:00"))
+        store.remove_activation("key_a", "m1")
+        store.delete_key("key_b")
+        expected = dict(store.get_key("key_a").activations)
+        store.close()
+        
+        # Crash mid-append leaves a torn line behind
+        with open(base.with_suffix(".journal"), "a") as f:
+            f.write('{"op":"add","key":"key_c"')
+        
+        store = JournalActivationStore(base)
+        if store.get_key("key_a").activations != expected or store.get_key("key_b") is not None:
+            print(f"❌ Replay mismatch: {store.get_key('key_a')}")
+            store.close()
+            return False
+        
+        # Activations written after the torn line must survive the next restart
+        store.check_and_add("key_d", 4, 3, Activation("m1", "2025-01-01T00:00:00", "1.0", "14.0", "2025-01-01T00:00:00"))
+        store.check_and_add("key_d", 4, 3, Activation("m2", "2025-01-01T00:00:00", "1.0", "14.0", "2025-01-01T00:00:00"))
+        store.close()
+        store = JournalActivationStore(base)
+        torn_record = store.get_key("key_d")
+        if not torn_record or sorted(torn_record.activations) != ["m1", "m2"]:
+            print(f"❌ Activations after a torn line were lost: {torn_record}")
+            store.close()
+            return False
+        
+        store.compact()
+        store.check_and_add("key_a", 1, 3, Activation("m3", "2025-01-02T00:00:00", "1.0", "14.0", "2025-01-02T00:00:00"))
+        store.close()
+        
+        store = JournalActivationStore(base)
+        record = store.get_key("key_a")
+        store.close()
+        machines = sorted(record.activations) if record else []
+        if machines != ["m2", "m3"]:
+            print(f"❌ State after compaction: {machines}")
+            return False
+        if base.with_suffix(".journal.1").exists():
+            print("❌ Rotated journal left behind")
+            return False
+    
+    print("✅ Journal replays identically before and after compaction")
+    return True
+
+
+def test_incremental_activation_stats():
+    """Test running activation totals match a full recount in both stores"""
+    print("\n=== TEST: Incremental Activation Stats ===")
+    
+    from activation_store import Activation, JournalActivationStore, SQLiteActivationStore
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {
+            "sqlite": SQLiteActivationStore(Path(tmp) / "activations.db"),
+            "journal": JournalActivationStore(Path(tmp) / "activations"),
+        }
+        for name, store in stores.items():
+            for i in range(3):
+                store.check_and_add("key_a", 1, 2, Activation(f"m{i}", "2025-01-01T00:00:00", "", "", "2025-01-01T00:00:00"))
+            store.check_and_add("key_b", 2, 2, Activation("m0", "2025-01-01T00:00:00", "", "", "2025-01-01T00:00:00"))
+            store.check_and_add("key_c", 3, 2, Activation("m0", "2025-01-01T00:00:00", "", "", "2025-01-01T00:00:00"))
+            store.check_and_add("key_c", 3, 2, Activation("m1", "2025-01-01T00:00:00", "", "", "2025-01-01T00:00:00"))
+            store.remove_activation("key_a", "m0")
+            store.remove_activation("key_a", "missing")
+            store.delete_key("key_c")
+            
+            running = store.stats()
+            recounted = store.recount_stats()
+            store.close()
+            expected = {"total_keys": 2, "total_activations": 2, "keys_at_limit": 0}
+            if running != recounted or running != expected:
+                print(f"❌ {name}: running {running}, recount {recounted}")
+                return False
+    
+    print("✅ Running totals match a full recount")
+    return True
+
+
+def test_activation_api():
+    """Test the activation endpoint verifies keys and enforces the limit over keep-alive"""
+    print("\n=== TEST: Activation API ===")
+    
+    import asyncio
+    import activation_api
+    import activation_tracker
+    from activation_store import SQLiteActivationStore
+    from crypto import generate_keypair, create_signed_beta_key, verify_activation_receipt, NACL_AVAILABLE
+    from http_server import HTTPServer
+    
+    if not NACL_AVAILABLE:
+        print("⚠️  PyNaCl not installed, skipping")
+        return True
+    
+    private_key, public_key = generate_keypair()
+    key = create_signed_beta_key(1, "tester", 7, "test", private_key)
+    
+    async def run():
+        server = HTTPServer("127.0.0.1", 0)
+        activation_api.register_routes(server)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            verdicts = []
+            receipts = []
+            for body in (
+                {"key": key, "machine_id": "m1"},
+                {"key": key, "machine_id": "m1"},
+                {"key": key, "machine_id": "m2"},
+                {"key": key, "machine_id": "m3"},
+                {"key": key[:-4] + "AAA=", "machine_id": "m1"},
+                {"key": key},
+            ):
+                raw = json.dumps(body).encode()
+                writer.write(
+                    f"POST {activation_api.ACTIVATE_PATH} HTTP/1.1\r\nHost: test\r\n"
+                    f"Content-Length: {len(raw)}\r\n\r\n".encode() + raw
+                )
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+                verdict = json.loads(await reader.readexactly(length))
+                verdicts.append(verdict["status"])
+                receipts.append(verdict.get("receipt"))
+            writer.close()
+            return verdicts, receipts
+        finally:
+            await server.stop()
+    
+    original_store = activation_tracker._store
+    original_keys = activation_api.ED25519_PUBLIC_KEY_HEX, activation_api.ED25519_PRIVATE_KEY_HEX
+    with tempfile.TemporaryDirectory() as tmp:
+        activation_tracker._store = SQLiteActivationStore(Path(tmp) / "activations.db")
+        activation_api.ED25519_PUBLIC_KEY_HEX = public_key
+        activation_api.ED25519_PRIVATE_KEY_HEX = private_key
+        try:
+            verdicts, receipts = asyncio.run(run())
+        finally:
+            activation_tracker._store.close()
+            activation_tracker._store = original_store
+            activation_api.ED25519_PUBLIC_KEY_HEX, activation_api.ED25519_PRIVATE_KEY_HEX = original_keys
+    
+    expected = ["activated", "already_activated", "activated", "limit_reached", "invalid_key", "bad_request"]
+    if verdicts != expected:
+        print(f"❌ Verdicts: {verdicts}")
+        return False
+    
+    
+    # Receipts are issued only for accepted machines and don't transfer
+    if receipts[3] is not None or receipts[4] is not None:
+        print("❌ Receipt issued for a rejected activation")
+        return False
+    if not verify_activation_receipt(receipts[0], public_key, "m1"):
+        print("❌ Receipt does not verify on its own machine")
+        return False
+    if verify_activation_receipt(receipts[0], public_key, "m2"):
+        print("❌ Receipt verifies on another machine")
+        return False
+    
+    print("✅ Activation API verdicts and receipts correct over one connection")
+    return True
+
+
+def test_heartbeat_coalescing():
+    """Test repeated heartbeats collapse into one row per machine"""
+    print("\n=== TEST: Heartbeat Coalescing ===")
+    
+    from heartbeats import HeartbeatCoalescer
+    
+    batches = []
+    fail = [True]
+    
+    def write_batch(batch):
+        if fail[0]:
+            fail[0] = False
+            raise ConnectionError("database unavailable")
+        batches.append(sorted((key, machine) for key, machine, _ in batch))
+    
+    coalescer = HeartbeatCoalescer(write_batch, flush_interval=3600, max_buffer=1000)
+    for _ in range(10):
+        coalescer.record("key_a", "m1")
+        coalescer.record("key_a", "m2")
+    
+    # First flush fails; nothing may be lost
+    if coalescer.flush() != 0 or coalescer.metrics()["pending"] != 2:
+        print("❌ Failed flush dropped heartbeats")
+        return False
+    
+    coalescer.record("key_b", "m1")
+    written = coalescer.flush()
+    metrics = coalescer.metrics()
+    if written != 3 or batches != [[("key_a", "m1"), ("key_a", "m2"), ("key_b", "m1")]]:
+        print(f"❌ Unexpected batches: {batches}")
+        return False
+    if metrics["heartbeats_received"] != 21 or metrics["coalescing_ratio"] != 7.0:
+        print(f"❌ Unexpected metrics: {metrics}")
+        return False
+    
+    print(f"✅ 21 heartbeats written as 3 rows (ratio {metrics['coalescing_ratio']})")
+    return True
+
+
+def test_stale_activation_release():
+    """Test machines idle past the TTL are released oldest-first in both stores"""
+    print("\n=== TEST: Stale Activation Release ===")
+    
+    from activation_store import Activation, JournalActivationStore, SQLiteActivationStore
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, open_store in (
+            ("sqlite", lambda: SQLiteActivationStore(Path(tmp) / "activations.db")),
+            ("journal", lambda: JournalActivationStore(Path(tmp) / "activations")),
+        ):
+            store = open_store()
+            store.check_and_add("key_a", 1, 2, Activation("m1", "2025-01-01T00:00:00", "", "", "2025-01-01T00:00:00"))
+            store.check_and_add("key_a", 1, 2, Activation("m2", "2025-02-01T00:00:00", "", "", "2025-02-01T00:00:00"))
+            store.check_and_add("key_b", 2, 2, Activation("m1", "2025-03-01T00:00:00", "", "", "2025-03-01T00:00:00"))
+            # A repeat activation counts as a sign of life
+            store.check_and_add("key_a", 1, 2, Activation("m1", "2025-06-01T00:00:00", "", "", "2025-06-01T00:00:00"))
+            store.close()
+            
+            store = open_store()
+            released = store.release_stale("2025-04-01T00:00:00")
+            outcome, _, _ = store.check_and_add("key_a", 1, 2, Activation("m3", "2025-07-01T00:00:00", "", "", "2025-07-01T00:00:00"))
+            stats = store.stats()
+            store.close()
+            
+            if released != [("key_a", "m2"), ("key_b", "m1")]:
+                print(f"❌ {name}: released {released}")
+                return False
+            if outcome != "new_machine" or stats["total_activations"] != 2:
+                print(f"❌ {name}: freed slot not reusable ({outcome}, {stats})")
+                return False
+    
+        # With no sweep running (TTL off), touches must not grow the heap forever
+        store = JournalActivationStore(Path(tmp) / "touched")
+        store.check_and_add("key_a", 1, 2, Activation("m1", "2025-01-01T00:00:00", "", "", "2025-01-01T00:00:00"))
+        for i in range(3000):
+            store.touch("key_a", "m1", f"2025-01-02T00:{i // 60:02d}:{i % 60:02d}")
+        heap_size = len(store._by_last_seen)
+        store.close()
+        if heap_size > 1024 + 2 + 1:
+            print(f"❌ last_seen heap grew to {heap_size} entries for one machine")
+            return False
+    
+    print("✅ Stale machines released, fresh ones kept")
+    return True
+
+
+def test_machine_keys_index():
+    """Test the machine_id -> keys index follows activations and raises the alert"""
+    print("\n=== TEST: Machine Keys Index ===")
+    
+    import activation_tracker
+    from activation_store import JournalActivationStore, SQLiteActivationStore
+    from config import MACHINE_KEYS_ALERT_THRESHOLD
+    
+    original_store = activation_tracker._store
+    alerts = []
+    activation_tracker.on_machine_alert(lambda machine_id, key_ids: alerts.append((machine_id, len(key_ids))))
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, store in (
+            ("sqlite", SQLiteActivationStore(Path(tmp) / "activations.db")),
+            ("journal", JournalActivationStore(Path(tmp) / "activations")),
+        ):
+            activation_tracker._store = store
+            alerts.clear()
+            try:
+                for i in range(MACHINE_KEYS_ALERT_THRESHOLD):
+                    record_activation(f"shared_key_{i}", i, "shared_machine")
+                record_activation("shared_key_0", 0, "shared_machine")  # Repeat: no new alert
+                record_activation("shared_key_extra", 99, "shared_machine")  # Past the threshold: no new alert
+                deactivate_machine("shared_key_extra", "shared_machine")
+                record_activation("shared_key_0", 0, "other_machine")
+                deactivate_machine("shared_key_1", "shared_machine")
+                delete_key("shared_key_2")
+                
+                keys = activation_tracker.get_machine_keys("shared_machine")
+                if alerts != [("shared_machine", MACHINE_KEYS_ALERT_THRESHOLD)]:
+                    print(f"❌ {name}: alerts {alerts}")
+                    return False
+                if keys != ["shared_key_0"] or activation_tracker.get_machine_keys("other_machine") != ["shared_key_0"]:
+                    print(f"❌ {name}: index {keys}")
+                    return False
+            finally:
+                store.close()
+    activation_tracker._store = original_store
+    activation_tracker._machine_alert_handlers.clear()
+    
+    print(f"✅ Machine index tracks keys, alert at {MACHINE_KEYS_ALERT_THRESHOLD}")
+    return True
+
+
+def test_activation_records():
+    """Test key records are slotted, shared without rebuilds and never change under a reader"""
+    print("\n=== TEST: Activation Records ===")
+    
+    from activation_store import Activation, JournalActivationStore
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JournalActivationStore(Path(tmp) / "activations")
+        try:
+            store.check_and_add("key_a", 1, 2, Activation("m1", "2025-01-01T00:00:00", "", "", "2025-01-01T00:00:00"))
+            record = store.get_key("key_a")
+            if hasattr(record, "__dict__") or store.get_key("key_a").activations is not record.activations:
+                print("❌ Record is not slotted or its activations are rebuilt")
+                return False
+            
+            store.check_and_add("key_a", 1, 2, Activation("m2", "2025-01-02T00:00:00", "", "", "2025-01-02T00:00:00"))
+            record = store.get_key("key_a")
+            store.remove_activation("key_a", "m1")
+            if list(record.activations) != ["m1", "m2"] or list(store.get_key("key_a").activations) != ["m2"]:
+                print(f"❌ Held record changed: {record}")
+                return False
+            
+            # A caller rebinding fields on its record must not reach the store
+            record.activations = {}
+            record.max_activations = 99
+            if list(store.get_key("key_a").activations) != ["m2"] or store.get_key("key_a").max_activations != 2:
+                print("❌ Caller's record is the store's own")
+                return False
+        finally:
+            store.close()
+    
+    print("✅ Records are slotted and copy-on-write")
+    return True
+
+
+def test_donor_rank_index():
+    """Test the rank index matches a stable sort of donors after every donation"""
+    print("\n=== TEST: Donor Rank Index ===")
+    
+    import random
+    import donations
+    
+    original_ledger = donations._ledger
+    with tempfile.TemporaryDirectory() as tmp:
+        donations._ledger = donations.DonationLedger(Path(tmp) / "donations.json")
+        try:
+            rng = random.Random(42)
+            for i in range(200):
+                # Few distinct amounts, so ties are common
+                user_id = rng.randint(1, 40)
+                donations.record_donation(user_id, None, f"User {user_id}", None, rng.choice([50, 100, 250]), f"charge_{i}")
+                
+                data = donations.load_donations_data()
+                expected = [
+                    int(uid) for uid, _ in
+                    sorted(data["donors"].items(), key=lambda x: x[1]["total_stars"], reverse=True)
+                ]
+                ranked = [donor["id"] for donor in donations.get_leaderboard(limit=1000)]
+                if ranked != expected:
+                    print(f"❌ Order differs after donation {i}")
+                    return False
+                if donations.get_donor_rank(user_id) != expected.index(user_id) + 1:
+                    print(f"❌ Rank of {user_id} differs after donation {i}")
+                    return False
+        finally:
+            donations._ledger = original_ledger
+    
+    print("✅ Ranks match the stable sort across 200 donations")
+    return True
+
+
+def test_donation_ledger():
+    """Test the ledger serves reads from memory and applies a donation all-or-nothing"""
+    print("\n=== TEST: Donation Ledger ===")
+    
+    from unittest import mock
+    import donations
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "donations.json"
+        ledger = donations.DonationLedger(path)
+        ledger.record(1, "alice", "Alice", None, 100, "charge_1")
+        ledger.record(2, "bob", "Bob", None, 50, "charge_2")
+        
+        # A donation that never reached the log must not leave a trace in memory
+        with mock.patch("transaction_log.os.fsync", side_effect=OSError("disk full")):
+            try:
+                ledger.record(2, "bob", "Bob", None, 500, "charge_3")
+            except OSError:
+                pass
+        ledger.reload()
+        if ledger.stats()["total_stars"] != 150 or ledger.rank(2) != 2:
+            print(f"❌ Failed donation leaked into state: {ledger.stats()}")
+            return False
+        
+        # Reads come from memory, not the file
+        with mock.patch("builtins.open", side_effect=AssertionError("file read")):
+            ledger.leaderboard(10)
+            ledger.stats()
+            ledger.donor_info(1)
+        
+        reopened = donations.DonationLedger(path)
+        if reopened.stats() != ledger.stats() or reopened.leaderboard(10) != ledger.leaderboard(10):
+            print("❌ Reloaded ledger differs from memory")
+            return False
+        reopened.close()
+        ledger.close()
+    
+    print("✅ Ledger reads from memory and writes each donation atomically")
+    return True
+
+
+def test_donation_idempotency():
+    """Test a repeated charge_id is counted once, even after it leaves the transaction log"""
+    print("\n=== TEST: Idempotent Donations ===")
+    
+    import donations
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "donations.json"
+        ledger = donations.DonationLedger(path)
+        first = ledger.record(1, "alice", "Alice", None, 100, "charge_first")
+        again = ledger.record(1, "alice", "Alice", None, 100, "charge_first")
+        if first["duplicate"] or not again["duplicate"] or again["donor"] != first["donor"]:
+            print(f"❌ Repeat was not recognised: {again}")
+            return False
+        if ledger.stats()["total_stars"] != 100:
+            print(f"❌ Repeat was counted: {ledger.stats()}")
+            return False
+        
+        for i in range(50):
+            ledger.record(2, "bob", "Bob", None, 1, f"charge_{i}")
+        ledger.close()
+        
+        reopened = donations.DonationLedger(path)
+        result = reopened.record(1, "alice", "Alice", None, 100, "charge_first")
+        reopened.close()
+        if not result["duplicate"] or reopened.donor_info(1)["total_stars"] != 100:
+            print(f"❌ Old charge was counted again after reload: {result}")
+            return False
+    
+    print("✅ Repeated charges are no-ops, including after reload")
+    return True
+
+
+def test_transaction_log():
+    """Test donations go to a rotating log and donations.json keeps only aggregates"""
+    print("\n=== TEST: Donation Transaction Log ===")
+    
+    from unittest import mock
+    import donations
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "donations.json"
+        ledger = donations.DonationLedger(path, segment_bytes=2048)
+        for i in range(100):
+            ledger.record(i % 7, None, f"User {i % 7}", None, 10, f"charge_{i}")
+        
+        with open(path) as f:
+            aggregates = json.load(f)
+        if "transactions" in aggregates or aggregates["log_seq"] != 100:
+            print(f"❌ donations.json is not aggregates only: {sorted(aggregates)}")
+            return False
+        segments = ledger._log.segments()
+        if len(segments) < 3 or sum(s["count"] for s in segments) != 100:
+            print(f"❌ Log did not rotate as expected: {segments}")
+            return False
+        history = [tx["charge_id"] for tx in ledger.transactions()]
+        if history != [f"charge_{i}" for i in range(100)] or ledger.stats()["total_transactions"] != 100:
+            print("❌ Full history is not kept")
+            return False
+        if [tx["seq"] for tx in ledger.transactions(since_seq=95)] != [96, 97, 98, 99, 100]:
+            print("❌ Reading from a seq returned the wrong entries")
+            return False
+        
+        # Logged but the aggregate write failed: the next load replays it
+        with mock.patch("donations.write_json_atomic", side_effect=OSError("disk full")):
+            ledger.record(3, None, "User 3", None, 500, "charge_late")
+        ledger.close()
+        reopened = donations.DonationLedger(path, segment_bytes=2048)
+        if reopened.stats()["total_stars"] != 1500 or reopened.donor_info(3)["total_stars"] != 640:
+            print(f"❌ Logged donation was not replayed: {reopened.stats()}")
+            return False
+        reopened.close()
+        
+        # A donations.json from before the log moves its transactions into it
+        legacy_path = Path(tmp) / "legacy.json"
+        with open(legacy_path, "w") as f:
+            json.dump({
+                "donors": {"5": {"id": 5, "name": "Old", "username": None, "total_stars": 80,
+                                 "total_usd": 1.6, "donation_count": 2}},
+                "total_stars": 80,
+                "total_usd": 1.6,
+                "transactions": [
+                    {"user_id": 5, "stars": 30, "usd": 0.6, "charge_id": "old_1", "timestamp": "2025-01-01T00:00:00"},
+                    {"user_id": 5, "stars": 50, "usd": 1.0, "charge_id": "old_2", "timestamp": "2025-01-02T00:00:00"},
+                ]
+            }, f)
+        legacy = donations.DonationLedger(legacy_path)
+        if legacy.stats()["total_stars"] != 80 or legacy.stats()["total_transactions"] != 2:
+            print(f"❌ Legacy transactions were counted twice or lost: {legacy.stats()}")
+            return False
+        if not legacy.record(5, None, "Old", None, 30, "old_1")["duplicate"]:
+            print("❌ Legacy charge was not recognised")
+            return False
+        legacy.close()
+    
+    print("✅ History is logged in rotating segments and replayed into aggregates")
+    return True
+
+
+def test_leaderboard_snapshot():
+    """Test leaderboard.json is republished after every donation and matches the ledger"""
+    print("\n=== TEST: Leaderboard Snapshot ===")
+    
+    import donations
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = donations.DonationLedger(Path(tmp) / "donations.json")
+        for i in range(150):
+            ledger.record(i, None, f"User {i}", None, 10 + i % 13, f"charge_{i}")
+        ledger.record(7, None, "User 7", None, 1000, "charge_big")
+        
+        with open(ledger.leaderboard_path) as f:
+            snapshot = json.load(f)
+        expected = ledger.leaderboard(donations.LEADERBOARD_SIZE)
+        if [entry["id"] for entry in snapshot["leaderboard"]] != [donor["id"] for donor in expected]:
+            print("❌ Snapshot top list differs from the ledger")
+            return False
+        if snapshot["leaderboard"][0]["id"] != 7 or len(snapshot["leaderboard"]) != donations.LEADERBOARD_SIZE:
+            print("❌ Snapshot was not updated by the last donation")
+            return False
+        if snapshot["stats"]["total_stars"] != ledger.stats()["total_stars"]:
+            print(f"❌ Snapshot totals are stale: {snapshot['stats']}")
+            return False
+        
+        ledger.close()  # Leaves ranks.json current
+        with open(ledger.ranks_path) as f:
+            ranks = json.load(f)
+        if len(ranks["ranks"]) != 150 or any(
+            entry["rank"] != ledger.rank(int(uid)) for uid, entry in ranks["ranks"].items()
+        ):
+            print("❌ Rank file differs from the ledger")
+            return False
+        if ranks["log_seq"] != snapshot["log_seq"]:
+            print(f"❌ Rank file is stale: {ranks['log_seq']} / {snapshot['log_seq']}")
+            return False
+    
+    print("✅ Snapshot holds the top 100 and totals, ranks.json every donor's rank")
+    return True
+
+
+def test_leaderboard_cache():
+    """Test the cached top-K stays equal to a fresh ordering, avoids refetches and expires"""
+    print("\n=== TEST: Leaderboard Cache ===")
+    
+    import random
+    from unittest import mock
+    import donations
+    from leaderboard_cache import LeaderboardCache
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = donations.DonationLedger(Path(tmp) / "donations.json")
+        rng = random.Random(7)
+        for i in range(300):
+            user_id = rng.randint(1, 150)
+            ledger.record(user_id, None, f"User {user_id}", None, rng.choice([10, 25, 50, 100]), f"charge_{i}")
+            for limit in (5, 100):
+                if ledger.leaderboard(limit) != ledger._leaderboard_rows(limit):
+                    print(f"❌ Cached top {limit} differs after donation {i}")
+                    return False
+        ledger.close()
+        
+        metrics = ledger.leaderboard_cache_stats()
+        if metrics["updates"] == 0 or metrics["hits"] <= metrics["misses"]:
+            print(f"❌ Cache was not reused: {metrics}")
+            return False
+    
+    # Another writer changes the backend; rows past the ttl are fetched again
+    backend = [{"id": 1, "total_stars": 100}, {"id": 2, "total_stars": 50}]
+    fetches = []
+    
+    def fetch(limit):
+        fetches.append(limit)
+        ordered = sorted(backend, key=lambda row: -row["total_stars"])
+        return [dict(row, rank=rank) for rank, row in enumerate(ordered[:limit], 1)]
+    
+    cache = LeaderboardCache(fetch, size=10, ttl=60)
+    with mock.patch("leaderboard_cache.time.monotonic", return_value=1000.0) as clock:
+        cache.get(10)
+        backend[1]["total_stars"] = 500  # Written outside this process
+        clock.return_value = 1059.0
+        stale = cache.get(10)
+        clock.return_value = 1060.0
+        fresh = cache.get(10)
+    if len(fetches) != 2 or stale[0]["id"] != 1 or fresh[0]["id"] != 2 or cache.metrics()["expirations"] != 1:
+        print(f"❌ Expired cache was not refetched: {fetches} {fresh} {cache.metrics()}")
+        return False
+    
+    print(f"✅ Cache matches the full ordering and expires after its ttl ({metrics})")
+    return True
+
+
+def test_period_leaderboards():
+    """Test weekly/monthly buckets follow donations, roll over, and rebuild from the log"""
+    print("\n=== TEST: Period Leaderboards ===")
+    
+    import random
+    from unittest import mock
+    import donations
+    
+    class Clock(datetime):
+        current = datetime(2025, 3, 10, 12, 0)  # Monday of ISO week 11
+        
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current if tz is None else cls.current.astimezone(tz)
+    
+    def ids(period):
+        return [(d["id"], d["total_stars"]) for d in ledger.period_leaderboard(period, 10)]
+    
+    with tempfile.TemporaryDirectory() as tmp, mock.patch("donations.datetime", Clock):
+        path = Path(tmp) / "donations.json"
+        ledger = donations.DonationLedger(path)
+        ledger.record(1, None, "A", None, 100, "charge_1")
+        ledger.record(2, None, "B", None, 50, "charge_2")
+        Clock.current = datetime(2025, 3, 12, 9, 0)
+        ledger.record(2, None, "B", None, 100, "charge_3")
+        if ids("week") != [(2, 150), (1, 100)]:
+            print(f"❌ Week leaderboard is wrong: {ids('week')}")
+            return False
+        
+        Clock.current = datetime(2025, 3, 17, 9, 0)  # Next ISO week, same month
+        ledger.record(3, None, "C", None, 10, "charge_4")
+        if ids("week") != [(3, 10)] or ids("month") != [(2, 150), (1, 100), (3, 10)]:
+            print(f"❌ Buckets did not roll over: {ids('week')} / {ids('month')}")
+            return False
+        with open(ledger.leaderboard_path) as f:
+            snapshot = json.load(f)
+        if snapshot["periods"]["week"]["bucket"] != "2025-W12" or len(snapshot["periods"]["month"]["leaderboard"]) != 3:
+            print(f"❌ Snapshot periods are wrong: {snapshot['periods'].keys()}")
+            return False
+        
+        # A file from before period buckets rebuilds them from the log
+        ledger.close()
+        with open(path) as f:
+            data = json.load(f)
+        del data["periods"]
+        with open(path, "w") as f:
+            json.dump(data, f)
+        ledger = donations.DonationLedger(path)
+        if ids("week") != [(3, 10)] or ids("month") != [(2, 150), (1, 100), (3, 10)]:
+            print(f"❌ Rebuilt buckets differ: {ids('week')} / {ids('month')}")
+            return False
+        
+        Clock.current = datetime(2025, 4, 1, 9, 0)  # No donations yet this month
+        if ids("week") or ids("month"):
+            print("❌ Last period's bucket is served as current")
+            return False
+        ledger.save()
+        with open(ledger.leaderboard_path) as f:
+            if json.load(f)["periods"]:
+                print("❌ Last period's bucket is published as current")
+                return False
+        
+        # The per-bucket rank index agrees with a stable sort of the bucket, also after a reload
+        rng = random.Random(3)
+        for i in range(200):
+            user_id = rng.randint(10, 60)
+            ledger.record(user_id, None, f"U{user_id}", None, rng.choice([5, 10, 20]), f"charge_r{i}")
+        for reloaded in (False, True):
+            if reloaded:
+                ledger.close()
+                ledger = donations.DonationLedger(path)
+            for period in ("week", "month"):
+                bucket = ledger.data()["periods"][period]["donors"]
+                expected = sorted(bucket, key=lambda uid: -bucket[uid]["total_stars"])
+                if [str(d["id"]) for d in ledger.period_leaderboard(period, len(bucket))] != expected:
+                    print(f"❌ {period} index differs from a full sort (reloaded: {reloaded})")
+                    return False
+        ledger.close()
+    
+    print("✅ Week and month leaderboards are kept per bucket")
+    return True
+
+
+def test_leaderboard_publish_cost():
+    """Test a donation's leaderboard publish stays the same size with 100x the donors"""
+    print("\n=== TEST: Leaderboard Publish Cost ===")
+    
+    import threading
+    from unittest import mock
+    import donations
+    
+    def publish_cost(donor_count):
+        with tempfile.TemporaryDirectory() as tmp:
+            ledger = donations.DonationLedger(Path(tmp) / "donations.json", ranks_interval=60)
+            data = ledger.data()
+            for i in range(donor_count):
+                data["donors"][str(i)] = {
+                    "id": i, "name": f"User {i}", "username": None, "total_stars": 10 + i % 97,
+                    "total_usd": (10 + i % 97) / 50, "donation_count": 1, "photo_url": None,
+                }
+            ledger.save(data)
+            ledger.record(1, None, "User 1", None, 50, "charge_a")  # Starts the rank writer
+            
+            # Only work done by record() itself counts; the rank writer runs on its own thread
+            caller = threading.current_thread()
+            written = []
+            top_limits = []
+            real_top = donations.DonorRanks.top
+            
+            def record_write(path, payload):
+                if threading.current_thread() is caller:
+                    written.append((path.name, len(json.dumps(payload))))
+            
+            def record_top(ranks, limit):
+                if threading.current_thread() is caller:
+                    top_limits.append(limit)
+                return real_top(ranks, limit)
+            
+            with mock.patch("donations.write_json_atomic", record_write), \
+                    mock.patch.object(donations.DonorRanks, "top", record_top):
+                ledger.record(2, None, "User 2", None, 50, "charge_b")
+            ledger.close()
+            return written, top_limits
+    
+    small, small_limits = publish_cost(200)
+    large, large_limits = publish_cost(20000)
+    if "ranks.json" in {name for name, _ in small + large}:
+        print("❌ ranks.json was rewritten inside record()")
+        return False
+    if [name for name, _ in large] != ["donations.json", "leaderboard.json"]:
+        print(f"❌ Unexpected writes: {large}")
+        return False
+    small_bytes = dict(small)["leaderboard.json"]
+    large_bytes = dict(large)["leaderboard.json"]
+    if large_bytes > small_bytes * 1.1 or max(large_limits) > donations.LEADERBOARD_SIZE:
+        print(f"❌ Publish grew with donors: {small_bytes} -> {large_bytes} bytes, top({max(large_limits)})")
+        return False
+    
+    print(f"✅ leaderboard.json is {small_bytes} / {large_bytes} bytes for 200 / 20000 donors")
+    return True
+
+
+def test_activation_store_open():
+    """Test threads that need the activation store at the same time share one instance"""
+    print("\n=== TEST: Activation Store Open ===")
+    
+    import threading
+    import time
+    from unittest import mock
+    import activation_tracker
+    from activation_store import JournalActivationStore
+    
+    opened = []
+    
+    class SlowJournalStore(JournalActivationStore):
+        def __init__(self, *args, **kwargs):
+            time.sleep(0.05)  # Widen the window between the None check and the assignment
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = Path(tmp) / "activations.json"
+        legacy.write_text(json.dumps({
+            "abc123": {"key_id": "abc123", "user_id": 7, "activations": [], "max_activations": 2}
+        }))
+        with mock.patch.multiple(
+            activation_tracker,
+            _store=None,
+            ACTIVATION_BACKEND="journal",
+            ACTIVATIONS_JOURNAL=Path(tmp) / "activations",
+            ACTIVATIONS_FILE=legacy,
+            JournalActivationStore=SlowJournalStore,
+        ):
+            barrier = threading.Barrier(8)
+            stores, errors = [], []
+            
+            def open_store():
+                barrier.wait()
+                try:
+                    stores.append(activation_tracker._get_store())
+                except Exception as e:
+                    errors.append(e)
+            
+            threads = [threading.Thread(target=open_store) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for store in opened:
+                store.close()
+        
+        if errors or len(opened) != 1 or any(store is not opened[0] for store in stores):
+            print(f"❌ {len(opened)} stores opened, errors: {errors}")
+            return False
+        if not legacy.with_suffix(".json.imported").exists():
+            print("❌ Legacy activations were not imported")
+            return False
+    
+    print("✅ 8 concurrent callers got the same store, imported once")
+    return True
+
+
 def test_config_consistency():
     """Test configuration values"""
     print("\n=== TEST: Configuration ===")
@@ -239,13 +1432,8 @@ def cleanup_test_data():
     """Remove test data"""
     print("\n=== CLEANUP ===")
     
-    if ACTIVATIONS_FILE.exists():
-        activations = _load_activations()
-        if "test_key_12345" in activations:
-            del activations["test_key_12345"]
-            with open(ACTIVATIONS_FILE, "w") as f:
-                json.dump(activations, f, indent=2)
-            print("✅ Removed test activation data")
+    if delete_key("test_key_12345"):
+        print("✅ Removed test activation data")
     
     print("✅ Cleanup complete")
 
@@ -261,6 +1449,29 @@ def main():
     all_passed &= test_beta_users_database()
     all_passed &= test_key_payload()
     all_passed &= test_activation_tracking()
+    all_passed &= test_user_state_cache()
+    all_passed &= test_concurrent_key_issuance()
+    all_passed &= test_broadcast_delivery()
+    all_passed &= test_http_keep_alive()
+    all_passed &= test_update_offset_persistence()
+    all_passed &= test_activation_json_import()
+    all_passed &= test_concurrent_activations()
+    all_passed &= test_activation_journal()
+    all_passed &= test_incremental_activation_stats()
+    all_passed &= test_activation_api()
+    all_passed &= test_heartbeat_coalescing()
+    all_passed &= test_stale_activation_release()
+    all_passed &= test_machine_keys_index()
+    all_passed &= test_activation_records()
+    all_passed &= test_donor_rank_index()
+    all_passed &= test_donation_ledger()
+    all_passed &= test_donation_idempotency()
+    all_passed &= test_transaction_log()
+    all_passed &= test_leaderboard_snapshot()
+    all_passed &= test_leaderboard_cache()
+    all_passed &= test_period_leaderboards()
+    all_passed &= test_activation_store_open()
+    all_passed &= test_leaderboard_publish_cost()
     all_passed &= test_config_consistency()
     
     cleanup_test_data()
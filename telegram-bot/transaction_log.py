@@ -0,0 +1,201 @@
+"""
+Append-only donation transaction log
+Every transaction is one JSON line appended (and fsynced) to the active
+segment `transactions.jsonl`, numbered by a `seq` that starts at 1. Once the
+segment passes `segment_bytes` it is sealed as `transactions.<n>.jsonl` and
+listed in `transactions.index.json` with its seq and timestamp range, so
+readers can skip whole segments. Nothing is ever trimmed.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from storage import write_json_atomic
+
+
+def _summarize(path: Path) -> Optional[dict]:
+    """Index entry for a sealed segment, read from the segment itself"""
+    first = last = None
+    count = 0
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            first = first or entry
+            last = entry
+            count += 1
+    if first is None:
+        return None
+    return {
+        "file": path.name,
+        "first_seq": first["seq"],
+        "last_seq": last["seq"],
+        "first_ts": first["timestamp"],
+        "last_ts": last["timestamp"],
+        "count": count,
+    }
+
+
+class TransactionLog:
+    """Rotating JSON-lines log; appends are serialized, reads never block them"""
+
+    def __init__(self, directory: Path, segment_bytes: int = 1024 * 1024):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.active_path = directory / "transactions.jsonl"
+        self.index_path = directory / "transactions.index.json"
+
+        self._lock = threading.Lock()
+        self._segments: List[dict] = []
+        self._active: Optional[dict] = None  # Index entry of the active segment, once it has lines
+        self._last_seq = 0
+
+        self._load()
+        self._file = open(self.active_path, "a")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    @property
+    def last_seq(self) -> int:
+        """Seq of the newest transaction (= number of transactions ever logged)"""
+        return self._last_seq
+
+    # --- startup ---
+
+    def _load(self):
+        if self.index_path.exists():
+            with open(self.index_path, "r") as f:
+                self._segments = json.load(f)["segments"]
+
+        # A crash between sealing a segment and writing the index leaves it unlisted
+        listed = {segment["file"] for segment in self._segments}
+        sealed = sorted(
+            self.directory.glob("transactions.*.jsonl"),
+            key=lambda path: int(path.name.split(".")[1])
+        )
+        missing = [path for path in sealed if path.name not in listed]
+        for path in missing:
+            summary = _summarize(path)
+            if summary:
+                self._segments.append(summary)
+        if missing:
+            self._write_index()
+
+        if self._segments:
+            self._last_seq = self._segments[-1]["last_seq"]
+
+        if self.active_path.exists():
+            good_bytes = 0
+            with open(self.active_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Torn last line from a crash mid-append
+                    good_bytes += len(line)
+                    self._note_active(entry)
+            if good_bytes < self.active_path.stat().st_size:
+                os.truncate(self.active_path, good_bytes)
+
+    def _note_active(self, entry: dict):
+        if self._active is None:
+            self._active = {
+                "file": self.active_path.name,
+                "first_seq": entry["seq"],
+                "first_ts": entry["timestamp"],
+                "count": 0,
+            }
+        self._active["last_seq"] = entry["seq"]
+        self._active["last_ts"] = entry["timestamp"]
+        self._active["count"] += 1
+        self._last_seq = entry["seq"]
+
+    def _write_index(self):
+        write_json_atomic(self.index_path, {"segments": self._segments})
+
+    # --- writes ---
+
+    def append(self, entry: dict) -> int:
+        """Durably log one transaction (needs a "timestamp"). Returns its seq."""
+        with self._lock:
+            entry = {"seq": self._last_seq + 1, **entry}
+            start = self._file.tell()
+            try:
+                self._file.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except BaseException:
+                # Leave no half-committed line behind for the next load to pick up
+                try:
+                    self._file.close()
+                except OSError:
+                    pass  # The buffered line is exactly what is being dropped
+                os.truncate(self.active_path, start)
+                self._file = open(self.active_path, "a")
+                raise
+            self._note_active(entry)
+
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate()
+            return entry["seq"]
+
+    def _rotate(self):
+        self._file.close()
+        sealed = self.directory / f"transactions.{len(self._segments) + 1}.jsonl"
+        os.replace(self.active_path, sealed)
+        self._segments.append({**self._active, "file": sealed.name})
+        self._active = None
+        self._write_index()
+        self._file = open(self.active_path, "a")
+
+    # --- reads ---
+
+    def segments(self) -> List[dict]:
+        """Index entries of all segments, oldest first (the active one last)"""
+        with self._lock:
+            return self._segments + ([dict(self._active)] if self._active else [])
+
+    def seq_before(self, timestamp: str) -> int:
+        """A since_seq for read() that skips every segment ending before `timestamp`"""
+        with self._lock:
+            for segment in self._segments + ([self._active] if self._active else []):
+                if segment["last_ts"] >= timestamp:
+                    return segment["first_seq"] - 1
+            return self._last_seq
+
+    def read(self, since_seq: int = 0) -> Iterator[dict]:
+        """Yield transactions with seq > since_seq, oldest first"""
+        with self._lock:
+            sealed = [s["file"] for s in self._segments if s["last_seq"] > since_seq]
+            # Sealed segments never change; the active one is read up to its
+            # current end through a handle that survives a rotation
+            active = open(self.active_path, "rb")
+            active_end = self._file.tell()
+
+        with active:
+            for name in sealed:
+                with open(self.directory / name, "rb") as f:
+                    yield from self._entries(f, since_seq)
+            yield from self._entries(active, since_seq, active_end)
+
+    @staticmethod
+    def _entries(f, since_seq: int, end: Optional[int] = None) -> Iterator[dict]:
+        read = 0
+        for line in f:
+            read += len(line)
+            if end is not None and read > end:
+                break
+            entry = json.loads(line)
+            if entry["seq"] > since_seq:
+                yield entry
+
+    def charges(self) -> Dict[str, int]:
+        """charge_id -> user_id for every logged transaction"""
+        return {entry["charge_id"]: entry["user_id"] for entry in self.read() if entry.get("charge_id")}
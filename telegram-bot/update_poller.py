@@ -0,0 +1,103 @@
+"""
+Long polling that survives restarts
+Telegram forgets an update once getUpdates is called with a higher offset.
+PTB's Updater confirms updates as soon as they are fetched, so anything that
+was queued but not yet handled is lost when the process dies. Here the offset
+is only advanced — and saved to disk — after a batch has been fully processed,
+so a restarted bot picks up exactly where the previous one stopped.
+"""
+import asyncio
+import json
+from datetime import timedelta
+from typing import Optional
+
+from telegram import Update
+from telegram.error import Conflict, NetworkError, RetryAfter
+from telegram.ext import Application
+
+from config import DATA_DIR
+from storage import write_json_atomic
+
+OFFSET_FILE = DATA_DIR / "update_offset.json"
+POLL_TIMEOUT = 30  # Seconds Telegram holds a getUpdates call open
+MAX_ERROR_BACKOFF = 60  # Longest pause after repeated unexpected errors, in seconds
+
+
+def load_offset() -> Optional[int]:
+    """Next update_id to fetch, or None if nothing was processed yet"""
+    try:
+        with open(OFFSET_FILE, "r") as f:
+            return json.load(f).get("offset")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_offset(offset: int):
+    write_json_atomic(OFFSET_FILE, {"offset": offset})
+
+
+async def poll_updates(app: Application, stop: asyncio.Event):
+    """Fetch, process, then confirm updates until `stop` is set"""
+    offset = load_offset()
+    stopping = asyncio.create_task(stop.wait())
+    backoff = 1  # Doubles with each unexpected error in a row
+
+    try:
+        while not stop.is_set():
+            fetch = asyncio.create_task(app.bot.get_updates(
+                offset=offset,
+                timeout=POLL_TIMEOUT,
+                read_timeout=POLL_TIMEOUT + 10,
+                allowed_updates=Update.ALL_TYPES
+            ))
+            await asyncio.wait({fetch, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if stop.is_set():
+                # Nothing from an abandoned fetch is confirmed, so it is redelivered later
+                fetch.cancel()
+                break
+
+            try:
+                updates = fetch.result()
+            except RetryAfter as e:
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                await asyncio.sleep(delay)
+                continue
+            except Conflict:
+                # The previous instance is still polling during a deploy; let it finish
+                await asyncio.sleep(1)
+                continue
+            except NetworkError as e:
+                print(f"⚠️ getUpdates failed: {e}")
+                await asyncio.sleep(3)
+                continue
+            except Exception as e:
+                # Anything else (bad token, unexpected API error) must not end polling
+                print(f"❌ getUpdates failed: {e!r}, retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_ERROR_BACKOFF)
+                continue
+            backoff = 1
+
+            if not updates:
+                continue
+
+            # A batch is never interrupted by shutdown: the offset is saved only
+            # once every update in it has been handled. An update whose handling
+            # raised is logged and still confirmed, or it would be redelivered forever.
+            results = await asyncio.gather(
+                *(app.process_update(update) for update in updates),
+                return_exceptions=True
+            )
+            for update, result in zip(updates, results):
+                if isinstance(result, Exception):
+                    print(f"❌ Update {update.update_id} failed: {result!r}")
+            offset = updates[-1].update_id + 1
+            try:
+                save_offset(offset)
+            except OSError as e:
+                # The offset is still advanced in memory; the next batch saves it again
+                print(f"⚠️ Could not save update offset {offset}: {e}")
+    finally:
+        stopping.cancel()
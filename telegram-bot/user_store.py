@@ -0,0 +1,111 @@
+"""
+User state for Relay Beta Bot
+Loads beta_users.json once per process and serves it from memory.
+Every change is written through to disk immediately.
+"""
+import json
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from config import DATA_DIR, DATA_FILE
+from storage import write_json_atomic
+
+_data: Optional[dict] = None
+_lock = threading.RLock()
+
+
+def _empty_data() -> dict:
+    return {"users": {}, "keys_issued": 0, "user_langs": {}}
+
+
+def _read_file() -> dict:
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    if DATA_FILE.exists():
+        with open(DATA_FILE, "r") as f:
+            data = json.load(f)
+    else:
+        data = _empty_data()
+    for field, default in _empty_data().items():
+        data.setdefault(field, default)
+    return data
+
+
+def load_data() -> dict:
+    """
+    Get the in-memory user state (read from disk on first call).
+    The returned dict is the live state — call save_data() after changing it.
+    """
+    global _data
+    if _data is None:
+        with _lock:
+            if _data is None:
+                _data = _read_file()
+    return _data
+
+
+def save_data(data: Optional[dict] = None):
+    """Write the user state through to beta_users.json"""
+    global _data
+    with _lock:
+        if data is not None:
+            _data = data
+        write_json_atomic(DATA_FILE, load_data())
+
+
+class Transaction:
+    """The state handed to a transaction() block; set `changed` if the block modifies it"""
+    __slots__ = ("data", "changed")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.changed = False
+
+
+@contextmanager
+def transaction() -> Iterator[Transaction]:
+    """
+    Hold the state lock while reading and changing the state, then write it
+    through once if the block marked it changed. If the block raises, nothing
+    is written and the state is read back from disk, dropping any partial change.
+    """
+    with _lock:
+        tx = Transaction(load_data())
+        try:
+            yield tx
+        except BaseException:
+            reload_data()
+            raise
+        if tx.changed:
+            save_data()
+
+
+def reload_data() -> dict:
+    """Drop the cached state and read beta_users.json again"""
+    global _data
+    with _lock:
+        _data = _read_file()
+    return _data
+
+
+def get_user_lang(user_id: int) -> Optional[str]:
+    return load_data()["user_langs"].get(str(user_id))
+
+
+def set_user_lang(user_id: int, lang: str):
+    """Set user's language, touching the disk only if it actually changed"""
+    with _lock:
+        langs = load_data()["user_langs"]
+        if langs.get(str(user_id)) == lang:
+            return
+        langs[str(user_id)] = lang
+        save_data()
+
+
+def get_user(user_id: int) -> Optional[dict]:
+    """Get the issued key record for a user"""
+    return load_data()["users"].get(str(user_id))
+
+
+def get_keys_issued() -> int:
+    return load_data()["keys_issued"]